@@ -0,0 +1,355 @@
+import os
+import logging
+import threading
+from controllers import mongo_controller
+from controllers import nlp_controller
+from controllers import rule_controller
+from controllers import brain_controller
+
+logger = logging.getLogger("Admin Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+GENERATED_RULES_FILE = "live_conversations.rive"  # rule file of the menus generated for suggestions
+admin_lock = threading.Lock()  # changes of the knowledge base are applied one at a time
+
+
+def __get_rules_path(brain, subtopic):
+    """
+    :param brain: brain of the language
+    :param subtopic: subtopic object
+    :return: path of the rule file of subtopic (as written by scripts/mongodb_populate.py)
+    """
+    return os.path.join(brain.rules_directory, "%s.rive" % subtopic["name"].lower().replace(" ", "_"))
+
+
+def __generate_patterns(texts):
+    """
+    annotate texts (question, paraphrases) and generate their triggers, as the import does
+    :param texts: list of texts
+    :return: list of triggers
+    """
+    patterns = []
+    for text in texts:
+        pattern = rule_controller.generate_rule_pattern(nlp_controller.annotate_expression(text))
+        if len(pattern.strip()) > 0 and pattern not in patterns:
+            patterns.append(pattern)
+    return patterns
+
+
+def __extract_keywords(texts):
+    return set(keyword.lower() for text in texts for keyword in nlp_controller.extract_keywords(text))
+
+
+def __find_subtopic(knowledge_base, subtopic_id=None, qa_id=None):
+    """
+    find a subtopic of the knowledge base by its id or by the id of one of its questions/answers
+    :param knowledge_base: knowledge base of the language
+    :param subtopic_id: id of subtopic
+    :param qa_id: id of question/answer
+    :return: (subtopic, topic), (None, None) if the subtopic is not in the knowledge base
+    """
+    for topic in knowledge_base.get_topics():
+        for topic_subtopic_id in topic["subtopics"]:
+            if subtopic_id is not None and str(topic_subtopic_id) != str(subtopic_id):
+                continue
+            subtopic = mongo_controller.get_subtopic(topic_subtopic_id)
+            if subtopic is None:
+                continue
+            if qa_id is None or qa_id in [str(subtopic_qa_id) for subtopic_qa_id in subtopic["questions_answers"]]:
+                return subtopic, topic
+    return None, None
+
+
+def __save_subtopic(subtopic, topic, questions_answers):
+    """
+    save the questions/answers of a subtopic and recompute the keywords of the subtopic and its topic
+    :param subtopic: subtopic object
+    :param topic: topic object of the subtopic
+    :param questions_answers: ids of questions/answers of the subtopic
+    :return: (subtopic, topic) as saved
+    """
+    subtopic_keywords = set()
+    for qa_id in questions_answers:
+        question_answer = mongo_controller.get_question_answer(qa_id)
+        if question_answer is not None:
+            subtopic_keywords.update(question_answer["keywords"])
+    mongo_controller.update_subtopic(subtopic["_id"], questions_answers=questions_answers,
+                                     keywords=sorted(subtopic_keywords))
+
+    topic_keywords = set()
+    for subtopic_id in topic["subtopics"]:
+        topic_subtopic = mongo_controller.get_subtopic(subtopic_id)
+        if topic_subtopic is not None:
+            topic_keywords.update(topic_subtopic["keywords"])
+    mongo_controller.update_topic(topic["_id"], keywords=sorted(topic_keywords))
+    return mongo_controller.get_subtopic(subtopic["_id"]), mongo_controller.get_topic(topic["_id"])
+
+
+def __write_rules(path, lines):
+    temporary_path = "{}.tmp".format(path)
+    with open(temporary_path, "w", encoding="utf-8") as rule_file:
+        rule_file.writelines(lines)
+    os.replace(temporary_path, path)  # RiveScript never reads a half-written file
+
+
+def __remove_rules(brain, qa_id, patterns=None):
+    """
+    remove the question/answer rules (top level triggers replying the id) of a question/answer from the rule files
+    :param brain: brain of the language
+    :param qa_id: id of question/answer
+    :param patterns: removed triggers, None to remove all triggers of the question/answer
+    :return: list of triggers of the question/answer which are kept
+    """
+    kept_patterns = []
+    for root, dirs, files in os.walk(brain.rules_directory):
+        for file_name in files:
+            if not file_name.endswith(".rive"):
+                continue
+            path = os.path.join(root, file_name)
+            with open(path, "r", encoding="utf-8") as rule_file:
+                lines = rule_file.readlines()
+            kept_lines = []
+            topic_depth = 0
+            index = 0
+            while index < len(lines):
+                line = lines[index].strip()
+                if line.startswith("> "):
+                    topic_depth += 1
+                elif line.startswith("< "):
+                    topic_depth -= 1
+                elif topic_depth == 0 and line.startswith("+ ") and index + 1 < len(lines) and \
+                        lines[index + 1].strip() == "- %s" % qa_id:
+                    pattern = line[2:].strip()
+                    if patterns is None or pattern in patterns:
+                        index += 2
+                        if index < len(lines) and len(lines[index].strip()) == 0:
+                            index += 1
+                        continue
+                    kept_patterns.append(pattern)
+                kept_lines.append(lines[index])
+                index += 1
+            if len(kept_lines) != len(lines):
+                __write_rules(path, kept_lines)
+    return kept_patterns
+
+
+def __split_rule_units(lines):
+    """
+    split RiveScript code into units: topics, top level rules (trigger and its reply lines) and other lines
+    :param lines: lines of RiveScript code
+    :return: list of (kind, topic name, lines)
+    """
+    units = []
+    index = 0
+    while index < len(lines):
+        line = lines[index].strip()
+        if line.startswith("> topic "):
+            end = index
+            while end < len(lines) - 1 and lines[end].strip() != "< topic":
+                end += 1
+            units.append(("topic", line.split()[2], lines[index:end + 1]))
+            index = end + 1
+        elif line.startswith("+ "):
+            end = index + 1
+            while end < len(lines) and len(lines[end].strip()) > 0 and not lines[end].strip().startswith(("+ ", "> ")):
+                end += 1
+            units.append(("rule", None, lines[index:end]))
+            index = end
+        else:
+            units.append(("other", None, [lines[index]]))
+            index += 1
+    return units
+
+
+def __remove_generated_menus(brain, question_texts):
+    """
+    remove the generated menus which suggest given questions (their text changed or they were deleted), with the
+    menus and rules leading to them, they are generated again for the next similar question
+    :param brain: brain of the language
+    :param question_texts: texts of questions
+    :return: set of removed topics
+    """
+    path = os.path.join(brain.rules_directory, GENERATED_RULES_FILE)
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as rule_file:
+        units = __split_rule_units(rule_file.readlines())
+
+    options = set("- ^Recursive=%s" % text for text in question_texts)
+    removed_topics = set(name for kind, name, lines in units
+                         if kind == "topic" and any(line.strip() in options for line in lines))
+    if len(removed_topics) == 0:
+        return removed_topics
+
+    def refers_to_removed_topic(lines):
+        return any("{topic=%s}" % topic in line for line in lines for topic in removed_topics)
+
+    is_changed = True
+    while is_changed:  # menus of a removed menu (and their parents) can not be reached anymore
+        is_changed = False
+        for kind, name, lines in units:
+            if kind == "topic" and name not in removed_topics and refers_to_removed_topic(lines):
+                removed_topics.add(name)
+                is_changed = True
+
+    kept_lines = []
+    is_removed = False
+    for kind, name, lines in units:
+        if kind == "other" and is_removed and len(lines[0].strip()) == 0:  # blank line after a removed unit
+            continue
+        is_removed = (kind == "topic" and name in removed_topics) or (kind == "rule" and refers_to_removed_topic(lines))
+        if not is_removed:
+            kept_lines.extend(lines)
+    __write_rules(path, kept_lines)
+    return removed_topics
+
+
+def __apply(brain, qa_id, patterns, question_answer=None, subtopic=None, topic=None, removed_questions=None):
+    """
+    apply a change of a question/answer to the running brain: compiled triggers, generated menus, RiveScript rules
+    (only the changed triggers and topics, the rule files are not loaded again) and knowledge base indexes,
+    suggestions of the semantic index are checked against the knowledge base
+    :param brain: brain of the language
+    :param qa_id: id of question/answer
+    :param patterns: triggers of the question/answer (kept and new ones)
+    :param question_answer: question/answer object, None if it is deleted
+    :param subtopic: subtopic object of the question/answer
+    :param topic: topic object of the subtopic
+    :param removed_questions: texts of questions which are not suggested anymore
+    """
+    with brain.lock:
+        brain.trigger_index.remove_question_answer(qa_id)
+        for pattern in patterns:
+            brain.trigger_index.add_trigger(pattern, qa_id)
+        brain.set_question_answer_rules(qa_id, patterns)
+        if removed_questions:
+            brain.remove_topics(__remove_generated_menus(brain, removed_questions))
+        if question_answer is None:
+            brain.knowledge_base.remove_question_answer(qa_id, subtopic, topic)
+        else:
+            brain.knowledge_base.set_question_answer(question_answer, subtopic, topic)
+        brain.sort_rules()  # sorted here, not by the next message
+        brain.invalidate_answers()
+
+
+def add_question_answer(language, subtopic_id, question, answer, more_details=None, paraphrases=None):
+    """
+    add a question/answer (and its paraphrases) to a subtopic of the running chatbot
+    :param language: language code of the knowledge base (e.g. "en")
+    :param subtopic_id: id of subtopic
+    :param question: question
+    :param answer: answer for the question
+    :param more_details: more details including links, videos, etc
+    :param paraphrases: paraphrases of the question
+    :return: id of question/answer
+    :raises ValueError: if the subtopic is not in the knowledge base of the language
+    """
+    more_details = more_details or []
+    paraphrases = paraphrases or []
+    texts = [question] + paraphrases
+    patterns = __generate_patterns(texts)  # NLP requests are sent before the brain is locked
+    keywords = sorted(__extract_keywords(texts))
+    with admin_lock, brain_controller.use_brain(language) as brain, brain.refresh_lock:
+        subtopic, topic = __find_subtopic(brain.knowledge_base, subtopic_id=subtopic_id)
+        if subtopic is None:
+            raise ValueError("Subtopic {} is not in the knowledge base of language {}".format(subtopic_id, language))
+        qa_id = mongo_controller.add_question_answer(question, answer, more_details, keywords, paraphrases)
+        subtopic, topic = __save_subtopic(subtopic, topic,
+                                          [str(subtopic_qa_id) for subtopic_qa_id in subtopic["questions_answers"]]
+                                          + [qa_id])
+        with brain.lock:
+            with open(__get_rules_path(brain, subtopic), "a", encoding="utf-8") as rule_file:
+                for pattern in patterns:
+                    rule_file.write("+ %s\n- %s\n\n" % (pattern, qa_id))
+        __apply(brain, qa_id, patterns, mongo_controller.get_question_answer(qa_id), subtopic, topic)
+    logger.info("Question/answer {} is added to subtopic {} ({} triggers)".format(qa_id, subtopic_id, len(patterns)))
+    return qa_id
+
+
+def update_question_answer(language, qa_id, question=None, answer=None, more_details=None, paraphrases=None):
+    """
+    update a question/answer of the running chatbot, only the given fields are changed, the triggers of the question
+    (and of the paraphrases if they are given) are generated again
+    :param language: language code of the knowledge base (e.g. "en")
+    :param qa_id: id of question/answer
+    :param question: question
+    :param answer: answer for the question
+    :param more_details: more details including links, videos, etc
+    :param paraphrases: paraphrases of the question
+    :return: True if the question/answer is updated, False if it is not in the knowledge base of the language
+    """
+    old_question_answer = mongo_controller.get_question_answer(qa_id)
+    if old_question_answer is None:
+        return False
+    old_question = old_question_answer["question"]
+    old_paraphrases = old_question_answer.get("paraphrases")
+    is_question_changed = question is not None and question != old_question
+    new_patterns = []
+    removed_patterns = None  # all triggers of the question/answer
+    keywords = None
+    if paraphrases is not None:  # every trigger is generated again
+        texts = [question if question is not None else old_question] + paraphrases
+        new_patterns = __generate_patterns(texts)
+        keywords = sorted(__extract_keywords(texts))
+    elif is_question_changed:  # paraphrases are kept
+        removed_patterns = __generate_patterns([old_question])
+        new_patterns = __generate_patterns([question])
+        if old_paraphrases is not None:
+            keywords = sorted(__extract_keywords([question] + old_paraphrases))
+        else:  # paraphrases were only written in the rules, their keywords are kept
+            keywords = sorted(set(old_question_answer["keywords"]) | __extract_keywords([question]))
+
+    with admin_lock, brain_controller.use_brain(language) as brain, brain.refresh_lock:
+        subtopic, topic = __find_subtopic(brain.knowledge_base, qa_id=qa_id)
+        if subtopic is None:
+            return False
+        mongo_controller.update_question_answer(qa_id, question=question, answer=answer, more_details=more_details,
+                                                keywords=keywords, paraphrases=paraphrases)
+        if keywords is not None:
+            subtopic, topic = __save_subtopic(subtopic, topic, [str(subtopic_qa_id)
+                                                                for subtopic_qa_id in subtopic["questions_answers"]])
+        with brain.lock:
+            if paraphrases is not None or is_question_changed:
+                kept_patterns = __remove_rules(brain, qa_id, removed_patterns)
+                with open(__get_rules_path(brain, subtopic), "a", encoding="utf-8") as rule_file:
+                    for pattern in new_patterns:
+                        if pattern not in kept_patterns:
+                            rule_file.write("+ %s\n- %s\n\n" % (pattern, qa_id))
+                patterns = kept_patterns + [pattern for pattern in new_patterns if pattern not in kept_patterns]
+            else:
+                patterns = __remove_rules(brain, qa_id, set())  # nothing is removed, triggers are compiled again
+        __apply(brain, qa_id, patterns, mongo_controller.get_question_answer(qa_id), subtopic, topic,
+                [old_question] if is_question_changed else None)
+    logger.info("Question/answer {} is updated ({} triggers)".format(qa_id, len(patterns)))
+    return True
+
+
+def delete_question_answer(language, qa_id):
+    """
+    delete a question/answer (and its rules) of the running chatbot
+    :param language: language code of the knowledge base (e.g. "en")
+    :param qa_id: id of question/answer
+    :return: True if the question/answer is deleted, False if it is not in the knowledge base of the language
+    """
+    question_answer = mongo_controller.get_question_answer(qa_id)
+    if question_answer is None:
+        return False
+    with admin_lock, brain_controller.use_brain(language) as brain, brain.refresh_lock:
+        subtopic, topic = __find_subtopic(brain.knowledge_base, qa_id=qa_id)
+        if subtopic is None:
+            return False
+        questions_answers = [str(subtopic_qa_id) for subtopic_qa_id in subtopic["questions_answers"]
+                             if str(subtopic_qa_id) != qa_id]
+        mongo_controller.delete_question_answer(qa_id)
+        subtopic, topic = __save_subtopic(subtopic, topic, questions_answers)
+        with brain.lock:
+            __remove_rules(brain, qa_id)
+        __apply(brain, qa_id, [], None, subtopic, topic, [question_answer["question"]])
+    logger.info("Question/answer {} is deleted".format(qa_id))
+    return True
@@ -0,0 +1,232 @@
+import os
+import hmac
+import json
+import time
+import queue
+import hashlib
+import secrets
+import atexit
+import logging
+import threading
+import importlib.util
+from controllers import settings_controller
+
+logger = logging.getLogger("Analytics Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+settings = settings_controller.settings
+
+try:
+    settings.require("ANALYTICS")
+    directory = settings.get("ANALYTICS", "directory")
+    if directory is None:
+        logger.warning("Analytics directory is not defined, analytics are disabled.")
+    queue_size = settings.get("ANALYTICS", "queue_size")
+    batch_size = settings.get("ANALYTICS", "batch_size")
+    flush_interval = settings.get("ANALYTICS", "flush_interval")
+    file_format = settings.get("ANALYTICS", "format").lower()
+    if file_format not in {"parquet", "jsonl"}:
+        raise Exception("Analytics format must be parquet or jsonl.")
+    user_key = settings.get("ANALYTICS", "user_key")
+    if user_key is None:
+        if directory is not None:
+            logger.warning("Analytics user key is not defined, users cannot be followed across restarts.")
+        user_key = secrets.token_hex(32)
+    max_query_length = settings.get("ANALYTICS", "max_query_length")
+
+except Exception as e:
+    logger.error(str(e))
+    exit()
+
+# field -> type of the turn events, the same columns are written in every file
+TURN_FIELDS = (
+    ("timestamp", float),
+    ("user", str),  # keyed hash of user's phone number (see hash_user)
+    ("language", str),
+    ("query", str),  # user's message (see get_recorded_query), None if messages are not recorded
+    ("question_answer_id", str),  # id of answered question/answer, None if the message was not answered from the knowledge base
+    ("suggestion", bool),
+    ("confusion", bool),
+    ("no_answer", bool),
+    ("cached_no_answer", bool),  # the message was known to be unanswerable
+    ("handover", str),  # handover event (e.g. "request", "continue", "closed", "accepted", "answer"), None if there was none
+    ("degraded", bool),  # the message was answered by rules only, the NLP server was unavailable
+    ("error", bool),
+    ("latency_ms", float),
+)
+
+events = queue.Queue(maxsize=queue_size)  # turn events waiting to be written, new events are dropped when it is full
+writer_thread = None
+writer_lock = threading.Lock()  # guards the start of the writer thread
+write_lock = threading.Lock()  # batches are written one at a time (writer thread or flush at exit)
+statistics_lock = threading.Lock()
+analytics_statistics = {"recorded": 0, "dropped": 0, "written": 0, "batches": 0, "errors": 0}
+batch_sequence = 0
+is_pyarrow_available = None
+
+
+def hash_user(user_id):
+    """
+    pseudonymize a user, phone numbers are few enough to be found back from an unkeyed hash
+    :param user_id: id of user (phone number)
+    :return: HMAC of the id with the analytics user key
+    """
+    return hmac.new(user_key.encode("utf-8"), user_id.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def get_recorded_query(query):
+    """
+    get the part of a user's message recorded in turn events, messages may contain personal data (names, phone
+    numbers, symptoms) so they are only recorded if max_query_length is set
+    :param query: user's message
+    :return: message lowercased, with whitespace collapsed and cut to max_query_length characters, None if messages
+    are not recorded
+    """
+    if max_query_length <= 0:
+        return None
+    return " ".join(query.lower().split())[:max_query_length]
+
+
+def __start_writer():
+    global writer_thread
+    if writer_thread is None:
+        with writer_lock:
+            if writer_thread is None:
+                writer_thread = threading.Thread(target=__write_events, name="analytics-writer", daemon=True)
+                writer_thread.start()
+                atexit.register(flush)
+
+
+def record_turn(turn):
+    """
+    record a turn of a conversation, it is written by a background thread and never blocks the caller
+    :param turn: dictionary of TURN_FIELDS
+    :return: True if the turn is recorded, False if analytics are disabled or the buffer is full
+    """
+    if directory is None:
+        return False
+    __start_writer()
+    try:
+        events.put_nowait(turn)
+    except queue.Full:
+        with statistics_lock:
+            analytics_statistics["dropped"] += 1
+        return False
+    with statistics_lock:
+        analytics_statistics["recorded"] += 1
+    return True
+
+
+def __take_batch(timeout):
+    """
+    take the waiting turn events, at most batch_size of them
+    :param timeout: number of seconds to wait for more events, None to not wait
+    :return: list of turn events
+    """
+    batch = []
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while len(batch) < batch_size:
+        try:
+            if deadline is None:
+                batch.append(events.get_nowait())
+            else:
+                batch.append(events.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    return batch
+
+
+def __write_events():
+    while True:
+        batch = [events.get()]  # wait for the first event, then collect a batch for at most flush_interval seconds
+        batch.extend(__take_batch(flush_interval))
+        __write_batch(batch)
+
+
+def __load_pyarrow():
+    """
+    check if pyarrow is installed (once per process)
+    :return: True if parquet files can be written, False if they cannot
+    """
+    global is_pyarrow_available
+    if is_pyarrow_available is None:
+        is_pyarrow_available = importlib.util.find_spec("pyarrow") is not None
+        if not is_pyarrow_available:
+            logger.warning("pyarrow is not installed, analytics are written as JSONL files.")
+    return is_pyarrow_available
+
+
+def __write_parquet(batch, path):
+    import pyarrow
+    import pyarrow.parquet
+
+    types = {float: pyarrow.float64(), str: pyarrow.string(), bool: pyarrow.bool_()}
+    schema = pyarrow.schema([(field, types[field_type]) for field, field_type in TURN_FIELDS])
+    columns = [pyarrow.array([turn.get(field) for turn in batch], type=types[field_type])
+               for field, field_type in TURN_FIELDS]
+    pyarrow.parquet.write_table(pyarrow.Table.from_arrays(columns, schema=schema), path)
+
+
+def __write_jsonl(batch, path):
+    with open(path, "a", encoding="utf-8") as analytics_file:
+        for turn in batch:
+            analytics_file.write(json.dumps({field: turn.get(field) for field, field_type in TURN_FIELDS},
+                                            ensure_ascii=False))
+            analytics_file.write("\n")
+
+
+def __write_batch(batch):
+    """
+    write a batch of turn events, as a new parquet file or appended to the JSONL file of the day
+    :param batch: list of turn events
+    """
+    global batch_sequence
+    with write_lock:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            if file_format == "parquet" and __load_pyarrow():
+                batch_sequence += 1
+                path = os.path.join(directory, "turns-{}-{}-{}.parquet".format(time.strftime("%Y%m%d-%H%M%S"),
+                                                                               os.getpid(), batch_sequence))
+                __write_parquet(batch, path)
+            else:
+                path = os.path.join(directory, "turns-{}-{}.jsonl".format(time.strftime("%Y%m%d"), os.getpid()))
+                __write_jsonl(batch, path)
+            with statistics_lock:
+                analytics_statistics["written"] += len(batch)
+                analytics_statistics["batches"] += 1
+        except Exception as e:
+            logger.error("Writing {} analytics events failed: {}".format(len(batch), str(e)))
+            with statistics_lock:
+                analytics_statistics["errors"] += 1
+
+
+def flush():
+    """
+    write the waiting turn events (e.g. when the process exits)
+    """
+    batch = __take_batch(None)
+    while batch:
+        __write_batch(batch)
+        batch = __take_batch(None)
+
+
+def get_statistics():
+    """
+    get statistics of the analytics
+    :return: statistics as dictionary
+    """
+    with statistics_lock:
+        statistics = dict(analytics_statistics)
+    statistics.update({
+        "enabled": directory is not None,
+        "format": file_format if is_pyarrow_available is not False else "jsonl",
+        "waiting": events.qsize(),
+    })
+    return statistics
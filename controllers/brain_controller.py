@@ -0,0 +1,466 @@
+import os
+import re
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from rivescript import RiveScript
+from controllers import cache_controller
+from controllers import mongo_controller
+from controllers import semantic_controller
+from controllers import session_controller
+from controllers import settings_controller
+from controllers import trigger_controller
+from controllers import knowledge_base_controller
+
+logger = logging.getLogger("Brain Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+settings = settings_controller.settings
+
+try:
+    settings.require("BRAINS", "NEGATIVE_CACHE")
+    default_language = settings.get("BRAINS", "default_language")
+    max_loaded_brains = settings.get("BRAINS", "max_loaded_brains")
+    if settings.get("BRAINS", "rules_budget_mb") is None:
+        rules_budget = None
+    else:
+        rules_budget = int(settings.get("BRAINS", "rules_budget_mb") * 1024 * 1024)
+
+except Exception as e:
+    logger.error(str(e))
+    exit()
+
+RULES_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "brain/rules")  # rules of a language are under <language>/
+
+
+class Brain:
+    """
+    everything needed to talk in one language: RiveScript rules, sessions of users, compiled question/answer triggers
+    and knowledge base
+    """
+
+    def __init__(self, language):
+        """
+        :param language: language code (e.g. "en"), rules are loaded from brain/rules/<language>
+        """
+        self.language = language
+        self.rules_directory = os.path.join(RULES_DIRECTORY, language)
+        # the brain (rules, user variables) and rule files are shared by all users, messages of one user are
+        # serialized by the caller
+        self.lock = threading.RLock()
+        self.session_storage = session_controller.BoundedSessionStorage(session_controller.max_sessions,
+                                                                        session_controller.idle_ttl,
+                                                                        language)
+        self.bot = RiveScript(session_manager=self.session_storage)
+        # generated question/answer rules compiled into a trie, matched before RiveScript scans its triggers one by one
+        self.trigger_index = trigger_controller.TriggerIndex()
+        self.knowledge_base = knowledge_base_controller.KnowledgeBase(language)
+        self.generated_topics = set()  # names of topics written in the rule files (e.g. generated menus)
+        # normalized messages which got no answer, forgotten when rules or the knowledge base change
+        self.unanswerable_queries = cache_controller.TTLCache(settings.get("NEGATIVE_CACHE", "max_size"),
+                                                              settings.get("NEGATIVE_CACHE", "ttl"))
+        self.rules_version = 0  # incremented when rules or the knowledge base change
+        self.rules_generation = 0  # incremented when rules are added to the running RiveScript instance
+        self.sorted_rules_generation = 0  # generation of rules when the triggers were sorted
+        self.pending_rules = None  # rules added while a new RiveScript instance is built, replayed into it
+        # rank of question/answer triggers in the sorted triggers of the main topic, and the other triggers (hand-written
+        # rules, generated menus) with their rank, see matches_earlier_rule
+        self.question_answer_ranks = {}
+        self.other_rules = []
+        self.knowledge_base_version = None  # version of the knowledge base when it was loaded
+        self.refresh_lock = threading.Lock()  # the brain is refreshed by one thread, others use the previous snapshot
+        self.active_requests = 0  # number of messages being answered, guarded by brains_lock
+
+    def load(self):
+        """
+        load rules, compile question/answer triggers and load the knowledge base of the language
+        """
+        self.knowledge_base_version = mongo_controller.get_knowledge_base_version()  # a change while loading is refreshed later
+        self.reload_rules()
+        self.trigger_index.compile_directory(self.rules_directory)
+        self.generated_topics = self.__find_topics()
+        self.knowledge_base.load()
+        self.invalidate_answers()
+        logger.info("Brain of language {} is loaded ({} bytes of rules, {} question/answer triggers)".format(
+            self.language, self.get_rules_size(), self.trigger_index.number_of_triggers))
+
+    def refresh(self):
+        """
+        rebuild the rules, question/answer triggers and knowledge base if the knowledge base version advanced (e.g. an
+        import or another worker changed it), the previous snapshot is used until the new one is built
+        :return: True if the brain is refreshed, False if it is up to date (or another thread is refreshing it)
+        """
+        try:
+            version = mongo_controller.get_knowledge_base_version()
+        except Exception as e:
+            logger.error("Knowledge base version cannot be read: {}".format(str(e)))
+            return False
+        if version == self.knowledge_base_version:
+            return False
+        if mongo_controller.is_own_change(self.knowledge_base_version, version):  # already applied in place
+            self.knowledge_base_version = version
+            return False
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            if version == self.knowledge_base_version:  # refreshed by another thread meanwhile
+                return False
+            with self.lock:
+                self.pending_rules = []
+            bot = self.__build_bot()
+            trigger_index = trigger_controller.TriggerIndex()
+            trigger_index.compile_directory(self.rules_directory)
+            knowledge_base = knowledge_base_controller.KnowledgeBase(self.language)
+            knowledge_base.load()
+            semantic_controller.reload_index()
+            with self.lock:
+                for code in self.pending_rules:  # written after the rule files were read
+                    bot.stream(code)
+                if self.pending_rules:
+                    bot.sort_replies()
+                self.pending_rules = None
+                self.sorted_rules_generation = self.rules_generation
+                self.bot = bot
+                self.__rank_rules()
+                self.generated_topics = self.__find_topics()
+                self.trigger_index = trigger_index
+                self.knowledge_base = knowledge_base
+                self.knowledge_base_version = version
+                self.invalidate_answers()
+            logger.info("Brain of language {} is refreshed (knowledge base version {})".format(self.language, version))
+            return True
+        except Exception as e:
+            logger.error("Brain of language {} cannot be refreshed: {}".format(self.language, str(e)))
+            return False
+        finally:
+            with self.lock:
+                self.pending_rules = None
+            self.refresh_lock.release()
+
+    def __build_bot(self):
+        """
+        load the rules of the rules directory into a new RiveScript instance, RiveScript only appends the rules it
+        reads, so rules removed from the files would stay in an instance which reads them again
+        :return: RiveScript instance, it shares the sessions of users of the brain
+        """
+        bot = RiveScript(session_manager=self.session_storage)
+        bot.load_directory(self.rules_directory)
+        bot.sort_replies()
+        return bot
+
+    def reload_rules(self):
+        """
+        reload rules from the rules directory of the language (rules removed from the files are dropped)
+        """
+        with self.lock:  # rule files are written while the lock is held
+            self.bot = self.__build_bot()
+            self.sorted_rules_generation = self.rules_generation
+            self.__rank_rules()
+
+    def add_rules(self, code):
+        """
+        add rules appended to a rule file to the running RiveScript instance, RiveScript only appends the rules it
+        reads, so streaming the appended code is the same as reading the file again
+        :param code: RiveScript code appended to a rule file
+        """
+        with self.lock:
+            self.bot.stream(code)
+            if self.pending_rules is not None:
+                self.pending_rules.append(code)
+            self.rules_generation += 1
+
+    def set_question_answer_rules(self, qa_id, patterns):
+        """
+        set the question/answer rules (top level triggers replying the id) of a question/answer in the running
+        RiveScript instance, only the changed triggers are removed or added; RiveScript has no API to remove rules, so
+        its triggers (kept in _topics) are filtered, the caller holds refresh_lock so no new instance is being built
+        :param qa_id: id of question/answer
+        :param patterns: triggers of the question/answer, empty if it is deleted
+        """
+        with self.lock:
+            triggers = self.bot._topics.get("random", [])
+            current_patterns = set(trigger["trigger"] for trigger in triggers if trigger["reply"] == [qa_id])
+            self.bot._topics["random"] = [trigger for trigger in triggers
+                                          if trigger["reply"] != [qa_id] or trigger["trigger"] in patterns]
+            new_patterns = [pattern for pattern in patterns if pattern not in current_patterns]
+            if new_patterns:
+                self.add_rules("".join("+ %s\n- %s\n\n" % (pattern, qa_id) for pattern in new_patterns))
+            self.rules_generation += 1
+
+    def remove_topics(self, topics):
+        """
+        remove topics (e.g. generated menus) and the triggers leading to them from the running RiveScript instance
+        :param topics: names of topics
+        """
+        if not topics:
+            return
+        with self.lock:
+            for internal in (self.bot._topics, self.bot._thats, self.bot._includes, self.bot._lineage,
+                             self.bot._syntax):
+                for topic in topics:
+                    internal.pop(topic, None)
+            references = ["{topic=%s}" % topic for topic in topics]
+            for topic, triggers in self.bot._topics.items():
+                self.bot._topics[topic] = [trigger for trigger in triggers
+                                           if not any(reference in reply
+                                                      for reply in trigger["reply"] for reference in references)]
+            self.generated_topics -= topics
+            self.rules_generation += 1
+
+    def sort_rules(self):
+        """
+        sort the triggers if rules were added since they were sorted, nothing is done when rules did not change
+        """
+        with self.lock:
+            if self.sorted_rules_generation != self.rules_generation:
+                self.bot.sort_replies()
+                self.sorted_rules_generation = self.rules_generation
+                self.__rank_rules()
+
+    def __rank_rules(self):
+        """
+        rank the sorted triggers of the main topic, RiveScript replies with the first trigger matching a message
+        caller must hold the lock
+        """
+        question_answer_ranks = {}
+        other_rules = []
+        for rank, (pattern, trigger) in enumerate(self.bot._sorted["topics"].get("random", [])):
+            if len(trigger["reply"]) == 1 and trigger_controller.QA_ID_PATTERN.match(trigger["reply"][0]) and \
+                    not trigger["condition"] and trigger["redirect"] is None:
+                question_answer_ranks.setdefault(pattern, rank)
+            else:
+                other_rules.append((rank, pattern))
+        self.question_answer_ranks = question_answer_ranks
+        self.other_rules = other_rules
+
+    def matches_earlier_rule(self, user_id, message, pattern):
+        """
+        check if RiveScript would reply with another rule than a question/answer trigger matched by the trigger index:
+        a trigger which is not a question/answer rule (e.g. a hand-written rule) sorted before it matches the message,
+        only those few triggers are tested
+        :param user_id: id of user
+        :param message: user's message
+        :param pattern: question/answer trigger matched by the trigger index
+        :return: True if another rule would reply, False if the question/answer trigger would
+        """
+        with self.lock:
+            self.sort_rules()
+            rank = self.question_answer_ranks.get(pattern)
+            if rank is None:  # not a trigger of the running RiveScript instance, it is left to RiveScript
+                return True
+            message = self.bot._brain.format_message(message)
+            for other_rank, other_pattern in self.other_rules:
+                if other_rank > rank:
+                    break
+                if re.match(self.bot._brain.reply_regexp(user_id, other_pattern), message):
+                    return True
+            return False
+
+    def record_reply(self, user_id, message, reply, pattern):
+        """
+        record a reply given without RiveScript (a question/answer trigger matched by the trigger index) in the user's
+        history and last match, as RiveScript does, so <input>, <reply> and %Previous see it
+        :param user_id: id of user
+        :param message: user's message
+        :param reply: reply of the matched rule
+        :param pattern: matched trigger
+        """
+        with self.lock:
+            history = self.bot.get_uservar(user_id, "__history__")
+            if type(history) is dict:
+                history["input"] = [self.bot._brain.format_message(message)] + history["input"][:8]
+                history["reply"] = [reply] + history["reply"][:8]
+                self.bot.set_uservar(user_id, "__history__", history)
+            self.bot.set_uservar(user_id, "__lastmatch__", pattern)
+
+    def invalidate_answers(self):
+        """
+        forget unanswerable messages, rules or the knowledge base changed
+        """
+        with self.lock:
+            self.rules_version += 1
+            self.unanswerable_queries.clear()
+
+    def add_unanswerable_query(self, query, rules_version):
+        """
+        remember a message which got no answer
+        :param query: normalized message
+        :param rules_version: version of rules when the message was answered, the message is not remembered if
+        rules changed meanwhile
+        """
+        with self.lock:
+            if rules_version == self.rules_version:
+                self.unanswerable_queries.set(query, True)
+
+    def unload(self):
+        """
+        persist the sessions of users before the brain is dropped (it is not used by any message anymore)
+        """
+        number_of_users = self.session_storage.persist_all()
+        logger.info("Brain of language {} is unloaded ({} sessions persisted)".format(self.language, number_of_users))
+
+    def __find_topics(self):
+        """
+        find the topics defined in the rule files
+        :return: set of topic names
+        """
+        topics = set()
+        for root, dirs, files in os.walk(self.rules_directory):
+            for file_name in files:
+                if file_name.endswith(".rive"):
+                    with open(os.path.join(root, file_name), "r", encoding="utf-8") as rule_file:
+                        for line in rule_file:
+                            line = line.strip()
+                            if line.startswith("> topic "):
+                                topics.add(line.split()[2])
+        return topics
+
+    def get_rules_size(self):
+        """
+        get the size of the rule files, the memory used by a brain grows with its rules
+        :return: size in bytes
+        """
+        size = 0
+        for root, dirs, files in os.walk(self.rules_directory):
+            for file_name in files:
+                if file_name.endswith(".rive"):
+                    size += os.path.getsize(os.path.join(root, file_name))
+        return size
+
+
+brains = OrderedDict()  # language -> loaded brain, ordered from least to most recently used
+brains_lock = threading.Lock()
+loading_locks = {}  # language -> lock, a brain is loaded (or unloaded) by one thread at a time
+brain_statistics = {"loads": 0, "unloads": 0}
+
+
+def is_supported_language(language):
+    """
+    check if there are rules for a language
+    :param language: language code (e.g. "en")
+    :return: True if the language has a rules directory, False if it does not
+    """
+    return isinstance(language, str) and language.isalpha() and os.path.isdir(os.path.join(RULES_DIRECTORY, language))
+
+
+def get_supported_languages():
+    """
+    get the languages which have a rules directory
+    :return: list of language codes
+    """
+    return sorted(name for name in os.listdir(RULES_DIRECTORY) if is_supported_language(name))
+
+
+def __select_cold_brains():
+    """
+    remove least recently used brains from the registry until the number of brains and the size of their rules are
+    within the limits, brains answering a message and the brain of the default language are kept
+    caller must hold brains_lock
+    :return: list of removed brains
+    """
+    cold_brains = []
+    rules_sizes = {language: brain.get_rules_size() for language, brain in brains.items()}
+    for language in list(brains.keys()):
+        over_count = len(brains) > max_loaded_brains
+        over_budget = rules_budget is not None and sum(rules_sizes.values()) > rules_budget
+        if not over_count and not over_budget:
+            break
+        if language == default_language or brains[language].active_requests > 0:
+            continue
+        cold_brains.append(brains.pop(language))
+        del rules_sizes[language]
+    return cold_brains
+
+
+def __acquire_brain(language):
+    with brains_lock:
+        brain = brains.get(language)
+        if brain is not None:
+            brains.move_to_end(language)
+            brain.active_requests += 1
+            return brain
+        loading_lock = loading_locks.setdefault(language, threading.Lock())
+
+    with loading_lock:
+        with brains_lock:  # another thread may have loaded the brain meanwhile
+            brain = brains.get(language)
+            if brain is not None:
+                brains.move_to_end(language)
+                brain.active_requests += 1
+                return brain
+        brain = Brain(language)
+        brain.load()
+        with brains_lock:
+            brains[language] = brain
+            brain.active_requests += 1
+            brain_statistics["loads"] += 1
+            cold_brains = __select_cold_brains()
+
+    for cold_brain in cold_brains:
+        with loading_locks[cold_brain.language]:  # the language is not loaded again before its sessions are persisted
+            cold_brain.unload()
+        with brains_lock:
+            brain_statistics["unloads"] += 1
+    return brain
+
+
+def __release_brain(brain):
+    with brains_lock:
+        brain.active_requests -= 1
+
+
+@contextmanager
+def use_brain(language):
+    """
+    get the brain of a language, it is loaded on the first message in the language and cold brains are unloaded
+    when there are too many loaded brains (or their rules are too big)
+    :param language: language code (e.g. "en")
+    :return: brain, it is not unloaded while it is used
+    """
+    brain = __acquire_brain(language)
+    try:
+        brain.refresh()  # cheap unless the knowledge base version advanced
+        yield brain
+    finally:
+        __release_brain(brain)
+
+
+def preload_brain(language):
+    """
+    load the brain of a language before the first message in the language (e.g. when the server starts)
+    :param language: language code (e.g. "en")
+    """
+    with use_brain(language):
+        pass
+
+
+def get_statistics():
+    """
+    get statistics of the loaded brains
+    :return: statistics as dictionary
+    """
+    with brains_lock:
+        loaded_brains = list(brains.values())
+        statistics = dict(brain_statistics)
+    statistics.update({
+        "max_loaded_brains": max_loaded_brains,
+        "rules_budget": rules_budget,
+        "loaded_brains": {
+            brain.language: {
+                "rules_bytes": brain.get_rules_size(),
+                "question_answer_triggers": brain.trigger_index.number_of_triggers,
+                "knowledge_base_version": brain.knowledge_base_version,
+                "active_requests": brain.active_requests,
+                "unanswerable_queries": brain.unanswerable_queries.get_statistics(),
+                "sessions": brain.session_storage.get_statistics(),
+            } for brain in loaded_brains
+        },
+    })
+    return statistics
@@ -0,0 +1,139 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    bounded least-recently-used cache whose entries expire after a time-to-live
+    """
+
+    def __init__(self, max_size, ttl=None, copy_values=False):
+        """
+        :param max_size: maximum number of entries kept in the cache
+        :param ttl: number of seconds an entry is valid, None if entries never expire
+        :param copy_values: True to store and return copies of values (e.g. mutable mongodb documents), so callers
+        cannot change cached values
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.copy_values = copy_values
+        self.__entries = OrderedDict()  # key -> (expiry time, value)
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        get the value of a key, and mark it as recently used
+        :param key: key of entry
+        :param default: returned value if key does not exist or is expired
+        :return: value of the entry
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] is not None and entry[0] < time.monotonic():
+                del self.__entries[key]
+                self.misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def __contains__(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            return entry is not None and (entry[0] is None or entry[0] >= time.monotonic())
+
+    def set(self, key, value):
+        """
+        add/replace an entry, the least recently used entry is evicted if the cache is full
+        :param key: key of entry
+        :param value: value of entry
+        """
+        with self.__lock:
+            self.__put(key, value)
+
+    def add(self, key, value):
+        """
+        add an entry only if the key is not already cached (atomic check-and-set)
+        :param key: key of entry
+        :param value: value of entry
+        :return: True if the entry is added, False if the key is already cached
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] >= time.monotonic()):
+                return False
+            self.__put(key, value)
+            return True
+
+    def __put(self, key, value):
+        # callers must hold the lock
+        if self.copy_values:
+            value = copy.deepcopy(value)
+        self.__entries[key] = (time.monotonic() + self.ttl if self.ttl else None, value)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        read-through access, the value is loaded and kept if the key is not cached
+        :param key: key of entry
+        :param loader: function that loads the value of the key
+        :return: value of the entry
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            if value is not None:  # do not keep misses, the entry may be added later
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        """
+        remove an entry
+        :param key: key of entry
+        """
+        with self.__lock:
+            if self.__entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """
+        remove all entries
+        """
+        with self.__lock:
+            self.invalidations += len(self.__entries)
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_statistics(self):
+        """
+        get statistics of the cache
+        :return: statistics as dictionary
+        """
+        with self.__lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self.__entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(float(self.hits) / requests, 4) if requests > 0 else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
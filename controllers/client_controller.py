@@ -0,0 +1,89 @@
+import logging
+import threading
+from controllers import settings_controller
+
+logger = logging.getLogger("Client Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+settings = settings_controller.settings
+
+# one client (and connection pool) of each service per process, created on first use
+mongo_client = None
+twilio_client = None
+nlp_session = None
+clients_lock = threading.Lock()
+
+
+def get_mongo_client():
+    """
+    get the mongodb client, it is created on the first call
+    :return: mongodb client
+    """
+    global mongo_client
+    if mongo_client is None:
+        with clients_lock:
+            if mongo_client is None:
+                settings.require("MONGODB")
+                from pymongo import MongoClient  # pymongo is only imported when mongodb is used
+
+                address = "{}:{}".format(settings.get("MONGODB", "address"), settings.get("MONGODB", "port"))
+                if settings.get("MONGODB", "username") and settings.get("MONGODB", "password"):
+                    mongo_client = MongoClient(address, username=settings.get("MONGODB", "username"),
+                                               password=settings.get("MONGODB", "password"),
+                                               maxPoolSize=settings.get("MONGODB", "max_pool_size"))
+                else:
+                    mongo_client = MongoClient(address, maxPoolSize=settings.get("MONGODB", "max_pool_size"))
+                logger.info("Mongodb client is created")
+    return mongo_client
+
+
+def get_twilio_client():
+    """
+    get the twilio client, it is created on the first call
+    :return: twilio client
+    """
+    global twilio_client
+    if twilio_client is None:
+        with clients_lock:
+            if twilio_client is None:
+                settings.require("TWILIO")
+                from requests.adapters import HTTPAdapter
+                from twilio.rest import Client  # twilio is only imported when a message is sent
+                from twilio.http.http_client import TwilioHttpClient
+
+                http_client = TwilioHttpClient(pool_connections=True)
+                if getattr(http_client, "session", None) is not None:
+                    http_client.session.mount("https://", HTTPAdapter(
+                        pool_maxsize=settings.get("TWILIO", "pool_size")))
+                twilio_client = Client(settings.get("TWILIO", "account_sid"), settings.get("TWILIO", "auth_token"),
+                                       http_client=http_client)
+                logger.info("Twilio client is created")
+    return twilio_client
+
+
+def get_nlp_session():
+    """
+    get the HTTP session of the Stanford CoreNLP server (keeps connections alive), it is created on the first call
+    :return: requests session
+    """
+    global nlp_session
+    if nlp_session is None:
+        with clients_lock:
+            if nlp_session is None:
+                settings.require("STANFORD_CORNLP")
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=settings.get("STANFORD_CORNLP", "pool_size"))
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                nlp_session = session
+                logger.info("Stanford CoreNLP session is created")
+    return nlp_session
@@ -0,0 +1,301 @@
+import threading
+import time
+
+
+class UserSerialExecutor:
+    """
+    run the tasks of each user one at a time and in arrival order, while tasks of different users run in parallel
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__mailboxes = {}  # user id -> mailbox (condition, next ticket, ticket being served, number of waiting tasks)
+
+    def run(self, user_id, task, *args, **kwargs):
+        """
+        run a task of user after all earlier tasks of the same user are finished
+        :param user_id: id of user
+        :param task: function to run
+        :return: result of the task
+        """
+        with self.__lock:
+            mailbox = self.__mailboxes.get(user_id)
+            if mailbox is None:
+                mailbox = {"condition": threading.Condition(self.__lock), "next_ticket": 0, "serving": 0, "pending": 0}
+                self.__mailboxes[user_id] = mailbox
+            ticket = mailbox["next_ticket"]
+            mailbox["next_ticket"] += 1
+            mailbox["pending"] += 1
+            while mailbox["serving"] != ticket:
+                mailbox["condition"].wait()
+        try:
+            return task(*args, **kwargs)
+        finally:
+            with self.__lock:
+                mailbox["serving"] += 1
+                mailbox["pending"] -= 1
+                if mailbox["pending"] == 0:  # user is idle, do not keep its mailbox
+                    del self.__mailboxes[user_id]
+                else:
+                    mailbox["condition"].notify_all()
+
+    def get_active_users(self):
+        """
+        get number of users who have a running or waiting task
+        :return: number of users
+        """
+        with self.__lock:
+            return len(self.__mailboxes)
+
+
+class MessageCoalescer:
+    """
+    merge the messages a user sends within a short window (e.g. a question split into several messages) into one,
+    the merged messages are answered by a timer thread when the window closes, no caller waits for the window
+    the callers have already acknowledged the buffered messages, if answering the merged messages fails, the handler
+    must tell the user (they are not sent again)
+    """
+
+    def __init__(self, window, handler):
+        """
+        :param window: number of seconds to wait for more messages of the user, 0 disables coalescing
+        :param handler: function called with (user id, merged messages, context of first message) when the window
+        closes
+        """
+        self.window = window
+        self.handler = handler
+        self.__lock = threading.Lock()
+        # user id -> (messages received within the current window, context of first message, timer of the window)
+        self.__buffers = {}
+        self.coalesced_messages = 0
+
+    def submit(self, user_id, message, context=None):
+        """
+        submit a message of user, the first message of a window starts a timer which hands all messages of the window
+        to the handler, a chosen option of a suggestion menu (a bare number) is never merged: the messages of the
+        window are handed to the handler first, in the caller's thread, then the option is answered on its own
+        :param user_id: id of user
+        :param message: user's message
+        :param context: anything the handler needs to answer the messages (e.g. phone numbers)
+        :return: the message if the caller should answer it right away, None if it is buffered
+        """
+        if self.window <= 0:
+            return message
+        is_option = message.strip().isdigit()
+        with self.__lock:
+            buffer = self.__buffers.get(user_id)
+            if buffer is not None and not is_option:
+                buffer[0].append(message)
+                self.coalesced_messages += 1
+                return None
+            if buffer is None and is_option:
+                return message
+            if buffer is not None:  # the option is answered after the messages before it
+                del self.__buffers[user_id]
+            else:
+                messages = [message]
+                buffer = (messages, context, threading.Timer(self.window, self.__flush, args=(user_id, messages)))
+                self.__buffers[user_id] = buffer
+        messages, buffer_context, timer = buffer
+        if is_option:
+            timer.cancel()
+            self.handler(user_id, " ".join(messages), buffer_context)
+            return message
+        timer.daemon = True
+        timer.start()
+        return None
+
+    def __flush(self, user_id, messages):
+        with self.__lock:
+            buffer = self.__buffers.get(user_id)
+            if buffer is None or buffer[0] is not messages:  # flushed by a chosen option meanwhile
+                return
+            del self.__buffers[user_id]
+        self.handler(user_id, " ".join(messages), buffer[1])
+
+    def get_waiting_users(self):
+        """
+        get number of users whose messages are buffered
+        :return: number of users
+        """
+        with self.__lock:
+            return len(self.__buffers)
+
+
+class AdmissionController:
+    """
+    bound the number of requests served at once, a request waits for a free slot at most for the queue deadline and
+    is shed (e.g. answered with a canned reply) when the queue is full or the deadline passes
+    """
+
+    def __init__(self, max_in_flight, max_waiting, queue_timeout):
+        """
+        :param max_in_flight: maximum number of requests served at once
+        :param max_waiting: maximum number of requests waiting for a slot
+        :param queue_timeout: maximum number of seconds a request waits for a slot
+        """
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.__condition = threading.Condition(threading.Lock())
+        self.__in_flight = 0
+        self.__waiting = 0
+        self.__statistics = {"admitted": 0, "shed_queue_full": 0, "shed_deadline": 0, "queued": 0,
+                             "queue_time": 0.0, "max_in_flight_reached": 0}
+
+    def admit(self):
+        """
+        wait for a free slot, the caller must call release when the request is served
+        :return: True if the request is admitted, False if it is shed
+        """
+        with self.__condition:
+            if self.__in_flight < self.max_in_flight and self.__waiting == 0:
+                self.__in_flight += 1
+                self.__statistics["admitted"] += 1
+                self.__statistics["max_in_flight_reached"] = max(self.__statistics["max_in_flight_reached"],
+                                                                 self.__in_flight)
+                return True
+            if self.__waiting >= self.max_waiting:
+                self.__statistics["shed_queue_full"] += 1
+                return False
+            self.__waiting += 1
+            self.__statistics["queued"] += 1
+            start = time.monotonic()
+            deadline = start + self.queue_timeout
+            try:
+                while self.__in_flight >= self.max_in_flight:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        self.__statistics["shed_deadline"] += 1
+                        return False
+                    self.__condition.wait(timeout)
+            finally:
+                self.__waiting -= 1
+                self.__statistics["queue_time"] += time.monotonic() - start
+            self.__in_flight += 1
+            self.__statistics["admitted"] += 1
+            self.__statistics["max_in_flight_reached"] = max(self.__statistics["max_in_flight_reached"],
+                                                             self.__in_flight)
+            return True
+
+    def release(self):
+        """
+        free the slot of an admitted request
+        """
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__condition.notify()
+
+    def get_statistics(self):
+        """
+        get statistics of admitted and shed requests
+        :return: statistics as dictionary
+        """
+        with self.__condition:
+            statistics = dict(self.__statistics)
+            statistics.update({
+                "in_flight": self.__in_flight,
+                "waiting": self.__waiting,
+                "max_in_flight": self.max_in_flight,
+                "max_waiting": self.max_waiting,
+                "queue_timeout": self.queue_timeout,
+            })
+        statistics["shed"] = statistics["shed_queue_full"] + statistics["shed_deadline"]
+        statistics["average_queue_time"] = statistics["queue_time"] / statistics["queued"] \
+            if statistics["queued"] > 0 else 0.0
+        return statistics
+
+
+class CircuitBreaker:
+    """
+    stop calling a failing (or too slow) backend for a while, after reset_timeout one probe call is let through and
+    the breaker closes again if it succeeds within the latency objective
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, latency_slo, reset_timeout):
+        """
+        :param failure_threshold: number of consecutive failed (or slow) calls which opens the breaker
+        :param latency_slo: number of seconds above which a successful call counts as failed, None to not check
+        :param reset_timeout: number of seconds the breaker stays open before a probe call
+        """
+        self.failure_threshold = failure_threshold
+        self.latency_slo = latency_slo
+        self.reset_timeout = reset_timeout
+        self.__lock = threading.Lock()
+        self.__state = CircuitBreaker.CLOSED
+        self.__consecutive_failures = 0
+        self.__opened_at = None
+        self.__is_probing = False
+        self.__statistics = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected_calls": 0, "opened": 0}
+
+    def allow_request(self):
+        """
+        check if the backend can be called, the caller must report the result with record_success or record_failure
+        :return: True if the backend can be called, False if the breaker is open
+        """
+        with self.__lock:
+            if self.__state == CircuitBreaker.OPEN and time.monotonic() - self.__opened_at >= self.reset_timeout:
+                self.__state = CircuitBreaker.HALF_OPEN
+                self.__is_probing = False
+            if self.__state == CircuitBreaker.CLOSED or \
+                    (self.__state == CircuitBreaker.HALF_OPEN and not self.__is_probing):
+                self.__is_probing = self.__state == CircuitBreaker.HALF_OPEN
+                self.__statistics["calls"] += 1
+                return True
+            self.__statistics["rejected_calls"] += 1
+            return False
+
+    def is_open(self):
+        """
+        check if calls are rejected, without letting a probe call through
+        :return: True if the breaker is open (and not ready for a probe call), False if it is not
+        """
+        with self.__lock:
+            return self.__state == CircuitBreaker.OPEN and time.monotonic() - self.__opened_at < self.reset_timeout
+
+    def record_success(self, latency):
+        """
+        report a successful call
+        :param latency: number of seconds the call took
+        """
+        if self.latency_slo is not None and latency > self.latency_slo:
+            with self.__lock:
+                self.__statistics["slow_calls"] += 1
+            self.__record_failure()
+            return
+        with self.__lock:
+            self.__consecutive_failures = 0
+            self.__is_probing = False
+            self.__state = CircuitBreaker.CLOSED
+
+    def record_failure(self):
+        """
+        report a failed call
+        """
+        with self.__lock:
+            self.__statistics["failures"] += 1
+        self.__record_failure()
+
+    def __record_failure(self):
+        with self.__lock:
+            self.__consecutive_failures += 1
+            self.__is_probing = False
+            if self.__state == CircuitBreaker.HALF_OPEN or \
+                    (self.__state == CircuitBreaker.CLOSED and self.__consecutive_failures >= self.failure_threshold):
+                self.__state = CircuitBreaker.OPEN
+                self.__opened_at = time.monotonic()
+                self.__statistics["opened"] += 1
+
+    def get_statistics(self):
+        """
+        get statistics of calls
+        :return: statistics as dictionary
+        """
+        with self.__lock:
+            statistics = dict(self.__statistics)
+            statistics.update({"state": self.__state, "consecutive_failures": self.__consecutive_failures})
+        return statistics
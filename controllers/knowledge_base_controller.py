@@ -0,0 +1,195 @@
+import logging
+from controllers import mongo_controller
+from controllers import ranking_controller
+from controllers import spelling_controller
+
+logger = logging.getLogger("Knowledge Base Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+DEFAULT_LANGUAGE = "en"  # language of topics without a language (added before languages were supported)
+
+
+def __render_link(link):
+    """
+    render a "more details" link based on its type (image, video, pdf, document or webpage)
+    :param link: url of the link
+    :return: rendered link
+    """
+    if link.endswith(("png", "jpg", "jpeg")):
+        return "Image: _{}_\n".format(link)
+    elif "youtube" in link or link.endswith(("mkv", "mov", "mp4")):
+        return "Video: _{}_\n".format(link)
+    elif link.endswith("pdf"):
+        return "PDF: _{}_\n".format(link)
+    elif link.endswith(("doc", "docx")):
+        return "Document: _{}_\n".format(link)
+    return "WebPage: _{}_\n".format(link)
+
+
+def render_answer(question_answer):
+    """
+    build the WhatsApp message of a question/answer (answer and its more details)
+    :param question_answer: question/answer object
+    :return: rendered answer
+    """
+    chatbot_response = [question_answer["answer"]]
+    answer_details = question_answer["more_details"]
+
+    if len(answer_details) > 0:
+        chatbot_response.append("\n\n*More Details:* \n")
+        if isinstance(answer_details, list):
+            for link in answer_details:
+                chatbot_response.append(__render_link(link))
+        elif isinstance(answer_details, str):
+            chatbot_response.append(__render_link(answer_details))
+
+    return "".join(chatbot_response)
+
+
+class KnowledgeBase:
+    """
+    in-memory snapshot of the topics, subtopics and questions/answers of one language: rendered answers, BM25 indexes
+    of keywords (used to rank suggested topics, subtopics and questions) and typo-tolerant lookup of keywords
+    """
+
+    def __init__(self, language):
+        """
+        :param language: language code of the knowledge base (e.g. "en")
+        """
+        self.language = language
+        self.rendered_answers = {}  # id of question/answer -> final WhatsApp message of its answer
+        self.questions = {}  # id of question/answer -> question
+        self.topics = []
+        self.topics_index = ranking_controller.BM25Index()
+        self.subtopics_index = ranking_controller.BM25Index()
+        self.questions_answers_index = ranking_controller.BM25Index()
+        self.spelling_index = spelling_controller.SymSpellIndex()
+
+    def load(self):
+        """
+        render the answers of all questions/answers of the language once, so a matched rule does not need to query
+        mongodb, and precompute the keyword statistics used to rank suggestions
+        :return: number of rendered answers
+        """
+        topics = [topic for topic in mongo_controller.get_topics() or []
+                  if topic.get("language", DEFAULT_LANGUAGE) == self.language]
+        subtopic_ids = set(str(subtopic_id) for topic in topics for subtopic_id in topic["subtopics"])
+        subtopics = [subtopic for subtopic in mongo_controller.get_subtopics() or []
+                     if str(subtopic["_id"]) in subtopic_ids]
+        qa_ids = set(str(qa_id) for subtopic in subtopics for qa_id in subtopic["questions_answers"])
+
+        answers = {}
+        questions = {}
+        questions_answers_keywords = {}
+        for question_answer in mongo_controller.get_questions_answers() or []:
+            if str(question_answer["_id"]) in qa_ids:
+                answers[str(question_answer["_id"])] = render_answer(question_answer)
+                questions[str(question_answer["_id"])] = question_answer["question"]
+                questions_answers_keywords[str(question_answer["_id"])] = question_answer["keywords"]
+        self.rendered_answers = answers  # swap the whole map, so readers never see a half-built one
+        self.questions = questions
+        self.topics = topics
+        logger.info("Rendered {} answers of language {}".format(len(answers), self.language))
+
+        self.topics_index.build({str(topic["_id"]): topic["keywords"] for topic in topics})
+        self.subtopics_index.build({str(subtopic["_id"]): subtopic["keywords"] for subtopic in subtopics})
+        self.questions_answers_index.build(questions_answers_keywords)
+
+        vocabulary = {}
+        for keywords in questions_answers_keywords.values():
+            for keyword in keywords:
+                vocabulary[keyword] = vocabulary.get(keyword, 0) + 1
+        self.spelling_index.build(vocabulary)
+        logger.info("Indexed keywords of {} topics, {} subtopics and {} questions/answers ({} words) of language {}".format(
+            len(self.topics_index), len(self.subtopics_index), len(self.questions_answers_index),
+            len(self.spelling_index), self.language))
+        return len(answers)
+
+    def set_question_answer(self, question_answer, subtopic, topic):
+        """
+        add or replace a question/answer without reloading the knowledge base, the keywords of its subtopic and topic
+        are indexed again
+        :param question_answer: question/answer object
+        :param subtopic: subtopic object of the question/answer
+        :param topic: topic object of the subtopic
+        """
+        qa_id = str(question_answer["_id"])
+        self.rendered_answers[qa_id] = render_answer(question_answer)
+        self.questions[qa_id] = question_answer["question"]
+        self.questions_answers_index.add(qa_id, question_answer["keywords"])
+        for keyword in question_answer["keywords"]:
+            if keyword.lower() not in self.spelling_index:
+                self.spelling_index.add(keyword)
+        self.__set_subtopic_and_topic(subtopic, topic)
+
+    def remove_question_answer(self, qa_id, subtopic, topic):
+        """
+        remove a question/answer without reloading the knowledge base, the keywords of its subtopic and topic are
+        indexed again
+        :param qa_id: id of question/answer
+        :param subtopic: subtopic object of the question/answer (without the question/answer)
+        :param topic: topic object of the subtopic
+        """
+        self.rendered_answers.pop(qa_id, None)
+        self.questions.pop(qa_id, None)
+        self.questions_answers_index.remove(qa_id)
+        self.__set_subtopic_and_topic(subtopic, topic)
+
+    def __set_subtopic_and_topic(self, subtopic, topic):
+        self.subtopics_index.add(str(subtopic["_id"]), subtopic["keywords"])
+        self.topics_index.add(str(topic["_id"]), topic["keywords"])
+        self.topics = [topic if str(known_topic["_id"]) == str(topic["_id"]) else known_topic
+                       for known_topic in self.topics]
+
+    def get_topics(self):
+        """
+        get the topics of the language
+        :return: list of topics
+        """
+        return self.topics
+
+    def get_question(self, id):
+        """
+        get the current question of a question/answer (e.g. to check a suggestion of the semantic index, which is only
+        rebuilt by imports)
+        :param id: id of question/answer
+        :return: question, None if question/answer is not in the knowledge base
+        """
+        return self.questions.get(id)
+
+    def get_rendered_answer(self, id):
+        """
+        get the rendered answer of a question/answer, it is rendered and kept if it was added after loading
+        :param id: id of question/answer
+        :return: rendered answer, None if question/answer does not exist
+        """
+        answer = self.rendered_answers.get(id)
+        if answer is None:
+            question_answer = mongo_controller.get_question_answer(id)
+            if question_answer is None:
+                return None
+            answer = render_answer(question_answer)
+            self.rendered_answers[id] = answer
+        return answer
+
+    def correct_keywords(self, keywords):
+        """
+        correct misspelled keywords (e.g. "symtom", "vacine") to the closest word of the knowledge base vocabulary
+        :param keywords: list of keywords
+        :return: list of corrected keywords, keywords without a close word are kept as they are
+        """
+        corrected_keywords = []
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if len(keyword) > 3 and keyword not in self.spelling_index:  # short words have too many close words
+                correction = self.spelling_index.lookup(keyword, 1 if len(keyword) < 6 else 2)
+                if correction is not None:
+                    keyword = correction[0]
+            corrected_keywords.append(keyword)
+        return corrected_keywords
@@ -1,8 +1,10 @@
+import time
 import logging
-import configparser
-from pymongo import MongoClient
 from bson import ObjectId
-import os
+import threading
+from controllers import cache_controller
+from controllers import client_controller
+from controllers import settings_controller
 
 logger = logging.getLogger("MongoDB Controller")
 logger.setLevel(logging.INFO)
@@ -13,62 +15,145 @@ formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s
 log_file_handler.setFormatter(formatter)
 logger.addHandler(log_file_handler)
 
-# load configs from config.ini file
-config = configparser.ConfigParser(inline_comment_prefixes="#")
-config.read(os.path.join(os.path.dirname(__file__), "..", "config.ini"))
-db_settings = config["MONGODB"]
+settings = settings_controller.settings
 
 try:
-    logging.info("Loading config settings")
-    if "username" not in db_settings or db_settings["username"] == "":
-        db_username = None
-        logging.warning("Mongodb username is not defined.")
-    else:
-        db_username = db_settings["username"]
-    if "password" not in db_settings or db_settings["password"] == "":
-        db_password = None
-        logging.warning("Mongodb password is not defined.")
-    else:
-        db_password = db_settings["password"]
-    if "port" not in db_settings or db_settings["port"] == "":
-        raise Exception("Mongodb port is not defined.")
-    else:
-        db_port = db_settings["port"]
-    if "address" not in db_settings or db_settings["address"] == "":
-        raise Exception("Mongodb address is not defined.")
-    else:
-        db_address = db_settings["address"]
-    logging.info("Config settings loaded successfully")
+    settings.require("MONGODB", "CACHE")
+    cache_max_size = settings.get("CACHE", "max_size")
+    cache_ttl = settings.get("CACHE", "ttl")
+    version_check_interval = settings.get("CACHE", "version_check_interval")
+    registry_refresh_interval = settings.get("CACHE", "registry_refresh_interval")
 
 except Exception as e:
     logging.error(str(e))
     exit()
 
-if db_username and db_password:
-    mongo_client = MongoClient("{}:{}".format(db_address, db_port), username=db_username, password=db_password)
-elif db_username is None and db_password is None:
-    mongo_client = MongoClient("{}:{}".format(db_address, db_port))
-else:
-    logging.error(str(Exception(
-        "There is an problem MONGODB section of config.ini file, either username or password is not defined")))
-    exit()
+# read-through caches of the (almost static) knowledge base and volunteers, write paths invalidate their entries
+# values are copied, callers may change the documents they get
+topics_cache = cache_controller.TTLCache(cache_max_size, cache_ttl, copy_values=True)
+subtopics_cache = cache_controller.TTLCache(cache_max_size, cache_ttl, copy_values=True)
+questions_answers_cache = cache_controller.TTLCache(cache_max_size, cache_ttl, copy_values=True)
+volunteers_cache = cache_controller.TTLCache(cache_max_size, cache_ttl, copy_values=True)
+ALL_TOPICS_KEY = "*"
+
+# version of the knowledge base, bumped by every write of topics, subtopics and questions/answers (in any process), a
+# process refreshes its caches and brains when it advances
+KNOWLEDGE_BASE_VERSION_ID = "knowledge_base"
+knowledge_base_version = None  # last version read from mongodb
+own_versions = set()  # versions bumped by this process, its brains are updated in place (see admin_controller)
+version_checked_at = None
+version_lock = threading.Lock()
+
+# phone numbers of blacklisted users, kept in sync by add_user_to_blacklist and re-read from mongodb every
+# registry_refresh_interval seconds (other processes may change it)
+blacklisted_numbers = None
+blacklist_loaded_at = None
+blacklist_lock = threading.Lock()
+
+# WAITING/OPEN handover requests keyed by user number, mongodb is written through and re-read every
+# registry_refresh_interval seconds (other processes may change them)
+active_handover_requests = None
+handover_requests_loaded_at = None
+handover_lock = threading.RLock()
+
+
+def __is_registry_stale(loaded_at):
+    """
+    :param loaded_at: time an in-memory registry was read from mongodb, None if it was never read
+    :return: True if the registry must be re-read, False if it is fresh
+    """
+    return loaded_at is None or time.monotonic() - loaded_at >= registry_refresh_interval
+
+
+def get_cache_statistics():
+    """
+    get statistics of mongodb caches
+    :return: statistics of each cache as dictionary
+    """
+    return {
+        "topics": topics_cache.get_statistics(),
+        "subtopics": subtopics_cache.get_statistics(),
+        "questions_answers": questions_answers_cache.get_statistics(),
+        "volunteers": volunteers_cache.get_statistics(),
+    }
+
+
+def __get_versions_collection():
+    return client_controller.get_mongo_client().COVIDChatbot_Versions.COVIDChatbot_Versions
 
 
-def add_topic(name, subtopics, keywords):
+def bump_knowledge_base_version():
+    """
+    advance the version of the knowledge base, every write of topics, subtopics and questions/answers calls it
+    :return: new version
+    """
+    global version_checked_at
+    from pymongo import ReturnDocument
+
+    document = __get_versions_collection().find_one_and_update({"_id": KNOWLEDGE_BASE_VERSION_ID},
+                                                               {"$inc": {"version": 1}},
+                                                               upsert=True,
+                                                               return_document=ReturnDocument.AFTER)
+    with version_lock:
+        version_checked_at = None  # this process sees its own change on the next check
+        own_versions.add(document["version"])
+    return document["version"]
+
+
+def is_own_change(previous_version, version):
+    """
+    check if the knowledge base was only changed by this process since a version
+    :param previous_version: version (e.g. when a brain was loaded)
+    :param version: current version
+    :return: True if every version after previous_version was bumped by this process, False if it was not
+    """
+    if previous_version is None or version < previous_version:
+        return False
+    with version_lock:
+        return all(own_version in own_versions for own_version in range(previous_version + 1, version + 1))
+
+
+def get_knowledge_base_version():
+    """
+    get the version of the knowledge base, it is read from mongodb at most once per version_check_interval seconds,
+    the caches of topics, subtopics and questions/answers are cleared when it advances
+    :return: version, 0 if the knowledge base was never changed
+    """
+    global knowledge_base_version, version_checked_at
+    with version_lock:
+        if version_checked_at is not None and time.monotonic() - version_checked_at < version_check_interval:
+            return knowledge_base_version
+        document = __get_versions_collection().find_one({"_id": KNOWLEDGE_BASE_VERSION_ID})
+        version = document["version"] if document is not None else 0
+        if knowledge_base_version is not None and version != knowledge_base_version:
+            topics_cache.clear()
+            subtopics_cache.clear()
+            questions_answers_cache.clear()
+            logger.info("Knowledge base version changed from {} to {}".format(knowledge_base_version, version))
+        knowledge_base_version = version
+        version_checked_at = time.monotonic()
+        return version
+
+
+def add_topic(name, subtopics, keywords, language="en"):
     """
     add new topic into db
     :param name: name of topic
     :param subtopics: subtopics under the topic
     :param keywords: keywords under the topic
+    :param language: language code of the topic (e.g. "en")
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Topics
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     topic_details = {
         "name": name,
         "subtopics": subtopics,
         "keywords": keywords,
+        "language": language,
     }
     collection = db.COVIDChatbot_Topics.insert_one(topic_details)
+    topics_cache.invalidate(ALL_TOPICS_KEY)
+    bump_knowledge_base_version()
     if str(collection.inserted_id) != "":  # if the request is successfully added to the database
         return str(collection.inserted_id)
     return None
@@ -82,35 +167,40 @@ def add_subtopic(name, questions_answers, keywords):
     :param keywords
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Subtopics
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
     subtopic_details = {
         "name": name,
         "questions_answers": questions_answers,
         "keywords": keywords,
     }
     collection = db.COVIDChatbot_Subtopics.insert_one(subtopic_details)
+    bump_knowledge_base_version()
     if str(collection.inserted_id) != "":  # if the request is successfully added to the database
         return str(collection.inserted_id)
     return None
 
 
-def add_question_answer(question, answer, more_details, keywords):
+def add_question_answer(question, answer, more_details, keywords, paraphrases=None):
     """
     add new question/answer into db
     :param question: question
     :param answer: answer for the question
     :param more_details: more details including links, videos, etc
     :param keywords: keywords of the question
+    :param paraphrases: paraphrases of the question (optional - they are only kept in the rules if not given)
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_QAs
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
     subtopic_details = {
         "question": question,
         "answer": answer,
         "keywords": keywords,
         "more_details": more_details,
     }
+    if paraphrases is not None:
+        subtopic_details["paraphrases"] = paraphrases
     collection = db.COVIDChatbot_QAs.insert_one(subtopic_details)
+    bump_knowledge_base_version()
     if str(collection.inserted_id) != "":  # if the request is successfully added to the database
         return str(collection.inserted_id)
     return None
@@ -121,20 +211,52 @@ def get_topics():
     get list of topics
     :return: topics object
     """
-    db = mongo_client.COVIDChatbot_Topics
+    return topics_cache.get_or_load(ALL_TOPICS_KEY, __find_topics)
+
+
+def __find_topics():
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     query_result = db.COVIDChatbot_Topics.find()
     if query_result is not None:
         return list(query_result)
     return None
 
 
+def get_subtopics():
+    """
+    get list of subtopics
+    :return: subtopics objects
+    """
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
+    query_result = db.COVIDChatbot_Subtopics.find()
+    if query_result is not None:
+        return list(query_result)
+    return None
+
+
+def get_questions_answers():
+    """
+    get list of questions/answers
+    :return: questions/answers objects
+    """
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
+    query_result = db.COVIDChatbot_QAs.find()
+    if query_result is not None:
+        return list(query_result)
+    return None
+
+
 def get_topic(id):
     """
     find topic with given id
     :param id: id of topic
     :return: topic object if the id, None if topic does not exist
     """
-    db = mongo_client.COVIDChatbot_Topics
+    return topics_cache.get_or_load(str(id), lambda: __find_topic(id))
+
+
+def __find_topic(id):
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     query_result = db.COVIDChatbot_Topics.find_one({"_id": ObjectId(str(id))})
     if query_result is not None:
         return query_result
@@ -147,7 +269,11 @@ def get_subtopic(id):
     :param id: id of subtopic
     :return: subtopic object if the id, None if subtopic does not exist
     """
-    db = mongo_client.COVIDChatbot_Subtopics
+    return subtopics_cache.get_or_load(str(id), lambda: __find_subtopic(id))
+
+
+def __find_subtopic(id):
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
     query_result = db.COVIDChatbot_Subtopics.find_one({"_id": ObjectId(str(id))})
     if query_result is not None:
         return query_result
@@ -160,7 +286,11 @@ def get_question_answer(id):
     :param id: id of question/answer
     :return: question/answer object if the id, None if topic does not exist
     """
-    db = mongo_client.COVIDChatbot_QAs
+    return questions_answers_cache.get_or_load(str(id), lambda: __find_question_answer(id))
+
+
+def __find_question_answer(id):
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
     query_result = db.COVIDChatbot_QAs.find_one({"_id": ObjectId(str(id))})
     if query_result is not None:
         return query_result
@@ -175,7 +305,7 @@ def update_topic(id, subtopics=None, keywords=None):
     :param keywords
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Topics
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     if subtopics is not None and keywords is not None:
         query_result = db.COVIDChatbot_Topics.update_one({"_id": ObjectId(str(id))},
                                                          {
@@ -202,7 +332,10 @@ def update_topic(id, subtopics=None, keywords=None):
                                                              }
                                                          },
                                                          upsert=False)
+    topics_cache.invalidate(str(id))
+    topics_cache.invalidate(ALL_TOPICS_KEY)
     if query_result.modified_count > 0:
+        bump_knowledge_base_version()
         return True
     return False
 
@@ -215,7 +348,7 @@ def update_subtopic(id, questions_answers=None, keywords=None):
     :param keywords
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Subtopics
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
     if questions_answers is not None and keywords is not None:
         query_result = db.COVIDChatbot_Subtopics.update_one({"_id": ObjectId(str(id))},
                                                             {
@@ -242,37 +375,98 @@ def update_subtopic(id, questions_answers=None, keywords=None):
                                                                 }
                                                             },
                                                             upsert=False)
+    subtopics_cache.invalidate(str(id))
     if query_result.modified_count > 0:
+        bump_knowledge_base_version()
         return True
     return False
 
 
+def update_question_answer(id, question=None, answer=None, more_details=None, keywords=None, paraphrases=None):
+    """
+    update question/answer, only the given fields are changed
+    :param id: id of question/answer
+    :param question: question
+    :param answer: answer for the question
+    :param more_details: more details including links, videos, etc
+    :param keywords: keywords of the question
+    :param paraphrases: paraphrases of the question
+    :return: True if the operation is successful, False if an error happens
+    """
+    fields = {"question": question, "answer": answer, "more_details": more_details, "keywords": keywords,
+              "paraphrases": paraphrases}
+    fields = {field: value for field, value in fields.items() if value is not None}
+    if len(fields) == 0:
+        return False
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
+    query_result = db.COVIDChatbot_QAs.update_one({"_id": ObjectId(str(id))}, {"$set": fields}, upsert=False)
+    questions_answers_cache.invalidate(str(id))
+    if query_result.modified_count > 0:
+        bump_knowledge_base_version()
+        return True
+    return False
+
+
+def delete_question_answer(id):
+    """
+    delete question/answer
+    :param id: id of question/answer
+    :return: True if the operation is successful, False if an error happens
+    """
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
+    query_result = db.COVIDChatbot_QAs.delete_one({"_id": ObjectId(str(id))})
+    questions_answers_cache.invalidate(str(id))
+    if query_result.deleted_count > 0:
+        bump_knowledge_base_version()
+        return True
+    return False
+
+
+def __load_blacklist():
+    """
+    load phone numbers of blacklisted users into memory (again every registry_refresh_interval seconds)
+    :return: set of phone numbers
+    """
+    global blacklisted_numbers, blacklist_loaded_at
+    if __is_registry_stale(blacklist_loaded_at):
+        with blacklist_lock:
+            if __is_registry_stale(blacklist_loaded_at):
+                db = client_controller.get_mongo_client().COVIDChatbot_Misconduct
+                if blacklisted_numbers is None:
+                    db.COVIDChatbot_Misconduct.create_index("phone_number")
+                query_result = db.COVIDChatbot_Misconduct.find({}, {"phone_number": 1, "_id": 0})
+                blacklisted_numbers = set(user["phone_number"] for user in query_result)
+                blacklist_loaded_at = time.monotonic()
+                logger.debug("Loaded {} blacklisted users".format(len(blacklisted_numbers)))
+    return blacklisted_numbers
+
+
 def add_user_to_blacklist(phone_number):
     """
     add user number to the blacklist, this user misbehaved
     :param phone_number: user phone number
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Misconduct
+    db = client_controller.get_mongo_client().COVIDChatbot_Misconduct
     user_details = {
         "phone_number": "{}".format("+" + phone_number if not phone_number.startswith("+") else phone_number),
     }
     collection = db.COVIDChatbot_Misconduct.insert_one(user_details)
     if str(collection.inserted_id) != "":  # if the request is successfully added to the database
+        __load_blacklist().add(user_details["phone_number"])
         return str(collection.inserted_id)
     return False
 
 
 def check_user_in_blacklist(phone_number):
     """
-    check if user is in the blacklist
+    check if user is in the blacklist (in-memory lookup, no query is sent to mongodb)
     :param phone_number: user phone number
-    :return: user object if the id, None if user does not exist
+    :return: user phone number if user is in the blacklist, None if user does not exist
     """
-    db = mongo_client.COVIDChatbot_Misconduct
-    query_result = db.COVIDChatbot_Misconduct.find_one({"phone_number": "{}".format("+" + phone_number if not phone_number.startswith("+") else phone_number)})
-    if query_result is not None:
-        return query_result
+    phone_number = "{}".format("+" + phone_number if not phone_number.startswith("+") else phone_number)
+    if phone_number in __load_blacklist():
+        return phone_number
     return None
 
 
@@ -281,7 +475,7 @@ def get_handover_volunteers():
     get list of volunteers to answer users' queries (handover phone numbers, and language they can speak)
     :return: list of volunteers, None if no volunteer registered
     """
-    db = mongo_client.COVIDChatbot_HandoverNumbers
+    db = client_controller.get_mongo_client().COVIDChatbot_HandoverNumbers
     query_result = db.COVIDChatbot_HandoverNumbers.find()
     if query_result is not None:
         return list(query_result)
@@ -293,7 +487,11 @@ def get_handover_volunteers_by_language(language):
     get list of volunteers to answer users' queries for given language
     :return: list of volunteers, None if no volunteer registered
     """
-    db = mongo_client.COVIDChatbot_HandoverNumbers
+    return volunteers_cache.get_or_load(language, lambda: __find_handover_volunteers_by_language(language))
+
+
+def __find_handover_volunteers_by_language(language):
+    db = client_controller.get_mongo_client().COVIDChatbot_HandoverNumbers
     query_result = db.COVIDChatbot_HandoverNumbers.find({"languages": language})
     if query_result is not None:
         return list(query_result)
@@ -306,7 +504,7 @@ def get_volunteer_details(phone_number):
     :param phone_number: volunteer's phone number
     :return: volunteer as object, None if volunteer's number does not exist
     """
-    db = mongo_client.COVIDChatbot_HandoverNumbers
+    db = client_controller.get_mongo_client().COVIDChatbot_HandoverNumbers
     query_result = db.COVIDChatbot_HandoverNumbers.find_one({"phone_number": "{}".format("+" + phone_number if not phone_number.startswith("+") else phone_number)})
     if query_result is not None:
         return query_result
@@ -322,7 +520,7 @@ def add_handover_volunteer(full_name, phone_number, languages):
     :return: True if the operation is successful, None if an error happens
     """
     if get_volunteer_details(phone_number) is None:
-        db = mongo_client.COVIDChatbot_HandoverNumbers
+        db = client_controller.get_mongo_client().COVIDChatbot_HandoverNumbers
         handover_request_details = {
             "full_name": full_name,
             "phone_number": "{}".format("+" + phone_number if not phone_number.startswith("+") else phone_number),
@@ -330,6 +528,7 @@ def add_handover_volunteer(full_name, phone_number, languages):
             "num_users_answered": 0
         }
         collection = db.COVIDChatbot_HandoverNumbers.insert_one(handover_request_details)
+        volunteers_cache.clear()  # the volunteer may speak several languages
         if str(collection.inserted_id) != "":  # if the request is successfully added to the database
             return "Volunteer id: {}".format(str(collection.inserted_id))
         return None
@@ -337,6 +536,72 @@ def add_handover_volunteer(full_name, phone_number, languages):
         return "This number is already registered to the list of volunteers!"
 
 
+def upsert_handover_volunteers(volunteers):
+    """
+    add volunteers to the handover list, or update the name and languages of registered volunteers, with one
+    unordered bulk write (a failed volunteer does not stop the others)
+    :param volunteers: list of volunteers, each one is a dictionary with "full_name", "phone_number" (normalized) and
+    "languages"
+    :return: list of (status, error) in the order of volunteers, status is "inserted", "updated" or "error"
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    if len(volunteers) == 0:
+        return []
+    operations = [UpdateOne({"phone_number": volunteer["phone_number"]},
+                            {
+                                "$set": {
+                                    "full_name": volunteer["full_name"],
+                                    "languages": volunteer["languages"],
+                                },
+                                "$setOnInsert": {
+                                    "num_users_answered": 0,
+                                }
+                            },
+                            upsert=True) for volunteer in volunteers]
+    db = client_controller.get_mongo_client().COVIDChatbot_HandoverNumbers
+    try:
+        details = db.COVIDChatbot_HandoverNumbers.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as err:
+        details = err.details
+    volunteers_cache.clear()  # volunteers may speak several languages
+    results = [("updated", None)] * len(volunteers)
+    for upserted in details.get("upserted", []):
+        results[upserted["index"]] = ("inserted", None)
+    for write_error in details.get("writeErrors", []):
+        results[write_error["index"]] = ("error", write_error.get("errmsg"))
+    return results
+
+
+def __load_handover_requests():
+    """
+    load the active (WAITING/OPEN) handover requests into memory (again every registry_refresh_interval seconds)
+    :return: active handover requests, keyed by user number
+    """
+    global active_handover_requests, handover_requests_loaded_at
+    if __is_registry_stale(handover_requests_loaded_at):
+        with handover_lock:
+            if __is_registry_stale(handover_requests_loaded_at):
+                db = client_controller.get_mongo_client().COVIDChatbot_HandoverRequests
+                if active_handover_requests is None:
+                    db.COVIDChatbot_HandoverRequests.create_index([("user_number", 1), ("status", 1)])
+                query_result = db.COVIDChatbot_HandoverRequests.find({"status": {"$in": ["WAITING", "OPEN"]}})
+                active_handover_requests = {handover_request["user_number"]: handover_request
+                                            for handover_request in query_result}
+                handover_requests_loaded_at = time.monotonic()
+                logger.debug("Loaded {} active handover requests".format(len(active_handover_requests)))
+    return active_handover_requests
+
+
+def __unregister_handover_request(user_number):
+    """
+    remove a handover request from the active handover requests
+    :param user_number: user phone number
+    """
+    __load_handover_requests().pop(user_number, None)
+
+
 def add_handover_request(user_phone_number, language):
     """
     add user's handover request to the waiting list
@@ -344,20 +609,23 @@ def add_handover_request(user_phone_number, language):
     :param language: language of user
     :return: True if the operation is successful, None if an error happens
     """
-    handover_request = get_handover_request(user_phone_number) # check to see if any handover request from the user is still in the stack
-    if handover_request is None:
-        db = mongo_client.COVIDChatbot_HandoverRequests
-        handover_request_details = {
-            "user_number": "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number),
-            "language": language,
-            "volunteer_number": None,
-            "status": "WAITING"
-        }
-        collection = db.COVIDChatbot_HandoverRequests.insert_one(handover_request_details)
-        if str(collection.inserted_id) != "":  # if the request is successfully added to the database
-            return str(collection.inserted_id)
-    else:
-        return str(handover_request["_id"])
+    with handover_lock:
+        handover_request = get_handover_request(user_phone_number) # check to see if any handover request from the user is still in the stack
+        if handover_request is None:
+            db = client_controller.get_mongo_client().COVIDChatbot_HandoverRequests
+            handover_request_details = {
+                "user_number": "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number),
+                "language": language,
+                "volunteer_number": None,
+                "status": "WAITING"
+            }
+            collection = db.COVIDChatbot_HandoverRequests.insert_one(handover_request_details)
+            if str(collection.inserted_id) != "":  # if the request is successfully added to the database
+                handover_request_details["_id"] = collection.inserted_id
+                __load_handover_requests()[handover_request_details["user_number"]] = handover_request_details
+                return str(collection.inserted_id)
+        else:
+            return str(handover_request["_id"])
 
 
 def accept_handover_request(user_phone_number, handovered_phone_number):
@@ -367,18 +635,27 @@ def accept_handover_request(user_phone_number, handovered_phone_number):
     :param handovered_phone_number: phone number of person who accepted to answer user's queries
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_HandoverRequests
-    query_result = db.COVIDChatbot_HandoverRequests.update_one({"user_number": "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)},
-                                                               {
-                                                                   "$set": {
-                                                                       "volunteer_number": "{}".format("+" + handovered_phone_number if not handovered_phone_number.startswith("+") else handovered_phone_number),
-                                                                       "status": "OPEN"
-                                                                   }
-                                                               },
-                                                               upsert=False)
-    if query_result.modified_count > 0:
-        return True
-    return False
+    user_number = "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)
+    volunteer_number = "{}".format("+" + handovered_phone_number if not handovered_phone_number.startswith("+") else handovered_phone_number)
+    with handover_lock:
+        handover_request = get_handover_request(user_number)
+        if handover_request is None:
+            return False
+        db = client_controller.get_mongo_client().COVIDChatbot_HandoverRequests
+        query_result = db.COVIDChatbot_HandoverRequests.update_one({"_id": handover_request["_id"]},
+                                                                   {
+                                                                       "$set": {
+                                                                           "volunteer_number": volunteer_number,
+                                                                           "status": "OPEN"
+                                                                       }
+                                                                   },
+                                                                   upsert=False)
+        if query_result.modified_count > 0:
+            __unregister_handover_request(user_number)
+            handover_request = dict(handover_request, volunteer_number=volunteer_number, status="OPEN")
+            __load_handover_requests()[user_number] = handover_request
+            return True
+        return False
 
 
 def close_handover_request(user_phone_number):
@@ -387,17 +664,23 @@ def close_handover_request(user_phone_number):
     :param user_phone_number: user phone number
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_HandoverRequests
-    query_result = db.COVIDChatbot_HandoverRequests.update_one({"user_number": "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)},
-                                                               {
-                                                                   "$set": {
-                                                                       "status": "CLOSE"
-                                                                   }
-                                                               },
-                                                               upsert=False)
-    if query_result.modified_count > 0:
-        return True
-    return False
+    user_number = "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)
+    with handover_lock:
+        handover_request = get_handover_request(user_number)
+        if handover_request is None:
+            return False
+        db = client_controller.get_mongo_client().COVIDChatbot_HandoverRequests
+        query_result = db.COVIDChatbot_HandoverRequests.update_one({"_id": handover_request["_id"]},
+                                                                   {
+                                                                       "$set": {
+                                                                           "status": "CLOSE"
+                                                                       }
+                                                                   },
+                                                                   upsert=False)
+        if query_result.modified_count > 0:
+            __unregister_handover_request(user_number)
+            return True
+        return False
 
 
 def reopen_handover_request(user_phone_number):
@@ -406,35 +689,82 @@ def reopen_handover_request(user_phone_number):
     :param user_phone_number: user phone number
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_HandoverRequests
-    query_result = db.COVIDChatbot_HandoverRequests.update_one({"user_number": "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)},
-                                                               {
-                                                                   "$set": {
-                                                                       "status": "OPEN"
-                                                                   }
-                                                               },
-                                                               upsert=False)
-    if query_result.modified_count > 0:
-        return True
-    return False
+    user_number = "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)
+    with handover_lock:
+        db = client_controller.get_mongo_client().COVIDChatbot_HandoverRequests
+        handover_request = db.COVIDChatbot_HandoverRequests.find_one({"user_number": user_number},
+                                                                     sort=[("_id", -1)])  # latest request of user
+        if handover_request is None:
+            return False
+        query_result = db.COVIDChatbot_HandoverRequests.update_one({"_id": handover_request["_id"]},
+                                                                   {
+                                                                       "$set": {
+                                                                           "status": "OPEN"
+                                                                       }
+                                                                   },
+                                                                   upsert=False)
+        if query_result.modified_count > 0:
+            __unregister_handover_request(user_number)
+            handover_request["status"] = "OPEN"
+            __load_handover_requests()[user_number] = handover_request
+            return True
+        return False
 
 
 def get_handover_request(user_phone_number):
     """
-    get user handover request
+    get user's active (WAITING/OPEN) handover request from the in-memory registry
     :param user_phone_number: user phone number
     :return: user request object if phone number exist, None if phone  number does not exist
     """
-    db = mongo_client.COVIDChatbot_HandoverRequests
-    query_result = db.COVIDChatbot_HandoverRequests.find_one({
-        "$and": [
-            {"user_number": "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)},
-            {
-                "$or": [{"status": "WAITING"},
-                        {'status': "OPEN"}]
-            }
-        ]
-    })
+    user_number = "{}".format("+" + user_phone_number if not user_phone_number.startswith("+") else user_phone_number)
+    return __load_handover_requests().get(user_number)
+
+
+def save_user_session(user_id, topic, language):
+    """
+    persist user's conversation session (topic) when it is evicted from memory
+    :param user_id: user id
+    :param topic: current conversation topic of user
+    :param language: language of the conversation
+    :return: True if the operation is successful, False if an error happens
+    """
+    db = client_controller.get_mongo_client().COVIDChatbot_Sessions
+    query_result = db.COVIDChatbot_Sessions.update_one({"user_id": user_id, "language": language},
+                                                       {
+                                                           "$set": {
+                                                               "topic": topic,
+                                                           }
+                                                       },
+                                                       upsert=True)
+    if query_result.modified_count > 0 or query_result.upserted_id is not None:
+        return True
+    return False
+
+
+def get_user_session(user_id, language):
+    """
+    get user's persisted conversation session
+    :param user_id: user id
+    :param language: language of the conversation
+    :return: session object if user's session is persisted, None if it is not
+    """
+    db = client_controller.get_mongo_client().COVIDChatbot_Sessions
+    query_result = db.COVIDChatbot_Sessions.find_one({"user_id": user_id, "language": language})
     if query_result is not None:
         return query_result
     return None
+
+
+def delete_user_session(user_id, language):
+    """
+    delete user's persisted conversation session
+    :param user_id: user id
+    :param language: language of the conversation
+    :return: True if the operation is successful, False if the session does not exist
+    """
+    db = client_controller.get_mongo_client().COVIDChatbot_Sessions
+    query_result = db.COVIDChatbot_Sessions.delete_one({"user_id": user_id, "language": language})
+    if query_result.deleted_count > 0:
+        return True
+    return False
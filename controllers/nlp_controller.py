@@ -1,8 +1,11 @@
-import requests
 import os
+import time
 import logging
-import configparser
 import re
+import requests
+from controllers import client_controller
+from controllers import concurrency_controller
+from controllers import settings_controller
 
 logger = logging.getLogger("NLP Controller")
 logger.setLevel(logging.INFO)
@@ -13,65 +16,101 @@ formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s
 log_file_handler.setFormatter(formatter)
 logger.addHandler(log_file_handler)
 
-# load configs from config.ini file
-config = configparser.ConfigParser(inline_comment_prefixes="#")
-config.read(os.path.join(os.path.dirname(__file__), "..", "config.ini"))
-stanford_nlp_settings = config["STANFORD_CORNLP"]
+settings = settings_controller.settings
 
 try:
-    logging.info("Loading config settings")
-    if "address" not in stanford_nlp_settings or stanford_nlp_settings["address"] == "":
-        raise Exception("Stanford CoreNLP server address is not defined.")
-    else:
-        nlp_server_address = stanford_nlp_settings["address"]
-    if "port" not in stanford_nlp_settings or stanford_nlp_settings["port"] == "":
-        nlp_server_port = None
-        logging.warning("Stanford CoreNLP server port is not defined.")
-    else:
-        nlp_server_port = stanford_nlp_settings["port"]
-    if "path" not in stanford_nlp_settings or stanford_nlp_settings["path"] == "":
-        raise Exception("Stanford CoreNLP server path is not defined.")
-    else:
-        nlp_server_path = stanford_nlp_settings["path"]
-    logging.info("Config settings loaded successfully")
+    settings.require("STANFORD_CORNLP")
+    nlp_server_address = settings.get("STANFORD_CORNLP", "address")
+    nlp_server_port = settings.get("STANFORD_CORNLP", "port")
+    nlp_server_path = settings.get("STANFORD_CORNLP", "path")
+    nlp_server_timeout = settings.get("STANFORD_CORNLP", "timeout_ms") / 1000.0
+    latency_slo_ms = settings.get("STANFORD_CORNLP", "latency_slo_ms")
+    failure_threshold = settings.get("STANFORD_CORNLP", "failure_threshold")
+    reset_timeout = settings.get("STANFORD_CORNLP", "reset_timeout")
 
 except Exception as e:
     logging.error(str(e))
     exit()
 
+if nlp_server_address and nlp_server_port:
+    nlp_server_url = "{}:{}{}".format(nlp_server_address, nlp_server_port, nlp_server_path)
+else:
+    nlp_server_url = "{}{}".format(nlp_server_address, nlp_server_path)
+
 with open(os.path.join(os.path.dirname(__file__), "..", "utils/english_stopwords.txt"), "r") as myfile:
-    english_stopwords = myfile.read().split(",")
+    english_stopwords = frozenset(word.strip().lower() for word in myfile.read().split(",") if word.strip())
+
+# requests are not sent while the NLP server fails or is too slow, messages are answered by rules only meanwhile
+circuit_breaker = concurrency_controller.CircuitBreaker(failure_threshold,
+                                                        latency_slo_ms / 1000.0 if latency_slo_ms is not None else None,
+                                                        reset_timeout)
+
+
+class NLPUnavailableError(Exception):
+    """
+    the NLP server failed (e.g. timeout, connection or server error), or it is not called because it failed (or was
+    too slow) recently
+    """
+
+
+SPECIAL_CHARACTERS_PATTERN = re.compile(r"[^\w\s]+")  # everything except letters, digits, underscores and spaces
+KEYWORD_POS_TAGS = frozenset({"NN", "JJ", "NNP", "NNS", "NNPS", "VB", "VBN", "VBZ", "VBP", "VBG"})
+EXCLUDED_LEMMAS = frozenset({"be", "have"})
+
+
+def normalize_text(text, lowercase=False):
+    """
+    remove special characters (punctuations, emojis, etc.) from a text in a single pass
+    :param text: a sentence/string (or utf-8 bytes)
+    :param lowercase: True to lowercase the text as well
+    :return: normalized text
+    """
+    if not isinstance(text, str):
+        text = text.decode("utf-8")
+    text = SPECIAL_CHARACTERS_PATTERN.sub("", text)
+    return text.lower() if lowercase else text
 
 
 def __post_request_nlpserver(query):
     """
     Send HTTP POST request to NLP server with json body
+    :param query: normalized text (see normalize_text)
     :return: json formatted result
     """
-    # first, concatenate all sentences
-    if isinstance(query, str):
-        query = query.replace(".", " ").replace("(", "").replace(")", "").replace(",", " ")
-    else:
-        query = query.decode("utf-8").replace(".", " ").replace("(", "").replace(")", "").replace(",", " ")
-    if nlp_server_address and nlp_server_port:
-        # second, call the nlp server
-        nlp_server_response = requests.post("{}:{}{}".format(nlp_server_address, nlp_server_port, nlp_server_path),
-                                            data=query)
-    else:
-        # second, call the nlp server
-        nlp_server_response = requests.post("{}{}".format(nlp_server_address, nlp_server_path), data=query)
-    if nlp_server_response.status_code != 200:
-        raise Exception(nlp_server_response.content)
-    return nlp_server_response.json()
-
-def extract_special_characters(query):
-    regex = r"(\w|\s)*"
-    matches = re.finditer(regex, query, re.DOTALL)
-    newstr = ''
-    for matchNum, match in enumerate(matches):
-        matchNum = matchNum + 1
-        newstr = newstr + match.group()
-    return newstr
+    if not circuit_breaker.allow_request():
+        raise NLPUnavailableError("Stanford CoreNLP server is unavailable")
+    start = time.perf_counter()
+    try:
+        nlp_server_response = client_controller.get_nlp_session().post(nlp_server_url, data=query.encode("utf-8"),
+                                                                       timeout=nlp_server_timeout)
+        if nlp_server_response.status_code != 200:
+            raise NLPUnavailableError(nlp_server_response.content)
+        result = nlp_server_response.json()
+    except NLPUnavailableError:
+        circuit_breaker.record_failure()
+        raise
+    except (requests.RequestException, ValueError) as e:  # ValueError: response is not json
+        circuit_breaker.record_failure()
+        raise NLPUnavailableError(str(e)) from e
+    circuit_breaker.record_success(time.perf_counter() - start)
+    return result
+
+
+def is_available():
+    """
+    check if the NLP server can be called (its circuit breaker is not open)
+    :return: True if the NLP server can be called, False if messages should be answered by rules only
+    """
+    return not circuit_breaker.is_open()
+
+
+def get_statistics():
+    """
+    get statistics of requests to the NLP server
+    :return: statistics as dictionary
+    """
+    return circuit_breaker.get_statistics()
+
 
 def extract_keywords(query):
     """
@@ -79,18 +118,18 @@ def extract_keywords(query):
     :param query: a sentence/string
     :return: list of keywords
     """
-    nlp_server_response = __post_request_nlpserver(extract_special_characters(query))
+    nlp_server_response = __post_request_nlpserver(normalize_text(query))
     keywords = []
 
     for sentence in nlp_server_response['sentences']:
         for token in sentence['tokens']:
-            if token['pos'] in {'NN', 'JJ', 'NNP', 'NNS', 'NNPS', 'VB', 'VBN', 'VBZ', 'VBP', 'VBG'}:
+            if token['pos'] in KEYWORD_POS_TAGS:
                 if not token["lemma"].lower() in english_stopwords:
-                    if not token['lemma'] in {'be', 'have'}:
+                    if not token['lemma'] in EXCLUDED_LEMMAS:
                         keywords.append(token['lemma'])
     return keywords
 
 
 def annotate_expression(expression):
-    nlp_server_response = __post_request_nlpserver(extract_special_characters(expression).lower().replace('?', ''))
+    nlp_server_response = __post_request_nlpserver(normalize_text(expression, lowercase=True))
     return nlp_server_response['sentences'][0]['tokens']
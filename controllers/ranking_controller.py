@@ -0,0 +1,84 @@
+import math
+
+
+class BM25Index:
+    """
+    in-memory BM25 index of documents described by keywords (topics, subtopics, questions/answers), document
+    frequencies and length norms are precomputed so that scoring a query only walks the postings of its keywords
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        """
+        :param k1: term frequency saturation
+        :param b: document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.__postings = {}  # keyword -> {document id: precomputed weight of keyword in document}
+        self.__documents = {}  # document id -> keywords
+        self.average_length = 0.0
+
+    def build(self, documents):
+        """
+        build the index
+        :param documents: dictionary of document id -> list of keywords
+        """
+        self.__documents = {document_id: [keyword.lower() for keyword in keywords]
+                            for document_id, keywords in documents.items()}
+        self.__reweight()
+
+    def add(self, document_id, keywords):
+        """
+        add/replace a document, statistics of the whole index are recomputed
+        :param document_id: id of document
+        :param keywords: list of keywords
+        """
+        self.__documents[document_id] = [keyword.lower() for keyword in keywords]
+        self.__reweight()
+
+    def remove(self, document_id):
+        """
+        remove a document, statistics of the whole index are recomputed
+        :param document_id: id of document
+        """
+        if self.__documents.pop(document_id, None) is not None:
+            self.__reweight()
+
+    def __reweight(self):
+        number_of_documents = len(self.__documents)
+        term_frequencies = {}  # keyword -> {document id: term frequency}
+        total_length = 0
+        for document_id, keywords in self.__documents.items():
+            total_length += len(keywords)
+            for keyword in keywords:
+                frequencies = term_frequencies.setdefault(keyword, {})
+                frequencies[document_id] = frequencies.get(document_id, 0) + 1
+        self.average_length = float(total_length) / number_of_documents if number_of_documents > 0 else 0.0
+
+        postings = {}
+        for keyword, frequencies in term_frequencies.items():
+            document_frequency = len(frequencies)
+            idf = math.log(1.0 + (number_of_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+            postings[keyword] = {}
+            for document_id, frequency in frequencies.items():
+                length_norm = 1.0 - self.b + self.b * len(self.__documents[document_id]) / self.average_length
+                postings[keyword][document_id] = idf * frequency * (self.k1 + 1.0) / (frequency + self.k1 * length_norm)
+        self.__postings = postings  # swap the whole postings, so readers never see a half-built index
+
+    def score(self, query_keywords, document_ids=None):
+        """
+        score documents which match at least one of the query keywords
+        :param query_keywords: keywords of query
+        :param document_ids: only score these documents (all documents if None)
+        :return: dictionary of document id -> BM25 score
+        """
+        postings = self.__postings
+        scores = {}
+        for keyword in set(keyword.lower() for keyword in query_keywords):
+            for document_id, weight in postings.get(keyword, {}).items():
+                if document_ids is None or document_id in document_ids:
+                    scores[document_id] = scores.get(document_id, 0.0) + weight
+        return scores
+
+    def __len__(self):
+        return len(self.__documents)
@@ -1,11 +1,13 @@
 import os
+import time
 import logging
-import inflect
-import uuid
-from rivescript import RiveScript
+import hashlib
 from controllers import mongo_controller
 from controllers import nlp_controller
 from controllers import handover_controller
+from controllers import brain_controller
+from controllers import semantic_controller
+from controllers import analytics_controller
 
 logger = logging.getLogger("Rule Controller")
 logger.setLevel(logging.INFO)
@@ -16,17 +18,98 @@ formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s
 log_file_handler.setFormatter(formatter)
 logger.addHandler(log_file_handler)
 
-# load number to word converter
-num2word = inflect.engine()
-
-bot = RiveScript()
-bot.load_directory(
-    os.path.join(os.path.dirname(__file__), "..", "brain/rules")
-)
-bot.sort_replies()
-
-
-def __generate_rule_pattern(annotated_expression):
+# words of menu option numbers (a menu has at most 5 options)
+NUMBER_WORDS = ("zero", "one", "two", "three", "four", "five")
+
+
+def __number_to_words(number):
+    return NUMBER_WORDS[number] if number < len(NUMBER_WORDS) else str(number)
+
+
+def __get_menu_topic(prefix, parent_topic, ids):
+    """
+    get the name of a generated menu topic, it is addressed by its content (the topic it returns to and the ordered ids
+    of its options), so the same menu is generated once and shared by all users it is suggested to
+    :param prefix: prefix of topic (e.g. "choose_question")
+    :param parent_topic: topic the user returns to when the reply is not an option of the menu
+    :param ids: ordered ids of options (questions/answers or subtopics)
+    :return: name of topic
+    """
+    content = "{}|{}".format(parent_topic, "|".join(str(id) for id in ids))
+    return "{}_{}".format(prefix, hashlib.sha1(content.encode("utf-8")).hexdigest()[:20])
+
+
+def __reply(brain, user_id, message):
+    """
+    get reply of the brain for the user's message
+    :param brain: brain of user's language
+    :param user_id: id of user
+    :param message: user's message
+    :return: reply
+    """
+    with brain.lock:
+        brain.sort_rules()  # rules added by earlier messages are sorted once
+        return brain.bot.reply(user_id, message)
+
+
+def __reply_in_topic(brain, user_id, message, topic):
+    """
+    get reply of the brain for the user's message in the given topic, the user stays in the current topic
+    :param brain: brain of user's language
+    :param user_id: id of user
+    :param message: user's message
+    :param topic: topic to match the message in
+    :return: reply
+    """
+    with brain.lock:
+        brain.sort_rules()
+        current_topic = brain.bot.get_uservar(user_id, "topic")
+        brain.bot.set_uservar(user_id, "topic", topic)
+        reply = brain.bot.reply(user_id, message)
+        brain.bot.set_uservar(user_id, "topic", current_topic)
+        return reply
+
+
+def __is_in_main_topic(brain, user_id):
+    """
+    check if user is not in the middle of a conversation (e.g. choosing a suggested question or talking to a human)
+    :param brain: brain of user's language
+    :param user_id: id of user
+    :return: True if user is in the main topic, False if user is not
+    """
+    with brain.lock:
+        return brain.bot.get_uservar(user_id, "topic") in {"random", "undefined", None}
+
+
+def __match_question_answer_rule(brain, user_id, message):
+    """
+    match the user's message against the compiled question/answer rules, only when user is not in the middle of a
+    conversation (e.g. choosing a suggested question or talking to a human), a hand-written rule which RiveScript
+    sorts first is left to RiveScript
+    :param brain: brain of user's language
+    :param user_id: id of user
+    :param message: user's message
+    :return: id of question/answer, None if no question/answer rule matches the message
+    """
+    if not __is_in_main_topic(brain, user_id):
+        return None
+    matched = brain.trigger_index.match_trigger(message)
+    if matched is None:
+        return None
+    qa_id, pattern = matched
+    with brain.lock:
+        if brain.matches_earlier_rule(user_id, message, pattern):
+            return None
+        brain.record_reply(user_id, message, qa_id, pattern)  # the turn is in the history as if RiveScript replied
+    return qa_id
+
+
+def generate_rule_pattern(annotated_expression):
+    """
+    generate the RiveScript trigger of a question
+    :param annotated_expression: annotated question (see nlp_controller.annotate_expression)
+    :return: trigger
+    """
     rule = []
     for tokenItem in annotated_expression:
         if tokenItem['pos'] in {'MD', 'PRP', 'PRP$', 'RB'}:
@@ -46,9 +129,9 @@ def __generate_rule_pattern(annotated_expression):
     return generated_pattern
 
 
-def __check_rule_pattern(topic, pattern):
+def __check_rule_pattern(brain, topic, pattern):
     try:
-        datafile = open(os.path.join(os.path.dirname(__file__), "..", "brain/rules", "%s.rive" % topic))
+        datafile = open(os.path.join(brain.rules_directory, "%s.rive" % topic))
         found = False
         for line in datafile:
             if '+ %s' % pattern in line:
@@ -60,91 +143,129 @@ def __check_rule_pattern(topic, pattern):
         return False
 
 
-def __add_temporary_conversational_rule(topic,
+def __annotate_question(query):
+    """
+    annotate the user's question for the rule of a generated menu
+    :param query: user's question
+    :return: annotated question, None if the NLP server is unavailable (the menu is generated without a rule for the
+    question)
+    """
+    try:
+        return nlp_controller.annotate_expression(query)
+    except nlp_controller.NLPUnavailableError as e:
+        logger.warning("Question is not annotated, NLP server is unavailable: {}".format(str(e)))
+        return None
+
+
+def __add_temporary_conversational_rule(brain,
+                                        topic,
                                         annotated_user_question,
                                         chatbot_question,
                                         main_conversation_id,
                                         subtopic_conversation_id,
                                         conditions):
+    with brain.lock:
+        return __write_temporary_conversational_rule(brain,
+                                                     topic,
+                                                     annotated_user_question,
+                                                     chatbot_question,
+                                                     main_conversation_id,
+                                                     subtopic_conversation_id,
+                                                     conditions)
+
+
+def __write_temporary_conversational_rule(brain,
+                                          topic,
+                                          annotated_user_question,
+                                          chatbot_question,
+                                          main_conversation_id,
+                                          subtopic_conversation_id,
+                                          conditions):
     if annotated_user_question is not None:
-        rule_pattern = __generate_rule_pattern(annotated_user_question)
-        is_pattern_exist = __check_rule_pattern(topic, rule_pattern)
+        rule_pattern = generate_rule_pattern(annotated_user_question)
+        is_pattern_exist = __check_rule_pattern(brain, topic, rule_pattern)
         if is_pattern_exist:  # rule is already added
             return False
     else:
         rule_pattern = None
 
-    with open(os.path.join(os.path.dirname(__file__), "..", "brain/rules", "%s.rive" % topic), "a") as myfile:
-        if rule_pattern is not None:
-            myfile.write("+ %s\n" % rule_pattern)
-            myfile.write("- %s {topic=%s}\n\n" % (chatbot_question, subtopic_conversation_id))
+    if subtopic_conversation_id in brain.generated_topics:  # the same menu was generated for an earlier question
+        conditions = None
+    if rule_pattern is None and conditions is None:
+        return False
 
-        if conditions is not None:
-            myfile.write("> topic %s\n\n" % subtopic_conversation_id)
-            for condition in conditions:
-                myfile.write("  + %s \n" % condition['user_answer'])
-                myfile.write("  - ^Recursive=%s\n\n" % condition['chatbot_answer'])
+    rules = []
+    if rule_pattern is not None:
+        rules.append("+ %s\n" % rule_pattern)
+        rules.append("- %s {topic=%s}\n\n" % (chatbot_question, subtopic_conversation_id))
 
-            myfile.write("  + *\n")
-            myfile.write("  - ^Return-to-Maintopic=<star>{topic=%s}\n\n" % main_conversation_id)
+    if conditions is not None:
+        brain.generated_topics.add(subtopic_conversation_id)
+        rules.append("> topic %s\n\n" % subtopic_conversation_id)
+        for condition in conditions:
+            rules.append("  + %s \n" % condition['user_answer'])
+            rules.append("  - ^Recursive=%s\n\n" % condition['chatbot_answer'])
 
-            myfile.write("< topic\n\n")
+        rules.append("  + *\n")
+        rules.append("  - ^Return-to-Maintopic=<star>{topic=%s}\n\n" % main_conversation_id)
 
+        rules.append("< topic\n\n")
+
+    rules = "".join(rules)
+    with open(os.path.join(brain.rules_directory, "%s.rive" % topic), "a") as myfile:
+        myfile.write(rules)  # in one write, a brain being refreshed reads whole rules
+
+    brain.add_rules(rules)  # the running brain is not reloaded, triggers are sorted before the next reply
+    brain.invalidate_answers()  # remembered unanswerable messages may match the new rule
     return True
 
 
-def suggest_topics(query):
+def suggest_topics(knowledge_base, query):
     query_keywords = nlp_controller.extract_keywords(query)
     if query_keywords:
-        query_keywords = list(set(query_keywords))  # remove duplications
+        query_keywords = list(set(knowledge_base.correct_keywords(query_keywords)))  # fix typos, remove duplications
         if query_keywords:
-            topics = mongo_controller.get_topics()
+            topics = knowledge_base.get_topics()
+            topics_scores = knowledge_base.topics_index.score(query_keywords)  # BM25 scores
             candidate_topics = []
             for topic in topics:
-                matched_keywords = 0
-                for keyword in query_keywords:
-                    if keyword.lower() in topic["keywords"]:
-                        matched_keywords += 1
-                if matched_keywords > 0:
+                if str(topic["_id"]) in topics_scores:
                     candidate_topics.append(
-                        {"matched_keywords_ratio": round((float(matched_keywords) / len(query_keywords)), 2),
+                        {"score": round(topics_scores[str(topic["_id"])], 4),
                          "name": topic["name"],
                          "id": str(topic["_id"])})
             if candidate_topics:
-                most_similar_topic = max(candidate_topics, key=lambda topic: topic["matched_keywords_ratio"])
-                if most_similar_topic["matched_keywords_ratio"] != 0.0:
+                most_similar_topic = max(candidate_topics, key=lambda topic: topic["score"])
+                if most_similar_topic["score"] != 0.0:
                     selected_topics = [most_similar_topic]
                     for topic in candidate_topics:
-                        if topic["matched_keywords_ratio"] == most_similar_topic["matched_keywords_ratio"] and topic[
+                        if topic["score"] == most_similar_topic["score"] and topic[
                             "id"] != most_similar_topic["id"]:
                             selected_topics.append(topic)
                     return selected_topics, query_keywords
     return None, None
 
 
-def suggest_subtopics(topics, query_keywords):
+def suggest_subtopics(knowledge_base, topics, query_keywords):
     candidate_subtopics = []
+    subtopics_scores = knowledge_base.subtopics_index.score(query_keywords)  # BM25 scores
     for topic in topics:
         topic_object = mongo_controller.get_topic(topic["id"])
         for subtopic_id in topic_object["subtopics"]:
-            matched_keywords = 0
-            subtopic_object = mongo_controller.get_subtopic(subtopic_id)
-            for keyword in query_keywords:
-                if keyword.lower() in subtopic_object["keywords"]:
-                    matched_keywords += 1
-            if matched_keywords > 0:
+            if str(subtopic_id) in subtopics_scores:
+                subtopic_object = mongo_controller.get_subtopic(subtopic_id)
                 candidate_subtopics.append(
-                    {"matched_keywords_ratio": round((float(matched_keywords) / len(query_keywords)), 2),
+                    {"score": round(subtopics_scores[str(subtopic_id)], 4),
                      "subtopic_name": subtopic_object["name"],
                      "subtopic_id": subtopic_id,
                      "topic_name": topic["name"],
                      "topic_id": topic["id"]})
     if candidate_subtopics:
-        most_similar_subtopic = max(candidate_subtopics, key=lambda subtopic: subtopic["matched_keywords_ratio"])
-        if most_similar_subtopic["matched_keywords_ratio"] != 0.0:
+        most_similar_subtopic = max(candidate_subtopics, key=lambda subtopic: subtopic["score"])
+        if most_similar_subtopic["score"] != 0.0:
             selected_subtopics = [most_similar_subtopic]
             for subtopic in candidate_subtopics:
-                if subtopic["matched_keywords_ratio"] == most_similar_subtopic["matched_keywords_ratio"] and \
+                if subtopic["score"] == most_similar_subtopic["score"] and \
                         subtopic[
                             "subtopic_id"] != most_similar_subtopic["subtopic_id"]:
                     selected_subtopics.append(subtopic)
@@ -152,19 +273,16 @@ def suggest_subtopics(topics, query_keywords):
     return None
 
 
-def suggest_questions(subtopics, query_keywords):
+def suggest_questions(knowledge_base, subtopics, query_keywords):
     candidate_questions = []
+    questions_answers_scores = knowledge_base.questions_answers_index.score(query_keywords)  # BM25 scores
     for subtopic in subtopics:
         subtopic_object = mongo_controller.get_subtopic(subtopic["subtopic_id"])
         for qa_id in subtopic_object["questions_answers"]:
-            matched_keywords = 0
-            question_answer_object = mongo_controller.get_question_answer(qa_id)
-            for keyword in query_keywords:
-                if keyword.lower() in question_answer_object["keywords"]:
-                    matched_keywords += 1
-            if matched_keywords > 0:
+            if str(qa_id) in questions_answers_scores:
+                question_answer_object = mongo_controller.get_question_answer(qa_id)
                 candidate_questions.append(
-                    {"matched_keywords_ratio": round((float(matched_keywords) / len(query_keywords)), 2),
+                    {"score": round(questions_answers_scores[str(qa_id)], 4),
                      "question_text": question_answer_object["question"],
                      "question_id": qa_id,
                      "subtopic_name": subtopic["subtopic_name"],
@@ -172,11 +290,11 @@ def suggest_questions(subtopics, query_keywords):
                      "topic_name": subtopic["topic_name"],
                      "topic_id": subtopic["topic_id"]})
     if candidate_questions:
-        most_similar_question = max(candidate_questions, key=lambda question: question["matched_keywords_ratio"])
-        if most_similar_question["matched_keywords_ratio"] != 0.0:
+        most_similar_question = max(candidate_questions, key=lambda question: question["score"])
+        if most_similar_question["score"] != 0.0:
             selected_questions = [most_similar_question]
             for question in candidate_questions:
-                if question["matched_keywords_ratio"] == most_similar_question["matched_keywords_ratio"] and \
+                if question["score"] == most_similar_question["score"] and \
                         question[
                             "question_id"] != most_similar_question["question_id"]:
                     selected_questions.append(question)
@@ -196,10 +314,10 @@ def suggest_questions(subtopics, query_keywords):
     return None
 
 
-def find_suggestions(query):
-    suggested_topics, query_keywords = suggest_topics(query)
+def find_suggestions(knowledge_base, query):
+    suggested_topics, query_keywords = suggest_topics(knowledge_base, query)
     if suggested_topics:
-        suggested_subtopics, query_keywords = suggest_subtopics(suggested_topics, query_keywords)
+        suggested_subtopics, query_keywords = suggest_subtopics(knowledge_base, suggested_topics, query_keywords)
         if not suggested_subtopics:
             return {
                 "confused": True,
@@ -208,7 +326,7 @@ def find_suggestions(query):
                 "questions": []
             }
         else:
-            suggested_subtopics, suggested_questions = suggest_questions(suggested_subtopics,
+            suggested_subtopics, suggested_questions = suggest_questions(knowledge_base, suggested_subtopics,
                                                                          query_keywords)  # overwrite suggested subtopics after finalizing suggested questions
             if not suggested_questions:
                 return {
@@ -232,6 +350,31 @@ def find_suggestions(query):
             "questions": suggested_questions
         }
     else:
+        topic_ids = set(str(topic["_id"]) for topic in knowledge_base.get_topics())
+        suggested_questions = []
+        for question in semantic_controller.find_similar_questions(query):  # keywords did not match, try paraphrases
+            # questions/answers deleted or edited since the semantic index was built are not suggested as they were
+            question_text = knowledge_base.get_question(str(question["question_id"]))
+            if str(question["topic_id"]) in topic_ids and question_text is not None:
+                suggested_questions.append(dict(question, question_text=question_text))
+        if suggested_questions:
+            suggested_topics = []
+            suggested_subtopics = []
+            for question in suggested_questions:
+                if not any(topic["id"] == question["topic_id"] for topic in suggested_topics):
+                    suggested_topics.append({"name": question["topic_name"],
+                                             "id": question["topic_id"]})
+                if not any(subtopic["subtopic_id"] == question["subtopic_id"] for subtopic in suggested_subtopics):
+                    suggested_subtopics.append({"subtopic_name": question["subtopic_name"],
+                                                "subtopic_id": question["subtopic_id"],
+                                                "topic_name": question["topic_name"],
+                                                "topic_id": question["topic_id"]})
+            return {
+                "confused": len(suggested_subtopics) > 1,
+                "topics": suggested_topics,
+                "subtopics": suggested_subtopics,
+                "questions": suggested_questions
+            }
         return {
             "confused": True,
             "topics": [],
@@ -240,40 +383,90 @@ def find_suggestions(query):
         }
 
 
-def answer_question(user_id, query):
+def answer_question(user_id, query, language=brain_controller.default_language):
+    """
+    answer the user's message with the brain of its language
+    :param user_id: id of user
+    :param query: user's message
+    :param language: language code of the message (e.g. "en")
+    :return: answer, None if the message is passed to a human
+    """
+    start = time.perf_counter()
+    turn = {  # analytics of the turn, filled while the message is answered
+        "timestamp": time.time(),
+        "user": analytics_controller.hash_user(user_id),
+        "language": language,
+        "query": analytics_controller.get_recorded_query(query),
+        "question_answer_id": None,
+        "suggestion": False,
+        "confusion": False,
+        "no_answer": False,
+        "cached_no_answer": False,
+        "handover": None,
+        "degraded": False,
+        "error": True,
+    }
+    try:
+        with brain_controller.use_brain(language) as brain:
+            brain.session_storage.load(user_id)  # mongodb is not called by RiveScript while the brain is locked
+            try:
+                chatbot_response = __answer_question(brain, user_id, query, turn)
+            finally:
+                brain.session_storage.persist_evicted()
+        turn["error"] = False
+        return chatbot_response
+    finally:
+        turn["latency_ms"] = 1000 * (time.perf_counter() - start)
+        analytics_controller.record_turn(turn)  # written by a background thread
+
+
+def __answer_question(brain, user_id, query, turn):
     suggestion = False  # indicator that shows chatbot found some similar questions to the given user question
     confusion = False  # indicator that shows chatbot is confused between two or more subtopics for the given user question
     chatbot_response = None
 
-    # TODO check whether user is in the blacklist because of misbehaviour
-    # output_result = mongo_controller.check_user_in_blacklist(user_id.replace("+", "")) # check if user phone number is in the blacklist because of misbehaviour
-    # if output_result is not None:
-    #     return "Unfortunately, I'm not allowed to talk to you...😔"
-    bot.load_directory(
-        os.path.join(os.path.dirname(__file__), "..", "brain/rules")
-    )
-    bot.sort_replies()
-    reply = bot.reply(user_id, query)
+    output_result = mongo_controller.check_user_in_blacklist(user_id)  # check if user phone number is in the blacklist because of misbehaviour
+    if output_result is not None:
+        return "Unfortunately, I'm not allowed to talk to you...😔"
+
+    # a message which got no answer in the main topic gets no answer again until rules or the knowledge base change,
+    # NLP and suggestion search are skipped
+    in_main_topic = __is_in_main_topic(brain, user_id)
+    normalized_query = " ".join(nlp_controller.normalize_text(query, lowercase=True).split())
+    rules_version = brain.rules_version
+    if in_main_topic and brain.unanswerable_queries.get(normalized_query) is not None:
+        turn["no_answer"] = turn["cached_no_answer"] = True
+        return "I don't know the answer of your question 🧐"
+
+    reply = __match_question_answer_rule(brain, user_id, query)
+    if reply is None:  # not a question/answer rule, let RiveScript match hand-written and conversational rules
+        reply = __reply(brain, user_id, query)
 
     # first check, if user's reply is another question, it's not any of the shown options (suggested questions, subtopics)
     while reply.startswith(
             "^Return-to-Maintopic="):  # pass the question to the upper *topic(s)* in generated conversation rules
         recursive_question = reply.split("^Return-to-Maintopic=")[1]
-        reply = bot.reply(user_id, recursive_question)  # ask the question again
+        reply = __reply(brain, user_id, recursive_question)  # ask the question again
 
     if reply.startswith("^Recursive="):  # reply is a chosen option
         recursive_question = reply.split("^Recursive=")[1]
         if "(*)" not in reply:
-            recursive_topic = bot.get_uservar(user_id, "topic")
-            bot.set_uservar(user_id, "topic", "random")
-            reply = bot.reply(user_id,
-                              recursive_question)  # ask bot the question associated to the option chosen by user
-            bot.set_uservar(user_id, "topic", recursive_topic)
+            reply = __reply_in_topic(brain, user_id, recursive_question,
+                                     "random")  # ask bot the question associated to the option chosen by user
         else:
             reply = recursive_question
 
     if "No Reply" in reply:  # if chatbot cannot match any pattern with user question
-        suggestion_result = find_suggestions(query)  # check for any suggestion (subtopics, questions)
+        # while the NLP server is down (or too slow), messages are answered by rules only, without suggestions
+        suggestion_result = {"confused": False, "topics": [], "subtopics": [], "questions": []}
+        if nlp_controller.is_available():
+            try:
+                suggestion_result = find_suggestions(brain.knowledge_base, query)  # check for any suggestion (subtopics, questions)
+            except nlp_controller.NLPUnavailableError as e:
+                logger.warning("Suggestions are skipped, NLP server is unavailable: {}".format(str(e)))
+                turn["degraded"] = True
+        else:
+            turn["degraded"] = True
 
         # check if the chatbot found two or more relevant subtopics for the question asked by user
         if suggestion_result["confused"]:
@@ -285,7 +478,8 @@ def answer_question(user_id, query):
                         subtopic = {
                             "id": question["subtopic_id"],
                             "name": question["subtopic_name"],
-                            "questions": [question["question_text"]]
+                            "questions": [question["question_text"]],
+                            "question_ids": [str(question["question_id"])]
                         }
                         topic_object = {
                             "id": question["topic_id"],
@@ -299,11 +493,13 @@ def answer_question(user_id, query):
                                 subtopic_found = True
                                 if question["question_text"] not in subtopic["questions"]:
                                     subtopic["questions"].append(question["question_text"])
+                                    subtopic["question_ids"].append(str(question["question_id"]))
                         if not subtopic_found:
                             subtopic = {
                                 "id": question["subtopic_id"],
                                 "name": question["subtopic_name"],
-                                "questions": [question["question_text"]]
+                                "questions": [question["question_text"]],
+                                "question_ids": [str(question["question_id"])]
                             }
                             topic_object['subtopics'].append(subtopic)
 
@@ -316,11 +512,15 @@ def answer_question(user_id, query):
                              enumerate(topic_object["subtopics"])][:3])
                         chatbot_question = "{}#*#{}. Get answer from a human".format(chatbot_question,
                                                                            len(topic_object["subtopics"]) + 1 if len(topic_object["subtopics"]) < 4 else 4)
-                        main_conversation_id = "choose_subtopic_{}".format(str(uuid.uuid4()))
+                        main_conversation_id = __get_menu_topic(
+                            "choose_subtopic", "random",
+                            ["{}:{}".format(subtopic["id"], ",".join(subtopic["question_ids"][:4]))
+                             for subtopic in topic_object["subtopics"][:3]])
 
                         __add_temporary_conversational_rule(
+                            brain,
                             topic="live_conversations",
-                            annotated_user_question=nlp_controller.annotate_expression(query),
+                            annotated_user_question=__annotate_question(query),
                             chatbot_question=chatbot_question,
                             main_conversation_id="random",
                             subtopic_conversation_id=main_conversation_id,
@@ -330,7 +530,8 @@ def answer_question(user_id, query):
                     main_conversation_conditions = []
                     for subtopic_index, subtopic in enumerate(topic_object["subtopics"][:3]):
                         subtopic_conversation_conditions = []
-                        subtopic_conversation_id = "choose_question_{}".format(str(uuid.uuid4()))
+                        subtopic_conversation_id = __get_menu_topic("choose_question", main_conversation_id,
+                                                                    subtopic["question_ids"][:4])
 
                         if len(subtopic["questions"]) > 1:
                             chatbot_subtopic_question = "(*)".join(
@@ -347,18 +548,19 @@ def answer_question(user_id, query):
                         for question_index, question in enumerate(subtopic["questions"][:4]):
                             subtopic_conversation_conditions.append(
                                 {"user_answer": "[*]({}|{})[*]".format(question_index + 1,
-                                                                       num2word.number_to_words(question_index + 1)),
+                                                                       __number_to_words(question_index + 1)),
                                  "chatbot_answer": question})
 
                         # add option for talk to human
                         subtopic_conversation_conditions.append(
                             {"user_answer": "[*]({}|{})[*]".format(len(subtopic["questions"]) + 1 if len(subtopic["questions"]) < 5 else 5,
-                                                                   num2word.number_to_words(
+                                                                   __number_to_words(
                                                                        len(subtopic["questions"]) + 1 if len(subtopic["questions"]) < 5 else 5)),
                              "chatbot_answer": "%s {topic=%s}" % ("Get answer from a human",
                                                                   "user_initiate_handover")})
 
                         __add_temporary_conversational_rule(
+                            brain,
                             topic="live_conversations",
                             annotated_user_question=None,
                             chatbot_question=None,
@@ -369,7 +571,7 @@ def answer_question(user_id, query):
 
                         main_conversation_conditions.append(
                             {"user_answer": "[*]({}|{}|{})[*]".format(subtopic_index + 1,
-                                                                      num2word.number_to_words(subtopic_index + 1),
+                                                                      __number_to_words(subtopic_index + 1),
                                                                       subtopic["name"].lower()
                                                                       ),
                              "chatbot_answer": "%s {topic=%s}" % (chatbot_subtopic_question,
@@ -377,7 +579,7 @@ def answer_question(user_id, query):
 
                     main_conversation_conditions.append(
                         {"user_answer": "[*]({}|{}|{})[*]".format(len(topic_object["subtopics"]) + 1 if len(topic_object["subtopics"]) < 4 else 4,
-                                                                  num2word.number_to_words(
+                                                                  __number_to_words(
                                                                       len(topic_object["subtopics"]) + 1 if len(topic_object["subtopics"]) < 4 else 4),
                                                                   "get answer from a human|talk to [a] human|talk to [a] person"
                                                                   ),
@@ -385,6 +587,7 @@ def answer_question(user_id, query):
                                                               "user_initiate_handover")})
                     if main_conversation_id is not None:
                         __add_temporary_conversational_rule(
+                            brain,
                             topic="live_conversations",
                             annotated_user_question=None,
                             chatbot_question=None,
@@ -393,12 +596,7 @@ def answer_question(user_id, query):
                             conditions=main_conversation_conditions
                         )
 
-                    bot.load_directory(
-                        os.path.join(os.path.dirname(__file__), "..", "brain/rules")
-                    )
-
-                    bot.sort_replies()
-                    reply = bot.reply(user_id, query)
+                    reply = __reply(brain, user_id, query)
 
                     if "(*)" in reply:  # chatbot found some similar questions
                         suggestion = True
@@ -406,7 +604,9 @@ def answer_question(user_id, query):
                         confusion = True
         else:  # chatbot is not confused, but it found some similar questions to suggest user (these similar questions are all under one subtopic)
             if len(suggestion_result["questions"]) > 0:
-                main_conversation_id = "choose_question_{}".format(str(uuid.uuid4()))
+                main_conversation_id = __get_menu_topic(
+                    "choose_question", "random",
+                    [str(question_answer["question_id"]) for question_answer in suggestion_result["questions"][:4]])
                 if len(suggestion_result["questions"]) > 1:
                     chatbot_question = "(*)".join(
                         ["{}. {}".format(index + 1, question_answer["question_text"]) for index, question_answer in
@@ -423,34 +623,30 @@ def answer_question(user_id, query):
                 for index, question_answer in enumerate(suggestion_result["questions"][:4]):
                     main_conversation_conditions.append(
                         {"user_answer": "[*]({}|{})[*]".format(index + 1,
-                                                               num2word.number_to_words(index + 1)
+                                                               __number_to_words(index + 1)
                                                                ),
                          "chatbot_answer": question_answer["question_text"]})
 
                 # add option for talk to human
                 main_conversation_conditions.append(
                     {"user_answer": "[*]({}|{})[*]".format(len(suggestion_result["questions"]) + 1,
-                                                           num2word.number_to_words(
+                                                           __number_to_words(
                                                                len(suggestion_result["questions"]) + 1 if len(suggestion_result["questions"]) < 5 else 5)),
                      "chatbot_answer": "%s {topic=%s}" % ("Get answer from a human",
                                                           "user_initiate_handover")
                      })
 
                 __add_temporary_conversational_rule(
+                    brain,
                     topic="live_conversations",
-                    annotated_user_question=nlp_controller.annotate_expression(query),
+                    annotated_user_question=__annotate_question(query),
                     chatbot_question=chatbot_question,
                     main_conversation_id="random",
                     subtopic_conversation_id=main_conversation_id,
                     conditions=main_conversation_conditions
                 )
 
-                bot.load_directory(
-                    os.path.join(os.path.dirname(__file__), "..", "brain/rules")
-                )
-
-                bot.sort_replies()
-                reply = bot.reply(user_id, query)
+                reply = __reply(brain, user_id, query)
                 if "(*)" in reply:  # chatbot found some similar questions
                     suggestion = True
     else:
@@ -458,16 +654,13 @@ def answer_question(user_id, query):
         while reply.startswith(
                 "^Return-to-Maintopic="):  # pass the question to the upper *topic(s)* in generated conversation rules
             recursive_question = reply.split("^Return-to-Maintopic=")[1]
-            reply = bot.reply(user_id, recursive_question)  # ask the question again
+            reply = __reply(brain, user_id, recursive_question)  # ask the question again
 
         if reply.startswith("^Recursive="):  # reply is a chosen option
             recursive_question = reply.split("^Recursive=")[1]
             if "(*)" not in reply:
-                recursive_topic = bot.get_uservar(user_id, "topic")
-                bot.set_uservar(user_id, "topic", "random")
-                reply = bot.reply(user_id,
-                                  recursive_question)  # ask bot the question associated to the option chosen by user
-                bot.set_uservar(user_id, "topic", recursive_topic)
+                reply = __reply_in_topic(brain, user_id, recursive_question,
+                                         "random")  # ask bot the question associated to the option chosen by user
             else:
                 reply = recursive_question
 
@@ -478,9 +671,14 @@ def answer_question(user_id, query):
 
     # now, the chatbot decides what an answer to the user's question should be
     # an answer, suggested question(s), or ask for clarification about relevant subtopic(s)
+    turn["suggestion"] = suggestion
+    turn["confusion"] = confusion
 
     if "No Reply" in reply:  # chatbot could not understand user's question, meaning that it couldn't find any relevant subtopic nor any similar question.
         chatbot_response = "I don't know the answer of your question 🧐"
+        turn["no_answer"] = True
+        if in_main_topic and not turn["degraded"]:  # suggestions may answer it when the NLP server is back
+            brain.add_unanswerable_query(normalized_query, rules_version)
 
     elif confusion:  # chatbot is confused between two or more subtopics, needs to ask for clarification from user
         chatbot_response = ["Can you tell me 🤓 which of these *topic* your question is about 👇:\n\n"]
@@ -515,10 +713,13 @@ def answer_question(user_id, query):
         chatbot_response = "".join(chatbot_response)  # put everything in one single sentence
 
     elif reply.startswith("^User-Handover-Request"):  # user wants to get answer from a human
+        turn["handover"] = "request"
         chatbot_response = reply.split("=")[1]
-        user_language = "English"
-        handover_request = mongo_controller.add_handover_request(user_id,
-                                                                 user_language)  # for now all users require to talk in English
+        from pycountry import languages  # pycountry loads its database on import, it is only needed for handovers
+
+        language = languages.get(alpha_2=brain.language)
+        user_language = language.name if language is not None else brain.language  # volunteers' languages are names (e.g. "English")
+        handover_request = mongo_controller.add_handover_request(user_id, user_language)
 
         # find volunteers who can speak in user's language
         handover_volunteers = mongo_controller.get_handover_volunteers_by_language(user_language)
@@ -529,6 +730,7 @@ def answer_question(user_id, query):
             handover_message = "Talk to user {}".format(user_id)
             handover_controller.notify_handover_volunteer(handover_message, volunteer["phone_number"])
     elif reply.startswith("^User-Handover-Continue"):  # user continues talking to the human
+        turn["handover"] = "continue"
         handover_request = mongo_controller.get_handover_request(user_id)
         if handover_request["status"] == "WAITING":
             chatbot_response = "You need to wait ⏳, all our team members are busy answering others.\nI will let you know as soon as someone accepts the conversation 😊"
@@ -540,6 +742,7 @@ def answer_question(user_id, query):
             handover_controller.notify_handover_volunteer(handover_message, handover_request["volunteer_number"])
 
     elif reply.startswith("^User-Handover-Closed"):  # user wants to end the handover and talk to the chatbot
+        turn["handover"] = "closed"
         chatbot_response = reply.split("=")[1]
         handover_request = mongo_controller.get_handover_request(user_id)
         mongo_controller.close_handover_request(user_id)
@@ -548,6 +751,7 @@ def answer_question(user_id, query):
             handover_controller.notify_handover_volunteer(handover_message, handover_request["volunteer_number"])
 
     elif reply.startswith("^Human-Handover-Accepted"):  # human accepts to talk to the user
+        turn["handover"] = "accepted"
         recipient_id = reply.split("=")[2]
         handover_request = mongo_controller.get_handover_request(recipient_id)
 
@@ -561,6 +765,7 @@ def answer_question(user_id, query):
             handover_controller.notify_user("Hi, you are now talking to a human 👨🏻‍💻...\nHow can I help?",
                                             recipient_id)
     elif reply.startswith("^Human-Handover-Answer"):  # human continues talking to the user
+        turn["handover"] = "answer"
         try:
             query = query.replace("HANDOVER RESPONSE", "").strip()
             query = query.replace("User: ", "").strip()
@@ -593,37 +798,12 @@ def answer_question(user_id, query):
             ), user_id)
     elif any(i.isdigit() for i in
              reply):  # chatbot could match user's question with a rule, therefore it has an answer, check to see if the reply is an id of QA in mongodb
-        query_result = mongo_controller.get_question_answer(reply)
-        chatbot_response = [query_result["answer"]]
-        answer_details = query_result["more_details"]
-
-        if len(answer_details) > 0:
-            chatbot_response.append("\n\n*More Details:* \n")
-            if isinstance(answer_details, list):
-                for index, link in enumerate(answer_details):
-                    if link.endswith(("png", "jpg", "jpeg")):
-                        chatbot_response.append("Image: _{}_\n".format(link))
-                    elif "youtube" in link or link.endswith(("mkv", "mov", "mp4")):
-                        chatbot_response.append("Video: _{}_\n".format(link))
-                    elif link.endswith(("pdf")):
-                        chatbot_response.append("PDF: _{}_\n".format(link))
-                    elif link.endswith(("doc", "docx")):
-                        chatbot_response.append("Document: _{}_\n".format(link))
-                    else:
-                        chatbot_response.append("WebPage: _{}_\n".format(link))
-            elif isinstance(answer_details, str):
-                if answer_details.endswith(("png", "jpg", "jpeg")):
-                    chatbot_response.append("Image: _{}_\n".format(answer_details))
-                elif "youtube" in answer_details or answer_details.endswith(("mkv", "mov", "mp4")):
-                    chatbot_response.append("Video: _{}_\n".format(answer_details))
-                elif answer_details.endswith(("pdf")):
-                    chatbot_response.append("PDF: _{}_\n".format(answer_details))
-                elif answer_details.endswith(("doc", "docx")):
-                    chatbot_response.append("_Document: _{}_\n".format(answer_details))
-                else:
-                    chatbot_response.append("WebPage: _{}_\n".format(answer_details))
-
-        chatbot_response = "".join(chatbot_response)
+        chatbot_response = brain.knowledge_base.get_rendered_answer(reply)  # answers are rendered once when the knowledge base is loaded
+        if chatbot_response is None:  # the question/answer of the rule does not exist anymore
+            chatbot_response = "I don't know the answer of your question 🧐"
+            turn["no_answer"] = True
+        else:
+            turn["question_answer_id"] = reply
     else:
         chatbot_response = reply
 
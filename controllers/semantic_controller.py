@@ -0,0 +1,213 @@
+import os
+import json
+import logging
+import threading
+from controllers import settings_controller
+
+logger = logging.getLogger("Semantic Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+settings = settings_controller.settings
+
+try:
+    settings.require("SEMANTIC")
+    model_path = settings.get("SEMANTIC", "model_path")
+    if model_path is None:
+        logger.warning("fastText model path is not defined, semantic retrieval is disabled.")
+    vectors_path = settings.get("SEMANTIC", "vectors_path")
+    index_path = settings.get("SEMANTIC", "index_path")
+    top_k = settings.get("SEMANTIC", "top_k")
+    min_similarity = settings.get("SEMANTIC", "min_similarity")
+
+except Exception as e:
+    logger.error(str(e))
+    exit()
+
+# fastText model, question vectors (memory-mapped) and their questions/answers, loaded on first use
+model = None
+question_vectors = None
+question_index = None
+load_lock = threading.Lock()
+is_loaded = False
+
+
+def load_model():
+    """
+    load the fastText model
+    :return: fastText model, None if fastText or the model is not available
+    """
+    if model_path is None or not os.path.exists(model_path):
+        return None
+    try:
+        import fasttext
+    except ImportError:
+        logger.warning("fastText is not installed, semantic retrieval is disabled.")
+        return None
+    return fasttext.load_model(model_path)
+
+
+def __load_index():
+    """
+    load the fastText model and the semantic index of questions (once per process)
+    :return: True if semantic retrieval is available, False if it is not
+    """
+    global model, question_vectors, question_index, is_loaded
+    if not is_loaded:
+        with load_lock:
+            if not is_loaded:
+                if os.path.exists(vectors_path) and os.path.exists(index_path):
+                    if model is None:
+                        model = load_model()
+                    if model is not None:
+                        import numpy
+                        vectors = numpy.load(vectors_path, mmap_mode="r")
+                        with open(index_path, "r") as index_file:
+                            index = json.load(index_file)
+                        if len(index) != vectors.shape[0]:  # one file is replaced by an import, the other is not yet
+                            logger.warning("Semantic index is being rebuilt, the previous index is used.")
+                            return model is not None and question_vectors is not None
+                        question_vectors, question_index = vectors, index
+                        logger.info("Loaded semantic index of {} questions".format(len(question_index)))
+                else:
+                    logger.warning("Semantic index is not built, semantic retrieval is disabled.")
+                is_loaded = True
+    return model is not None and question_vectors is not None
+
+
+def reload_index():
+    """
+    load the semantic index again on next use (e.g. it was rebuilt by an import), the fastText model is kept
+    """
+    global is_loaded
+    with load_lock:
+        is_loaded = False  # the previous index is used until the new one is loaded
+
+
+def get_sentence_vector(fasttext_model, sentence):
+    """
+    get the (unit length) sentence vector of a text, average of its word vectors
+    :param fasttext_model: fastText model
+    :param sentence: text
+    :return: vector as numpy array
+    """
+    import numpy
+    vector = fasttext_model.get_sentence_vector(sentence.lower().replace("\n", " ").strip())
+    norm = numpy.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return vector.astype(numpy.float32)
+
+
+def __read_built_index(dimension, replaced_question_ids):
+    """
+    read the semantic index built by earlier imports (e.g. other files or languages)
+    :param dimension: dimension of vectors of the fastText model
+    :param replaced_question_ids: ids of questions/answers indexed again, their previous entries are dropped
+    :return: (kept entries, their vectors)
+    """
+    import numpy
+    if not os.path.exists(vectors_path) or not os.path.exists(index_path):
+        return [], numpy.zeros((0, dimension), dtype=numpy.float32)
+    vectors = numpy.load(vectors_path)
+    with open(index_path, "r") as index_file:
+        entries = json.load(index_file)
+    if vectors.ndim != 2 or vectors.shape[0] != len(entries) or vectors.shape[1] != dimension:
+        logger.warning("Semantic index does not match the fastText model, it is rebuilt from scratch.")
+        return [], numpy.zeros((0, dimension), dtype=numpy.float32)
+    rows = [row for row, entry in enumerate(entries) if entry["question_id"] not in replaced_question_ids]
+    return [entries[row] for row in rows], vectors[rows]
+
+
+def __replace_file(path, write, mode):
+    """
+    write a file next to its final path and move it in place, processes which memory-mapped the previous file keep
+    reading it
+    :param path: path of file
+    :param write: function that writes the content into an open file
+    :param mode: mode of the file ("w" or "wb")
+    """
+    temporary_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary_path, mode) as temporary_file:
+        write(temporary_file)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def build_semantic_index(fasttext_model, entries):
+    """
+    add questions to the semantic index and store it as a memory-mappable matrix, questions indexed by earlier
+    imports are kept (entries of the same questions/answers are replaced)
+    :param fasttext_model: fastText model
+    :param entries: list of questions, each one is a dictionary with "text", "question_text", "question_id",
+    "subtopic_name", "subtopic_id", "topic_name" and "topic_id"
+    :return: number of questions in the index
+    """
+    import numpy
+    dimension = fasttext_model.get_dimension()
+    kept_entries, kept_vectors = __read_built_index(dimension, set(entry["question_id"] for entry in entries))
+    vectors = numpy.zeros((len(kept_entries) + len(entries), dimension), dtype=numpy.float32)
+    vectors[:len(kept_entries)] = kept_vectors
+    for index, entry in enumerate(entries, len(kept_entries)):
+        vectors[index] = get_sentence_vector(fasttext_model, entry["text"])
+    entries = kept_entries + list(entries)
+    os.makedirs(os.path.dirname(vectors_path), exist_ok=True)
+    # running servers memory-map the vectors, the files are replaced instead of being truncated
+    __replace_file(vectors_path, lambda vectors_file: numpy.save(vectors_file, vectors), "wb")
+    __replace_file(index_path, lambda index_file: json.dump(entries, index_file), "w")
+    return len(entries)
+
+
+def search(query_vector, k, excluded_row=None):
+    """
+    find the nearest questions of a vector (cosine similarity)
+    :param query_vector: unit length vector
+    :param k: number of nearest questions
+    :param excluded_row: row of the index to skip (e.g. the query itself)
+    :return: list of (row, similarity) ordered by similarity
+    """
+    import numpy
+    similarities = numpy.asarray(question_vectors @ query_vector)
+    if excluded_row is not None:
+        similarities[excluded_row] = -1.0
+    k = min(k, len(similarities))
+    if k == 0:
+        return []
+    rows = numpy.argpartition(-similarities, k - 1)[:k]
+    rows = rows[numpy.argsort(-similarities[rows])]
+    return [(int(row), float(similarities[row])) for row in rows]
+
+
+def find_similar_questions(query):
+    """
+    find questions similar to the query, used when the keywords of the query do not match any question
+    :param query: user's question
+    :return: list of suggested questions (in the format of rule_controller.suggest_questions), [] if none is found
+    """
+    if not __load_index():
+        return []
+    query_vector = get_sentence_vector(model, query)
+    suggested_questions = []
+    for row, similarity in search(query_vector, top_k * 4):  # paraphrases of one question may be neighbours
+        if similarity < min_similarity:
+            break
+        entry = question_index[row]
+        if any(question["question_id"] == entry["question_id"] for question in suggested_questions):
+            continue
+        suggested_questions.append(
+            {"score": round(similarity, 4),
+             "question_text": entry["question_text"],
+             "question_id": entry["question_id"],
+             "subtopic_name": entry["subtopic_name"],
+             "subtopic_id": entry["subtopic_id"],
+             "topic_name": entry["topic_name"],
+             "topic_id": entry["topic_id"]})
+        if len(suggested_questions) == top_k:
+            break
+    return suggested_questions
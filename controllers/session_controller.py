@@ -0,0 +1,263 @@
+import sys
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+from rivescript.sessions import SessionManager
+from controllers import mongo_controller
+from controllers import settings_controller
+
+logger = logging.getLogger("Session Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+settings = settings_controller.settings
+
+try:
+    settings.require("SESSIONS")
+    max_sessions = settings.get("SESSIONS", "max_sessions")
+    idle_ttl = settings.get("SESSIONS", "idle_ttl")
+
+except Exception as e:
+    logger.error(str(e))
+    exit()
+
+DEFAULT_TOPIC = "random"
+
+
+class BoundedSessionStorage(SessionManager):
+    """
+    RiveScript session storage that keeps at most max_sessions users in memory, users idle for more than idle_ttl
+    seconds or least recently seen users are evicted, their topic is persisted and restored when they come back
+    mongodb is never called while a lock is held (RiveScript calls the storage while the brain lock is held): the
+    caller restores a session with load before the user's message is answered, and writes the topics of evicted
+    users with persist_evicted after it is answered
+    """
+
+    def __init__(self, max_sessions, idle_ttl, language, warn=None, *args, **kwargs):
+        """
+        :param max_sessions: maximum number of users kept in memory
+        :param idle_ttl: number of seconds a user can be idle before being evicted
+        :param language: language of the brain using the sessions (a user has one session per language)
+        """
+        self._fwarn = warn
+        self.language = language
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.__users = OrderedDict()  # user id -> user variables, ordered from least to most recently seen
+        self.__last_seen = {}  # user id -> last time user variables were accessed
+        self.__frozen = {}
+        self.__persisted = set()  # ids of resident users who have a persisted session
+        self.__evicted = OrderedDict()  # user id -> (topic, has persisted session) of evicted users, not written yet
+        self.__lock = threading.RLock()
+        self.evictions = 0
+        self.restorations = 0
+
+    def load(self, username):
+        """
+        restore the user's session if it is not in memory (its topic if it is evicted or persisted), must be called
+        before the user's message is answered and without holding the brain lock
+        :param username: id of user
+        """
+        with self.__lock:
+            if username in self.__users:
+                return
+            evicted = self.__evicted.get(username)
+        if evicted is None:
+            try:
+                persisted_session = mongo_controller.get_user_session(username, self.language)
+            except Exception as e:
+                logger.error("Session of user {} cannot be restored: {}".format(username, str(e)))
+                persisted_session = None
+            topic = persisted_session["topic"] if persisted_session is not None else None
+            is_persisted = persisted_session is not None
+        else:  # not written yet, mongodb may still have an older topic
+            topic, is_persisted = evicted
+            is_persisted = is_persisted or topic != DEFAULT_TOPIC
+        with self.__lock:
+            if username in self.__users:  # loaded by another thread meanwhile
+                return
+            if evicted is not None and self.__evicted.get(username) is evicted:
+                del self.__evicted[username]  # restored, persist_evicted would write the stale topic
+            session = self.__touch(username)
+            if is_persisted:
+                self.__persisted.add(username)
+            if topic is not None and topic != DEFAULT_TOPIC:
+                session["topic"] = topic
+                self.restorations += 1
+
+    def __touch(self, username):
+        """
+        get the user's session (a new session if it is not loaded), mark it as recently seen and evict
+        idle/least recently seen users
+        caller must hold the lock
+        :param username: id of user
+        :return: user variables
+        """
+        now = time.monotonic()
+        session = self.__users.get(username)
+        if session is None:
+            session = self.default_session()
+            self.__users[username] = session
+        else:
+            self.__users.move_to_end(username)
+        self.__last_seen[username] = now
+
+        # least recently seen users are at the front
+        while len(self.__users) > 1:
+            oldest_username = next(iter(self.__users))
+            if len(self.__users) <= self.max_sessions and now - self.__last_seen[oldest_username] <= self.idle_ttl:
+                break
+            self.__evict(oldest_username)
+        return session
+
+    def __evict(self, username):
+        """
+        remove user's session from memory, its topic is written by persist_evicted
+        caller must hold the lock
+        :param username: id of user
+        """
+        session = self.__users.pop(username)
+        del self.__last_seen[username]
+        is_persisted = username in self.__persisted
+        self.__persisted.discard(username)
+        self.__evicted[username] = (session.get("topic", DEFAULT_TOPIC), is_persisted)
+        self.__evicted.move_to_end(username)
+        self.evictions += 1
+
+    def persist_evicted(self):
+        """
+        write the topics of evicted users, persisted if user is in the middle of a conversation, must be called
+        without holding the brain lock
+        :return: number of written sessions
+        """
+        with self.__lock:
+            evicted = list(self.__evicted.items())
+        number_of_sessions = 0
+        for username, entry in evicted:
+            topic, is_persisted = entry
+            try:
+                if topic != DEFAULT_TOPIC:
+                    mongo_controller.save_user_session(username, topic, self.language)
+                elif is_persisted:
+                    mongo_controller.delete_user_session(username, self.language)
+            except Exception as e:
+                logger.error("Session of user {} cannot be persisted: {}".format(username, str(e)))
+                continue
+            number_of_sessions += 1
+            with self.__lock:
+                if self.__evicted.get(username) is entry:  # not evicted again meanwhile
+                    del self.__evicted[username]
+        return number_of_sessions
+
+    def set(self, username, vars):
+        with self.__lock:
+            session = self.__touch(username)
+            for key, value in vars.items():
+                if value is None:
+                    session.pop(key, None)
+                else:
+                    session[key] = value
+
+    def get(self, username, key, default="undefined"):
+        with self.__lock:
+            return self.__touch(username).get(key, default)
+
+    def get_any(self, username):
+        with self.__lock:
+            return copy.deepcopy(self.__touch(username))
+
+    def get_all(self):
+        with self.__lock:
+            return copy.deepcopy(dict(self.__users))
+
+    def reset(self, username):
+        with self.__lock:
+            self.__users.pop(username, None)
+            self.__last_seen.pop(username, None)
+            self.__persisted.discard(username)
+            self.__evicted[username] = (DEFAULT_TOPIC, True)  # the persisted session is deleted by persist_evicted
+
+    def reset_all(self):
+        with self.__lock:
+            self.__users = OrderedDict()
+            self.__last_seen = {}
+            self.__persisted = set()
+
+    def persist_all(self):
+        """
+        evict all users, their topics are persisted (e.g. before the brain is unloaded), must be called without
+        holding the brain lock
+        :return: number of evicted users
+        """
+        with self.__lock:
+            number_of_users = len(self.__users)
+            while self.__users:
+                self.__evict(next(iter(self.__users)))
+        self.persist_evicted()
+        return number_of_users
+
+    def freeze(self, username):
+        with self.__lock:
+            if username in self.__users:
+                self.__frozen[username] = copy.deepcopy(self.__users[username])
+            else:
+                self.warn("Can't freeze vars for user " + username + ": not found!")
+
+    def thaw(self, username, action="thaw"):
+        with self.__lock:
+            if username in self.__frozen:
+                if action == "thaw":
+                    self.__touch(username)
+                    self.__users[username] = self.__frozen.pop(username)
+                elif action == "discard":
+                    del self.__frozen[username]
+                elif action == "keep":
+                    self.__touch(username)
+                    self.__users[username] = copy.deepcopy(self.__frozen[username])
+                else:
+                    self.warn("Unsupported thaw action")
+            else:
+                self.warn("Can't thaw vars for user " + username + ": not found!")
+
+    def warn(self, message):
+        if self._fwarn is not None:
+            self._fwarn(message)
+        else:
+            logger.warning(message)
+
+    def __get_size(self, obj):
+        """
+        estimate the memory size of an object and the objects it contains
+        :param obj: object
+        :return: size in bytes
+        """
+        size = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            size += sum(self.__get_size(key) + self.__get_size(value) for key, value in obj.items())
+        elif isinstance(obj, (list, tuple, set)):
+            size += sum(self.__get_size(item) for item in obj)
+        return size
+
+    def get_statistics(self):
+        """
+        get statistics of the sessions kept in memory
+        :return: statistics as dictionary
+        """
+        with self.__lock:
+            return {
+                "resident_sessions": len(self.__users),
+                "resident_bytes": self.__get_size(self.__users),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "evictions": self.evictions,
+                "restorations": self.restorations,
+                "unwritten_evictions": len(self.__evicted),
+            }
+
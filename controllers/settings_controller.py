@@ -0,0 +1,166 @@
+import os
+import logging
+import configparser
+
+logger = logging.getLogger("Settings Controller")
+logger.setLevel(logging.INFO)
+# create file handler which logs even debug messages
+log_file_handler = logging.FileHandler("covid_chatbot.log")
+log_file_handler.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s - %(message)s")
+log_file_handler.setFormatter(formatter)
+logger.addHandler(log_file_handler)
+
+REPOSITORY_DIRECTORY = os.path.join(os.path.dirname(__file__), "..")
+CONFIG_PATH = os.path.join(REPOSITORY_DIRECTORY, "config.ini")
+
+REQUIRED = object()  # default of options which must be defined
+PATH = "path"  # type of options which are paths relative to the repository directory
+NO_DEFAULT_SECTION = "*"  # name of configparser default section, not used in config.ini
+
+# section -> option -> (type, default value, error message if it is required but not defined)
+OPTIONS = {
+    "DEFAULT": {
+        "address": (str, REQUIRED, "Server FQDN address is not defined."),
+        "port": (int, None, None),
+        "binding": (str, None, None),
+        "swagger_file_path": (str, REQUIRED, "Swagger file path is not defined."),
+        "swagger_url": (str, REQUIRED, "Swagger URL is not defined."),
+    },
+    "TWILIO": {
+        "account_sid": (str, REQUIRED, "Twilio Account Sid is not defined."),
+        "auth_token": (str, REQUIRED, "Twilio Auth Token is not defined."),
+        "phone_number": (str, REQUIRED, "Twilio sandbox phone number is not defined."),
+        "pool_size": (int, 10, None),
+    },
+    "MONGODB": {
+        "address": (str, REQUIRED, "Mongodb address is not defined."),
+        "port": (str, REQUIRED, "Mongodb port is not defined."),
+        "username": (str, None, None),
+        "password": (str, None, None),
+        "max_pool_size": (int, 100, None),
+    },
+    "STANFORD_CORNLP": {
+        "address": (str, REQUIRED, "Stanford CoreNLP server address is not defined."),
+        "port": (str, None, None),
+        "path": (str, REQUIRED, "Stanford CoreNLP server path is not defined."),
+        "pool_size": (int, 10, None),
+        "timeout_ms": (int, 5000, None),
+        "latency_slo_ms": (int, 1000, None),
+        "failure_threshold": (int, 5, None),
+        "reset_timeout": (float, 30.0, None),
+    },
+    "CACHE": {
+        "max_size": (int, 10000, None),
+        "ttl": (int, None, None),
+        "version_check_interval": (float, 5.0, None),
+        "registry_refresh_interval": (float, 5.0, None),
+    },
+    "WEBHOOK": {
+        "dedupe_max_size": (int, 100000, None),
+        "dedupe_ttl": (int, 86400, None),
+        "coalesce_window_ms": (int, 0, None),
+    },
+    "ADMISSION": {
+        "max_in_flight": (int, 32, None),
+        "max_waiting": (int, 64, None),
+        "queue_timeout_ms": (int, 2000, None),
+    },
+    "SESSIONS": {
+        "max_sessions": (int, 10000, None),
+        "idle_ttl": (int, 1800, None),
+    },
+    "SEMANTIC": {
+        "model_path": (PATH, None, None),
+        "vectors_path": (PATH, REQUIRED, "Semantic index vectors path is not defined."),
+        "index_path": (PATH, REQUIRED, "Semantic index path is not defined."),
+        "top_k": (int, 4, None),
+        "min_similarity": (float, 0.6, None),
+    },
+    "NEGATIVE_CACHE": {
+        "max_size": (int, 10000, None),
+        "ttl": (int, 600, None),
+    },
+    "ANALYTICS": {
+        "directory": (PATH, None, None),
+        "queue_size": (int, 10000, None),
+        "batch_size": (int, 500, None),
+        "flush_interval": (float, 5.0, None),
+        "format": (str, "parquet", None),
+        "user_key": (str, None, None),
+        "max_query_length": (int, 0, None),
+    },
+    "ADMIN": {
+        "api_key": (str, None, None),
+    },
+    "BRAINS": {
+        "default_language": (str, "en", None),
+        "max_loaded_brains": (int, 3, None),
+        "rules_budget_mb": (float, None, None),
+    },
+}
+
+
+class Settings:
+    """
+    settings of config.ini, parsed once per process, each module requires the sections it uses
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of config file
+        """
+        self.path = path
+        self.__values = {}  # (section, option) -> value
+        self.__errors = {}  # section -> errors of invalid or missing options
+        # [DEFAULT] is read as a regular section: configparser would copy its options (e.g. port) into every section
+        config = configparser.ConfigParser(inline_comment_prefixes="#", default_section=NO_DEFAULT_SECTION)
+        config.read(path)
+        logger.info("Loading config settings")
+        for section, options in OPTIONS.items():
+            errors = []
+            for option, (option_type, default, error) in options.items():
+                value = config.get(section, option, fallback="")
+                if value.strip() == "":
+                    if default is REQUIRED:
+                        errors.append(error)
+                        value = None
+                    else:
+                        value = default
+                elif option_type == PATH:
+                    value = os.path.join(REPOSITORY_DIRECTORY, value.strip())
+                else:
+                    try:
+                        value = option_type(value.strip())
+                    except ValueError:
+                        errors.append("{} of section {} is not a valid {}.".format(option, section,
+                                                                                   option_type.__name__))
+                        value = None
+                self.__values[(section, option)] = value
+            self.__errors[section] = errors
+        if (self.get("MONGODB", "username") is None) != (self.get("MONGODB", "password") is None):
+            self.__errors["MONGODB"].append(
+                "There is an problem MONGODB section of config.ini file, either username or password is not defined")
+        logger.info("Config settings loaded")
+
+    def require(self, *sections):
+        """
+        check that the options of sections are valid and required options are defined
+        :param sections: names of sections
+        :raises Exception: if an option is invalid or a required option is not defined
+        """
+        errors = [error for section in sections for error in self.__errors.get(section, [])]
+        if errors:
+            raise Exception(" ".join(errors))
+
+    def get(self, section, option):
+        """
+        get the value of an option
+        :param section: name of section
+        :param option: name of option
+        :return: value (converted to the type of option), default value if the option is not defined
+        """
+        return self.__values[(section, option)]
+
+
+settings = Settings(CONFIG_PATH)
@@ -0,0 +1,116 @@
+class SymSpellIndex:
+    """
+    symmetric delete spelling correction (SymSpell), all deletes of the vocabulary words (up to max_edit_distance) are
+    precomputed, so correcting a word only looks up the deletes of the word instead of comparing it to every word
+    """
+
+    def __init__(self, max_edit_distance=2, prefix_length=7):
+        """
+        :param max_edit_distance: maximum edit distance of a correction
+        :param prefix_length: only the prefix of words is used to generate deletes (keeps the index small)
+        """
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.__words = {}  # word -> frequency
+        self.__deletes = {}  # delete -> words
+
+    def build(self, words):
+        """
+        build the index
+        :param words: dictionary of word -> frequency
+        """
+        vocabulary = {}
+        deletes = {}
+        for word, frequency in words.items():
+            self.__add(vocabulary, deletes, word, frequency)
+        self.__words, self.__deletes = vocabulary, deletes  # swap the whole index, readers never see a half-built one
+
+    def add(self, word, frequency=1):
+        """
+        add a word to the vocabulary
+        :param word: word
+        :param frequency: frequency of the word (used to choose between corrections with the same distance)
+        """
+        self.__add(self.__words, self.__deletes, word, frequency)
+
+    def __add(self, vocabulary, deletes, word, frequency):
+        word = word.lower()
+        if word in vocabulary:
+            vocabulary[word] += frequency
+            return
+        vocabulary[word] = frequency
+        for delete in self.__generate_deletes(word[:self.prefix_length]):
+            deletes.setdefault(delete, []).append(word)
+
+    def __generate_deletes(self, word):
+        deletes = {word}
+        candidates = [word]
+        for distance in range(self.max_edit_distance):
+            next_candidates = []
+            for candidate in candidates:
+                for index in range(len(candidate)):
+                    delete = candidate[:index] + candidate[index + 1:]
+                    if delete not in deletes:
+                        deletes.add(delete)
+                        next_candidates.append(delete)
+            candidates = next_candidates
+        return deletes
+
+    def __distance(self, source, target, max_distance):
+        """
+        Damerau-Levenshtein (optimal string alignment) distance
+        :return: distance, max_distance + 1 if it is more than max_distance
+        """
+        if abs(len(source) - len(target)) > max_distance:
+            return max_distance + 1
+        previous_previous_row = None
+        previous_row = list(range(len(target) + 1))
+        for i in range(1, len(source) + 1):
+            row = [i] + [0] * len(target)
+            for j in range(1, len(target) + 1):
+                cost = 0 if source[i - 1] == target[j - 1] else 1
+                row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+                if i > 1 and j > 1 and source[i - 1] == target[j - 2] and source[i - 2] == target[j - 1]:
+                    row[j] = min(row[j], previous_previous_row[j - 2] + 1)
+            if min(row) > max_distance:
+                return max_distance + 1
+            previous_previous_row, previous_row = previous_row, row
+        return previous_row[-1]
+
+    def lookup(self, word, max_edit_distance=None):
+        """
+        find the closest vocabulary word (the most frequent one if several words have the same distance)
+        :param word: word to correct
+        :param max_edit_distance: maximum edit distance of the correction (index's maximum if None)
+        :return: (corrected word, distance), None if no word is close enough
+        """
+        words, deletes = self.__words, self.__deletes  # the index may be swapped by build() meanwhile
+        word = word.lower()
+        if word in words:
+            return word, 0
+        if max_edit_distance is None or max_edit_distance > self.max_edit_distance:
+            max_edit_distance = self.max_edit_distance
+        prefix = word[:self.prefix_length]
+        best = None  # (distance, -frequency, word)
+        checked = set()
+        for delete in self.__generate_deletes(prefix):
+            if len(prefix) - len(delete) > max_edit_distance:
+                continue
+            for candidate in deletes.get(delete, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                distance = self.__distance(word, candidate, max_edit_distance)
+                if distance <= max_edit_distance:
+                    key = (distance, -words[candidate], candidate)
+                    if best is None or key < best:
+                        best = key
+        if best is None:
+            return None
+        return best[2], best[0]
+
+    def __contains__(self, word):
+        return word.lower() in self.__words
+
+    def __len__(self):
+        return len(self.__words)
@@ -0,0 +1,93 @@
+import os
+import csv
+import json
+
+SUBTOPIC_COLUMN = "Subtopic"  # subtopic of a row of a CSV/JSONL file (a workbook has one sheet per subtopic)
+COLUMNS = ("Questions", "Answers", "Links", "Paraphrases")
+
+
+def __normalize_row(subtopic, row, location):
+    """
+    keep the columns of training data, empty cells are None
+    :param subtopic: name of subtopic
+    :param row: dictionary of column -> value
+    :param location: location of row in the file, for error messages (e.g. "line 3")
+    :return: dictionary with "Subtopic", "Questions", "Answers", "Links" and "Paraphrases"
+    :raises ValueError: if the subtopic is empty
+    """
+    if not isinstance(subtopic, str) or len(subtopic.strip()) == 0:
+        raise ValueError("{} of training data has no {}".format(location, SUBTOPIC_COLUMN))
+    normalized_row = {SUBTOPIC_COLUMN: subtopic.strip()}
+    for column in COLUMNS:
+        value = row.get(column)
+        if isinstance(value, str) and len(value.strip()) == 0:
+            value = None
+        normalized_row[column] = value
+    return normalized_row
+
+
+def read_workbook_rows(path):
+    """
+    stream the rows of a workbook (one sheet per subtopic, first row of a sheet is the header), sheets are read
+    row by row so a large workbook is never loaded into memory at once
+    :param path: path of .xlsx file
+    :return: generator of rows
+    """
+    from openpyxl import load_workbook  # only needed to read workbooks
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            header = None
+            for values in worksheet.iter_rows(values_only=True):
+                if header is None:
+                    header = [str(value).strip() if value is not None else None for value in values]
+                    continue
+                if all(value is None for value in values):
+                    continue
+                yield __normalize_row(worksheet.title, dict(zip(header, values)), "sheet {}".format(worksheet.title))
+    finally:
+        workbook.close()
+
+
+def read_csv_rows(path):
+    """
+    stream the rows of a CSV file (header row, "Subtopic" column)
+    :param path: path of .csv file
+    :return: generator of rows
+    """
+    with open(path, "r", encoding="utf-8", newline="") as csv_file:
+        reader = csv.DictReader(csv_file)
+        for row in reader:
+            yield __normalize_row(row.get(SUBTOPIC_COLUMN), row, "line {}".format(reader.line_num))
+
+
+def read_jsonl_rows(path):
+    """
+    stream the rows of a JSON Lines file (one object per line with a "Subtopic" key)
+    :param path: path of .jsonl file
+    :return: generator of rows
+    """
+    with open(path, "r", encoding="utf-8") as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, 1):
+            if len(line.strip()) == 0:
+                continue
+            row = json.loads(line)
+            yield __normalize_row(row.get(SUBTOPIC_COLUMN), row, "line {}".format(line_number))
+
+
+def read_training_data(path):
+    """
+    stream the rows of a training data file, rows of a subtopic are expected to be consecutive
+    :param path: path of .xlsx, .csv or .jsonl file
+    :return: generator of rows with "Subtopic", "Questions", "Answers", "Links" and "Paraphrases", it raises
+    ValueError when a row has no subtopic
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".xlsx":
+        return read_workbook_rows(path)
+    elif extension == ".csv":
+        return read_csv_rows(path)
+    elif extension == ".jsonl":
+        return read_jsonl_rows(path)
+    raise Exception("Training data format {} is not supported (xlsx, csv or jsonl).".format(extension))
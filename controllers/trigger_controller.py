@@ -0,0 +1,219 @@
+import os
+import re
+
+QA_ID_PATTERN = re.compile(r"^[0-9a-f]{24}$")  # replies of generated question/answer rules are mongodb ids
+SUPPORTED_WORD_PATTERN = re.compile(r"^[a-z0-9]+$")
+NASTIES_PATTERN = re.compile(r"[^a-z0-9 ]")  # characters removed from messages (as RiveScript does)
+
+WORD = "word"  # word
+OPTIONAL_WORD = "optional"  # [word]
+ALTERNATION = "alternation"  # (word1|word2)
+OPTIONAL_WILDCARD = "wildcard"  # [*]
+
+
+class TriggerIndex:
+    """
+    token trie of the rules generated for questions/answers (see __generate_rule_pattern in rule_controller), a
+    message is matched against all triggers at once instead of testing the sorted triggers one by one as regexes,
+    only the syntax emitted by the generator is supported (words, [word], (word1|word2) and [*]), other rules are
+    left to RiveScript
+    """
+
+    def __init__(self):
+        self.__root = self.__new_node()
+        self.__substitutions = {}
+        self.number_of_triggers = 0
+
+    def __new_node(self):
+        # children are hashed by the word they consume, so matching a word does not scan all children of a node
+        return {"children": {}, "words": {}, "optional_words": {}, "alternation_words": {}, "wildcard": None,
+                "qa_id": None, "trigger": None, "specificity": -1}
+
+    def __parse_trigger(self, trigger):
+        """
+        parse a trigger into elements
+        :param trigger: trigger of rule
+        :return: list of elements, None if trigger has an unsupported syntax
+        """
+        elements = []
+        for token in trigger.split():
+            if token == "[*]":
+                elements.append((OPTIONAL_WILDCARD, None))
+            elif token.startswith("[") and token.endswith("]") and SUPPORTED_WORD_PATTERN.match(token[1:-1]):
+                elements.append((OPTIONAL_WORD, token[1:-1]))
+            elif token.startswith("(") and token.endswith(")"):
+                words = token[1:-1].split("|")
+                if not all(SUPPORTED_WORD_PATTERN.match(word) for word in words):
+                    return None
+                elements.append((ALTERNATION, frozenset(words)))
+            elif SUPPORTED_WORD_PATTERN.match(token):
+                elements.append((WORD, token))
+            else:
+                return None
+        return elements if elements else None
+
+    def add_trigger(self, trigger, qa_id):
+        """
+        compile a trigger into the trie
+        :param trigger: trigger of rule (e.g. "[*] what [is] covid19")
+        :param qa_id: id of question/answer replied by the rule
+        :return: True if the trigger is compiled, False if its syntax is not supported
+        """
+        elements = self.__parse_trigger(trigger)
+        if elements is None:
+            return False
+        node = self.__root
+        for element in elements:
+            child = node["children"].get(element)
+            if child is None:
+                child = self.__new_node()
+                node["children"][element] = child
+                kind, value = element
+                if kind == WORD:
+                    node["words"][value] = child
+                elif kind == OPTIONAL_WORD:
+                    node["optional_words"][value] = child
+                elif kind == ALTERNATION:
+                    for word in value:
+                        node["alternation_words"].setdefault(word, []).append(child)
+                else:
+                    node["wildcard"] = child
+            node = child
+        # like RiveScript, a trigger with more words is more specific, the first compiled trigger wins a tie
+        specificity = sum(1 for kind, _ in elements if kind in {WORD, ALTERNATION})
+        if node["qa_id"] is None or specificity > node["specificity"]:
+            node["qa_id"] = qa_id
+            node["trigger"] = trigger
+            node["specificity"] = specificity
+        self.number_of_triggers += 1
+        return True
+
+    def remove_question_answer(self, qa_id):
+        """
+        remove the compiled triggers of a question/answer (e.g. its question or paraphrases changed), a trigger of
+        another question/answer which lost a tie on the same node is left to RiveScript
+        :param qa_id: id of question/answer
+        :return: number of removed triggers
+        """
+        removed = 0
+        pending = [self.__root]
+        while pending:
+            node = pending.pop()
+            if node["qa_id"] == qa_id:
+                node["qa_id"] = None
+                node["trigger"] = None
+                node["specificity"] = -1
+                removed += 1
+            pending.extend(node["children"].values())
+        self.number_of_triggers -= removed
+        return removed
+
+    def compile_directory(self, directory):
+        """
+        compile the question/answer rules (top level triggers replying a question/answer id) of .rive files
+        :param directory: directory of rules
+        :return: number of compiled triggers
+        """
+        self.__root = self.__new_node()
+        self.__substitutions = {}
+        self.number_of_triggers = 0
+        for root, dirs, files in os.walk(directory):
+            for file_name in sorted(files):
+                if file_name.endswith(".rive"):
+                    with open(os.path.join(root, file_name), "r", encoding="utf-8") as rule_file:
+                        self.compile_rules(rule_file.read().splitlines())
+        return self.number_of_triggers
+
+    def compile_rules(self, lines):
+        """
+        compile the question/answer rules of RiveScript code
+        :param lines: lines of RiveScript code
+        """
+        topic_depth = 0
+        trigger = None
+        for line in lines:
+            line = line.strip()
+            if line.startswith("! sub "):
+                substitution = line[len("! sub "):].split("=", 1)
+                if len(substitution) == 2:
+                    self.__substitutions[substitution[0].strip().lower()] = substitution[1].strip().lower()
+            elif line.startswith("> "):
+                topic_depth += 1
+            elif line.startswith("< "):
+                topic_depth -= 1
+            elif line.startswith("+ ") and topic_depth == 0:
+                trigger = line[2:].strip()
+                continue
+            elif line.startswith("- ") and trigger is not None and QA_ID_PATTERN.match(line[2:].strip()):
+                self.add_trigger(trigger, line[2:].strip())
+            trigger = None
+
+    def normalize(self, message):
+        """
+        normalize a message like RiveScript does before matching (lowercase, substitutions, remove punctuations)
+        :param message: user's message
+        :return: list of words
+        """
+        words = []
+        for word in message.lower().split():
+            word = self.__substitutions.get(word, word)
+            word = NASTIES_PATTERN.sub("", word)
+            words.extend(word.split())
+        return words
+
+    def __closure(self, states):
+        """
+        add states reachable by skipping optional elements
+        :param states: dictionary of (node id, in wildcard) -> (node, in wildcard)
+        :return: states
+        """
+        pending = list(states.values())
+        while pending:
+            node, in_wildcard = pending.pop()
+            optional_children = list(node["optional_words"].values())
+            if node["wildcard"] is not None:
+                optional_children.append(node["wildcard"])
+            for child in optional_children:
+                if (id(child), False) not in states:
+                    states[(id(child), False)] = (child, False)
+                    pending.append((child, False))
+        return states
+
+    def match(self, message):
+        """
+        match a message against the compiled triggers
+        :param message: user's message
+        :return: id of question/answer, None if no trigger matches the message
+        """
+        matched = self.match_trigger(message)
+        return matched[0] if matched is not None else None
+
+    def match_trigger(self, message):
+        """
+        match a message against the compiled triggers
+        :param message: user's message
+        :return: (id of question/answer, matched trigger), None if no trigger matches the message
+        """
+        if self.number_of_triggers == 0:
+            return None
+        states = self.__closure({(id(self.__root), False): (self.__root, False)})
+        for word in self.normalize(message):
+            next_states = {}
+            for node, in_wildcard in states.values():
+                if in_wildcard:  # [*] consumes any number of words
+                    next_states[(id(node), True)] = (node, True)
+                if node["wildcard"] is not None:
+                    next_states[(id(node["wildcard"]), True)] = (node["wildcard"], True)
+                children = node["alternation_words"].get(word, [])
+                for child in [node["words"].get(word), node["optional_words"].get(word)] + children:
+                    if child is not None:
+                        next_states[(id(child), False)] = (child, False)
+            if not next_states:
+                return None
+            states = self.__closure(next_states)
+
+        best = None
+        for node, in_wildcard in states.values():
+            if node["qa_id"] is not None and (best is None or node["specificity"] > best["specificity"]):
+                best = node
+        return (best["qa_id"], best["trigger"]) if best is not None else None
@@ -0,0 +1,115 @@
+import re
+import csv
+import io
+import json
+
+COLUMNS = ("full_name", "phone_number", "languages")
+PHONE_NUMBER_SEPARATORS_PATTERN = re.compile(r"[\s\-().]+")
+PHONE_NUMBER_PATTERN = re.compile(r"^\+[1-9]\d{6,14}$")  # E.164: country code and subscriber number, at most 15 digits
+COUNTRY_CODE_PATTERN = re.compile(r"^[1-9]\d{0,2}$")
+LANGUAGES_SEPARATORS_PATTERN = re.compile(r"[,;|]")
+
+
+def is_valid_country_code(country_code):
+    """
+    :param country_code: calling code of a country (e.g. "61")
+    :return: True if it is a calling code, False if it is not
+    """
+    return isinstance(country_code, str) and COUNTRY_CODE_PATTERN.match(country_code) is not None
+
+
+def normalize_phone_number(phone_number, country_code=None):
+    """
+    normalize a phone number to E.164 format (e.g. "whatsapp:+61 (4) 12-345-678" -> "+61412345678"), the format of
+    phone numbers stored for volunteers
+    :param phone_number: phone number in international format ("+" or "00" prefix), or national format if a country
+    code is given
+    :param country_code: calling code of the country of national numbers (e.g. "61": "0412 345 678" -> "+61412345678"),
+    None if national numbers are not valid
+    :return: normalized phone number, None if it is not a valid phone number
+    """
+    if not isinstance(phone_number, str):
+        phone_number = "" if phone_number is None else str(phone_number)
+    phone_number = PHONE_NUMBER_SEPARATORS_PATTERN.sub("", phone_number.replace("whatsapp:", ""))
+    if phone_number.startswith("00"):  # international call prefix
+        phone_number = "+" + phone_number[2:]
+    elif not phone_number.startswith("+"):  # national number, the country can't be guessed
+        if country_code is None:
+            return None
+        phone_number = "+" + country_code + phone_number[1:] if phone_number.startswith("0") \
+            else "+" + country_code + phone_number  # trunk prefix "0" is not dialled from abroad
+    if PHONE_NUMBER_PATTERN.match(phone_number) is None:
+        return None
+    return phone_number
+
+
+def __normalize_languages(languages):
+    """
+    :param languages: list of languages, or languages separated by ",", ";" or "|"
+    :return: list of language names (e.g. ["English", "French"])
+    """
+    if isinstance(languages, str):
+        languages = LANGUAGES_SEPARATORS_PATTERN.split(languages)
+    elif not isinstance(languages, list):
+        return []
+    return [language.strip() for language in languages if isinstance(language, str) and len(language.strip()) > 0]
+
+
+def read_volunteers(data, content_type):
+    """
+    read the volunteers of a CSV file (header row with full_name, phone_number and languages columns) or a JSON
+    array of objects (or an object with a "volunteers" array)
+    :param data: content of file as bytes
+    :param content_type: content type of the file (e.g. "text/csv", "application/json")
+    :return: list of rows as dictionaries
+    :raises ValueError: if the content cannot be parsed
+    """
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    if "json" in (content_type or ""):
+        volunteers = json.loads(text)
+        if isinstance(volunteers, dict):
+            volunteers = volunteers.get("volunteers")
+        if not isinstance(volunteers, list) or not all(isinstance(row, dict) for row in volunteers):
+            raise ValueError("JSON content must be an array of volunteers")
+        return volunteers
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None or not set(COLUMNS).issubset(name.strip() for name in reader.fieldnames):
+        raise ValueError("CSV content must have {} columns".format(", ".join(COLUMNS)))
+    return [{name.strip(): value for name, value in row.items() if name is not None} for row in reader]
+
+
+def validate_volunteers(rows, country_code=None):
+    """
+    validate the rows of volunteers and normalize their phone numbers and languages, a phone number repeated in
+    the rows is only kept in its first row
+    :param rows: list of rows as dictionaries
+    :param country_code: calling code of the country of national phone numbers, None if every phone number must be
+    in international format
+    :return: list of (row number, volunteer, error), volunteer is None if the row is invalid
+    """
+    results = []
+    phone_numbers = set()
+    for row_number, row in enumerate(rows, 1):
+        full_name = row.get("full_name")
+        full_name = full_name.strip() if isinstance(full_name, str) else ""
+        phone_number = normalize_phone_number(row.get("phone_number"), country_code)
+        languages = __normalize_languages(row.get("languages"))
+        if len(full_name) == 0:
+            error = "full name is empty"
+        elif phone_number is None:
+            error = "phone number {} is not valid (international format with country code expected)".format(
+                row.get("phone_number")) if country_code is None else \
+                "phone number {} is not valid".format(row.get("phone_number"))
+        elif len(languages) == 0:
+            error = "languages are empty"
+        elif phone_number in phone_numbers:
+            error = "phone number {} is repeated".format(phone_number)
+        else:
+            error = None
+        if error is None:
+            phone_numbers.add(phone_number)
+            results.append((row_number, {"full_name": full_name, "phone_number": phone_number,
+                                         "languages": languages}, None))
+        else:
+            results.append((row_number, None, error))
+    return results
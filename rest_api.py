@@ -1,18 +1,28 @@
+import hmac
 import json
 
 from flask import Flask
 from flask import request
 from flask import Response
+from twilio.twiml.messaging_response import MessagingResponse
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-from pycountry import languages
 import logging
-import configparser
 from controllers import rule_controller
+from controllers import nlp_controller
 from controllers import mongo_controller
+from controllers import cache_controller
+from controllers import concurrency_controller
+from controllers import session_controller
+from controllers import brain_controller
+from controllers import client_controller
+from controllers import settings_controller
+from controllers import analytics_controller
+from controllers import volunteer_controller
+from controllers import admin_controller
+from controllers import trigger_controller
 import os
-from twilio.rest import Client
-from textblob import TextBlob
+import threading
 
 logger = logging.getLogger("REST Server")
 logger.setLevel(logging.INFO)
@@ -23,44 +33,22 @@ formatter = logging.Formatter("%(asctime)s,%(msecs)d - %(name)s - %(levelname)s
 log_file_handler.setFormatter(formatter)
 logger.addHandler(log_file_handler)
 
-# load configs from config.ini file
-config = configparser.ConfigParser(inline_comment_prefixes="#")
-config.read(os.path.join(os.path.dirname(__file__), "config.ini"))
-default_settings = config["DEFAULT"]
-twilio_settings = config["TWILIO"]
+settings = settings_controller.settings
 
 try:
-    logger.info("Loading config settings")
-    if "address" not in default_settings or default_settings["address"] == "":
-        raise Exception("Server FQDN address is not defined.")
-    else:
-        server_address = default_settings["address"]
-    if "port" not in default_settings or default_settings["port"] == "":
-        server_port = None
-    else:
-        server_port = config.getint("DEFAULT", "port")
-    if "binding" not in default_settings or default_settings["binding"] == "":
-        binding = None
-    else:
-        binding = default_settings["binding"]
-    if "swagger_file_path" not in default_settings or default_settings["swagger_file_path"] == "":
-        raise Exception("Swagger file path is not defined.")
-    else:
-        swagger_file_path = default_settings["swagger_file_path"]
-    if "swagger_url" not in default_settings or default_settings["swagger_url"] == "":
-        raise Exception("Swagger URL is not defined.")
-    else:
-        swagger_url = default_settings["swagger_url"]
-    if "account_sid" not in twilio_settings or twilio_settings["account_sid"] == "":
-        raise Exception("Twilio Account Sid is not defined.")
-    else:
-        twilio_account_sid = twilio_settings["account_sid"]
-    if "auth_token" not in twilio_settings or twilio_settings["auth_token"] == "":
-        raise Exception("Twilio Auth Token is not defined.")
-    else:
-        twilio_auth_token = twilio_settings["auth_token"]
-    logger.info("Config settings loaded successfully")
-    twilio_client = Client(twilio_account_sid, twilio_auth_token)
+    settings.require("DEFAULT", "TWILIO", "WEBHOOK", "ADMIN", "ADMISSION")
+    server_address = settings.get("DEFAULT", "address")
+    server_port = settings.get("DEFAULT", "port")
+    binding = settings.get("DEFAULT", "binding")
+    swagger_file_path = settings.get("DEFAULT", "swagger_file_path")
+    swagger_url = settings.get("DEFAULT", "swagger_url")
+    dedupe_max_size = settings.get("WEBHOOK", "dedupe_max_size")
+    dedupe_ttl = settings.get("WEBHOOK", "dedupe_ttl")
+    coalesce_window_ms = settings.get("WEBHOOK", "coalesce_window_ms")
+    admin_api_key = settings.get("ADMIN", "api_key")
+    max_in_flight = settings.get("ADMISSION", "max_in_flight")
+    max_waiting = settings.get("ADMISSION", "max_waiting")
+    queue_timeout_ms = settings.get("ADMISSION", "queue_timeout_ms")
 
 except Exception as e:
     logger.error(str(e))
@@ -71,6 +59,31 @@ if server_port is None:
 else:
     api_url = "{}:{}/{}".format(server_address, server_port, swagger_file_path)
 
+# Twilio retries a webhook call when we are slow to respond, each MessageSid is processed only once (a message which
+# failed is forgotten, so its retry is processed again)
+seen_messages = cache_controller.TTLCache(dedupe_max_size, dedupe_ttl)  # MessageSid -> state of the message
+MESSAGE_IN_PROGRESS = "IN PROGRESS"
+MESSAGE_PROCESSED = "PROCESSED"
+webhook_statistics = {"duplicate_messages_absorbed": 0}
+webhook_statistics_lock = threading.Lock()
+
+# messages of a user are answered one at a time and in order, messages of different users are answered in parallel
+user_executor = concurrency_controller.UserSerialExecutor()
+
+# language of the last message of each user, short messages (e.g. a chosen option "1") can't be detected
+user_languages = cache_controller.TTLCache(session_controller.max_sessions, session_controller.idle_ttl)
+
+# bounded number of messages answered at once (a message waiting for an earlier message of the same user does not
+# count), a message which can't be answered soon gets a canned busy reply in the webhook response
+admission_controller = concurrency_controller.AdmissionController(max_in_flight, max_waiting, queue_timeout_ms / 1000.0)
+BUSY_MESSAGE = "I'm very busy at the moment 😥, please try again shortly 🙏"
+MESSAGE_SHED = object()  # result of a message which is not answered because the chatbot is overloaded
+
+# optionally merge quick consecutive messages of a user into one question (one NLP round and one reply), the merged
+# messages are answered by a timer thread when the window closes
+message_coalescer = concurrency_controller.MessageCoalescer(
+    coalesce_window_ms / 1000.0, lambda user_id, message, context: __reply_to_merged_messages(user_id, message, *context))
+
 swaggerui_blueprint = get_swaggerui_blueprint(
     swagger_url,
     api_url,
@@ -95,6 +108,29 @@ def get_swagger():
     return Response(yaml_document, 200)
 
 
+@app.route("/stats", methods=["GET"])
+def get_statistics():
+    """
+    get runtime statistics of the chatbot (e.g. cache statistics)
+    :return: json object/error HTTP response
+    """
+    error_response = __check_admin_api_key()
+    if error_response is not None:
+        return error_response
+    statistics = {
+        "mongodb_caches": mongo_controller.get_cache_statistics(),
+        "brains": brain_controller.get_statistics(),
+        "analytics": analytics_controller.get_statistics(),
+        "admission": admission_controller.get_statistics(),
+        "nlp": nlp_controller.get_statistics(),
+        "webhook": dict(webhook_statistics,
+                        coalesced_messages=message_coalescer.coalesced_messages,
+                        coalescing_users=message_coalescer.get_waiting_users(),
+                        seen_messages=seen_messages.get_statistics()),
+    }
+    return Response(json.dumps(statistics), 200, mimetype="application/json")
+
+
 @app.route("/volunteer", methods=["POST"])
 def add_hanover_volunteer():
     """
@@ -104,8 +140,7 @@ def add_hanover_volunteer():
     try:
         content_type = request.content_type
         if "form-" in content_type:
-            for key in request.form.keys():
-                print("{}:{}".format(key, request.form[key]))
+            logger.debug("Volunteer form fields: {}".format(", ".join(request.form.keys())))
             full_name = request.form["full_name"]
             phone_number = request.form["phone_number"]
             languages = request.form["languages"]
@@ -120,6 +155,268 @@ def add_hanover_volunteer():
         return Response(json.dumps(err), 400, mimetype="application/json")
 
 
+@app.route("/volunteers", methods=["POST"])
+def add_handover_volunteers():
+    """
+    add (or update) volunteers in bulk, from a CSV file or a JSON array sent as the request body or as the "file"
+    field of a form, national phone numbers are only valid with the "country_code" argument
+    :return: json object with the result of each row/error HTTP response
+    """
+    error_response = __check_admin_api_key()  # volunteers receive the messages of users
+    if error_response is not None:
+        return error_response
+    country_code = request.args.get("country_code")
+    if country_code is not None:
+        country_code = country_code.strip().lstrip("+")
+        if not volunteer_controller.is_valid_country_code(country_code):
+            return Response(json.dumps({"message": "Country code {} is not valid".format(country_code)}), 400,
+                            mimetype="application/json")
+    try:
+        if "file" in request.files:
+            volunteers_file = request.files["file"]
+            content_type = volunteers_file.mimetype
+            if volunteers_file.filename.lower().endswith(".json"):
+                content_type = "application/json"
+            rows = volunteer_controller.read_volunteers(volunteers_file.read(), content_type)
+        else:
+            rows = volunteer_controller.read_volunteers(request.get_data(), request.content_type)
+    except Exception as err:
+        logger.error(str(err))
+        return Response(json.dumps({"message": str(err)}), 400, mimetype="application/json")
+
+    validated_rows = volunteer_controller.validate_volunteers(rows, country_code)
+    volunteers = [volunteer for row_number, volunteer, error in validated_rows if volunteer is not None]
+    try:
+        write_results = iter(mongo_controller.upsert_handover_volunteers(volunteers))
+    except Exception as err:
+        logger.error(str(err))
+        return Response(json.dumps({"message": str(err)}), 500, mimetype="application/json")
+
+    results = []
+    for row_number, volunteer, error in validated_rows:
+        if volunteer is None:
+            results.append({"row": row_number, "status": "error", "error": error})
+        else:
+            status, error = next(write_results)
+            result = {"row": row_number, "phone_number": volunteer["phone_number"], "status": status}
+            if error is not None:
+                result["error"] = error
+            results.append(result)
+    summary = {status: sum(1 for result in results if result["status"] == status)
+               for status in ("inserted", "updated", "error")}
+    logger.info("Bulk volunteer registration: {} inserted, {} updated, {} failed".format(
+        summary["inserted"], summary["updated"], summary["error"]))
+    return Response(json.dumps(dict(summary, results=results)), 200, mimetype="application/json")
+
+
+def __check_admin_api_key():
+    """
+    check the key of admin endpoints
+    :return: error HTTP response, None if the key is valid
+    """
+    if admin_api_key is None:
+        return Response(json.dumps({"message": "Admin API is disabled"}), 403, mimetype="application/json")
+    if not hmac.compare_digest(request.headers.get("X-Api-Key", "").encode("utf-8"), admin_api_key.encode("utf-8")):
+        return Response(json.dumps({"message": "Invalid API key"}), 401, mimetype="application/json")
+    return None
+
+
+def __get_text_list(content, field):
+    """
+    :param content: json object
+    :param field: name of field
+    :return: list of non-empty texts, None if the field is not given
+    :raises ValueError: if the field is not a text or a list of texts
+    """
+    value = content.get(field)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split("\n")
+    if not isinstance(value, list) or not all(isinstance(text, str) for text in value):
+        raise ValueError("{} must be a list of texts".format(field))
+    return [text.strip() for text in value if len(text.strip()) > 0]
+
+
+@app.route("/questions_answers", methods=["POST"])
+def add_question_answer():
+    """
+    add a question/answer (and its paraphrases) to a subtopic of the running chatbot
+    :return: json object/error HTTP response
+    """
+    error_response = __check_admin_api_key()
+    if error_response is not None:
+        return error_response
+    try:
+        content = request.get_json(silent=True) or {}
+        language = content.get("language", brain_controller.default_language)
+        if not brain_controller.is_supported_language(language):
+            raise ValueError("Language {} is not supported".format(language))
+        for field in ("subtopic_id", "question", "answer"):
+            if not isinstance(content.get(field), str) or len(content[field].strip()) == 0:
+                raise ValueError("{} is empty".format(field))
+        qa_id = admin_controller.add_question_answer(language, content["subtopic_id"], content["question"].strip(),
+                                                     content["answer"], __get_text_list(content, "more_details"),
+                                                     __get_text_list(content, "paraphrases"))
+        return Response(json.dumps({"id": qa_id}), 201, mimetype="application/json")
+    except ValueError as err:
+        logger.error(str(err))
+        return Response(json.dumps({"message": str(err)}), 400, mimetype="application/json")
+    except Exception as err:  # e.g. mongodb or NLP server errors
+        logger.error(str(err))
+        return Response(json.dumps({"message": str(err)}), 500, mimetype="application/json")
+
+
+@app.route("/questions_answers/<qa_id>", methods=["PUT", "DELETE"])
+def change_question_answer(qa_id):
+    """
+    update (only the given fields) or delete a question/answer of the running chatbot
+    :param qa_id: id of question/answer
+    :return: json object/error HTTP response
+    """
+    error_response = __check_admin_api_key()
+    if error_response is not None:
+        return error_response
+    if trigger_controller.QA_ID_PATTERN.match(qa_id) is None:
+        return Response(json.dumps({"message": "Question/answer {} is not found".format(qa_id)}), 404,
+                        mimetype="application/json")
+    try:
+        content = request.get_json(silent=True) or {}
+        language = content.get("language", request.args.get("language", brain_controller.default_language))
+        if not brain_controller.is_supported_language(language):
+            raise ValueError("Language {} is not supported".format(language))
+        if request.method == "DELETE":
+            result = admin_controller.delete_question_answer(language, qa_id)
+        else:
+            for field in ("question", "answer"):
+                if field in content and (not isinstance(content[field], str) or len(content[field].strip()) == 0):
+                    raise ValueError("{} is empty".format(field))
+            result = admin_controller.update_question_answer(
+                language, qa_id,
+                question=content["question"].strip() if "question" in content else None,
+                answer=content.get("answer"),
+                more_details=__get_text_list(content, "more_details"),
+                paraphrases=__get_text_list(content, "paraphrases"))
+    except ValueError as err:
+        logger.error(str(err))
+        return Response(json.dumps({"message": str(err)}), 400, mimetype="application/json")
+    except Exception as err:  # e.g. mongodb or NLP server errors
+        logger.error(str(err))
+        return Response(json.dumps({"message": str(err)}), 500, mimetype="application/json")
+    if not result:
+        return Response(json.dumps({"message": "Question/answer {} is not found".format(qa_id)}), 404,
+                        mimetype="application/json")
+    return Response(json.dumps({"id": qa_id}), 200, mimetype="application/json")
+
+
+def __answer_message(user_id, message):
+    """
+    detect the language of a message and answer it with the brain of the language
+    :param user_id: id of user
+    :param message: user's message
+    :return: answer, None if the message is passed to a human
+    """
+    if len(message) > 2:  # if the length of message is more than 2 characters then check the language; TextBlob library requires a sentence/word with at least 3 characters to detect a language
+        from textblob import TextBlob  # textblob and pycountry are slow to import, they are imported on first use
+        from pycountry import languages
+
+        blob = TextBlob(message)
+        query_language = blob.detect_language()
+        if query_language is not None:
+            lang_name = languages.get(alpha_2=query_language)
+            if lang_name is None:
+                result = "I don't understand your language 🧐"
+            else:
+                if brain_controller.is_supported_language(query_language):
+                    user_languages.set(user_id, query_language)
+                    result = rule_controller.answer_question(user_id, message, query_language)
+                else:
+                    supported_languages = []
+                    for language_code in brain_controller.get_supported_languages():
+                        supported_language = languages.get(alpha_2=language_code)
+                        supported_languages.append("*{}*".format(
+                            supported_language.name if supported_language is not None else language_code))
+                    result = "I can only talk in {} at the moment, but soon I will be able to talk in _{}_ 😎".format(
+                        ", ".join(supported_languages), lang_name.name)
+        else:
+            result = "I don't understand your language 🧐"
+    else:
+        result = rule_controller.answer_question(user_id, message,
+                                                 user_languages.get(user_id, brain_controller.default_language))
+    return result
+
+
+def __answer_admitted_message(user_id, message):
+    """
+    answer a message of user if the chatbot is not overloaded, called once the earlier messages of the user are
+    answered, so a user waiting for their turn does not hold a slot
+    :param user_id: id of user
+    :param message: user's message
+    :return: answer, None if the message is passed to a human, MESSAGE_SHED if the chatbot is overloaded
+    """
+    if not admission_controller.admit():
+        return MESSAGE_SHED
+    try:
+        return __answer_message(user_id, message)
+    finally:
+        admission_controller.release()
+
+
+def __reply_to_message(user_id, message, message_sid, from_number, to_number):
+    """
+    answer a message of user (after the earlier messages of the user) and send the answer with Twilio
+    :param user_id: id of user
+    :param message: user's message
+    :param message_sid: Twilio MessageSid of the message, None if it is unknown
+    :param from_number: chatbot's number
+    :param to_number: user's number
+    :return: True if the message is answered (or passed to a human), False if it is shed because the chatbot is
+    overloaded, the caller sends the busy reply
+    """
+    result = user_executor.run(user_id, __answer_admitted_message, user_id, message)
+    if result is MESSAGE_SHED:  # reply without detecting the language or answering
+        logger.warning("Message of user {} is shed".format(user_id))
+        if message_sid:
+            seen_messages.invalidate(message_sid)  # a retry of the message is answered
+        return False
+
+    if result is not None:  # in case of handovering user's question to a human, we do not return anything here
+        client_controller.get_twilio_client().messages.create(
+            body=result,
+            from_=from_number,
+            to=to_number,
+        )
+    if message_sid:
+        seen_messages.set(message_sid, MESSAGE_PROCESSED)
+    return True
+
+
+def __reply_to_merged_messages(user_id, message, from_number, to_number):
+    """
+    answer the messages of user merged by the coalescer (timer thread), the webhook calls of the messages are already
+    acknowledged, so Twilio does not send them again if answering fails: the user gets the error reply and must ask
+    again
+    :param user_id: id of user
+    :param message: merged messages
+    :param from_number: chatbot's number
+    :param to_number: user's number
+    """
+    try:
+        if not __reply_to_message(user_id, message, None, from_number, to_number):
+            client_controller.get_twilio_client().messages.create(  # no webhook response to carry the busy reply
+                body=BUSY_MESSAGE,
+                from_=from_number,
+                to=to_number,
+            )
+    except Exception as err:
+        logger.error(str(err))
+        client_controller.get_twilio_client().messages.create(
+            body="Oops! Something wrong happened on my side!",
+            from_=from_number,
+            to=to_number,
+        )
+
+
 @app.route("/ask", methods=["POST"])
 def get_question_answer():
     """
@@ -127,51 +424,47 @@ def get_question_answer():
     :return: json object/error HTTP response
     """
     try:
+        message_sid = None
         content_type = request.content_type
         if "form-" in content_type:
             # for key in request.form.keys():
             #     print("{}:{}".format(key, request.form[key]))
+            message_sid = request.form.get("MessageSid")
+            if message_sid and not seen_messages.add(message_sid, MESSAGE_IN_PROGRESS):
+                # this is a retry of a message which is already (being) processed, just acknowledge it
+                with webhook_statistics_lock:
+                    webhook_statistics["duplicate_messages_absorbed"] += 1
+                logger.info("Duplicate message {} is absorbed".format(message_sid))
+                return "OK"
             message = request.form["Body"]
             num_media = 0
             if "NumMedia" in request.form.keys():
                 num_media = request.form["NumMedia"]  # check if user sent any media msg (e.g. voice, picture)
             if len(message) == 0 and int(num_media) > 0:
-                message = twilio_client.messages.create(
+                message = client_controller.get_twilio_client().messages.create(
                     body="Sorry, I can only answer to textual messages at the moment! 😉🧐",
                     from_=request.form["To"],
                     to=request.form["From"],
                 )
 
             user_id = request.form["From"].replace("whatsapp:", "")
-        if len(
-                message) > 2:  # if the length of message is more than 2 characters then check the language; TextBlob library requires a sentence/word with at least 3 characters to detect a language
-            blob = TextBlob(message)
-            query_language = blob.detect_language()
-            if query_language is not None:
-                lang_name = languages.get(alpha_2=query_language)
-                if lang_name is None:
-                    result = "I don't understand your language 🧐"
-                else:
-                    if lang_name.name == "English":
-                        result = rule_controller.answer_question(user_id, message)
-                    else:
-                        result = "I can only talk in *English* 🇬🇧 at the moment, but soon I will be able to talk in _{}_ 😎".format(
-                            lang_name.name)
-            else:
-                result = "I don't understand your language 🧐"
-        else:
-            result = rule_controller.answer_question(user_id, message)
-
-        if result is not None:  # in case of handovering user's question to a human, we do not return anything here
-            message = twilio_client.messages.create(
-                body=result,
-                from_=request.form["To"],
-                to=request.form["From"],
-            )
+            if isinstance(message, str) and len(message) > 0 and \
+                    message_coalescer.submit(user_id, message, (request.form["To"], request.form["From"])) is None:
+                # the message is buffered, it is answered with the other messages of the window by a timer thread
+                if message_sid:
+                    seen_messages.set(message_sid, MESSAGE_PROCESSED)
+                return "OK"
+        if not __reply_to_message(user_id, message, message_sid, request.form["To"], request.form["From"]):
+            # the busy reply is sent in the webhook response (TwiML), Twilio API is not called under load
+            busy_response = MessagingResponse()
+            busy_response.message(BUSY_MESSAGE)
+            return Response(str(busy_response), 200, mimetype="application/xml")
         return "OK"  # this is to fix the "The view function did not return a valid response" error as we do not return a Response to twilio api, we use twilio library instead.
     except Exception as err:
         logger.error(str(err))
-        message = twilio_client.messages.create(
+        if message_sid:
+            seen_messages.invalidate(message_sid)  # a retry of the message is answered
+        message = client_controller.get_twilio_client().messages.create(
             body="Oops! Something wrong happened on my side!",
             from_=request.form["To"],
             to=request.form["From"],
@@ -181,6 +474,9 @@ def get_question_answer():
 
 if __name__ == "__main__":
     try:
+        # the first message does not load the brain, with the debug reloader only the serving child process loads it
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            brain_controller.preload_brain(brain_controller.default_language)
         if binding is not None and server_port is not None:
             app.run(host=binding, port=server_port, threaded=True, debug=True)
         elif server_port is not None:
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import semantic_controller
+
+
+def benchmark_semantic_retrieval(k=4):
+    """
+    measure latency and recall@k of the semantic index built by mongodb_populate.py, each indexed question/paraphrase
+    is used as a query (leave-one-out), it is recalled if another question/paraphrase of its QA is in the top-k
+    :param k: number of nearest questions
+    """
+    semantic_controller.find_similar_questions("warm up")  # load model and index
+    if semantic_controller.model is None or semantic_controller.question_vectors is None:
+        print("Semantic index or fastText model is not available, please check SEMANTIC section of config.ini")
+        return
+
+    question_index = semantic_controller.question_index
+    number_of_paraphrases = {}
+    for entry in question_index:
+        number_of_paraphrases[entry["question_id"]] = number_of_paraphrases.get(entry["question_id"], 0) + 1
+    recalled = 0
+    queries = 0
+    embedding_latencies = []
+    search_latencies = []
+    for row, entry in enumerate(question_index):
+        if number_of_paraphrases[entry["question_id"]] < 2:
+            continue  # question has no paraphrase to recall
+        start = time.perf_counter()
+        query_vector = semantic_controller.get_sentence_vector(semantic_controller.model, entry["text"])
+        embedded = time.perf_counter()
+        neighbours = semantic_controller.search(query_vector, k, excluded_row=row)
+        searched = time.perf_counter()
+        embedding_latencies.append(embedded - start)
+        search_latencies.append(searched - embedded)
+        queries += 1
+        if any(question_index[neighbour]["question_id"] == entry["question_id"] for neighbour, _ in neighbours):
+            recalled += 1
+
+    if queries == 0:
+        print("No paraphrases in the semantic index")
+        return
+    embedding_latencies.sort()
+    search_latencies.sort()
+    print("Indexed questions: {}".format(len(question_index)))
+    print("Queries (questions with paraphrases): {}".format(queries))
+    print("Recall@{}: {:.3f}".format(k, float(recalled) / queries))
+    for name, latencies in [("embedding", embedding_latencies), ("search", search_latencies)]:
+        print("{} latency (ms): mean={:.3f} p50={:.3f} p99={:.3f}".format(
+            name,
+            1000 * sum(latencies) / len(latencies),
+            1000 * latencies[len(latencies) // 2],
+            1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]))
+
+
+if __name__ == "__main__":
+    benchmark_semantic_retrieval(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
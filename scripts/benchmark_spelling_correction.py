@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import mongo_controller
+from controllers import spelling_controller
+
+
+def make_typo(word, random_generator):
+    """
+    make a typo in a word (deletion, insertion, substitution or transposition of a character)
+    :param word: word
+    :param random_generator: random number generator
+    :return: misspelled word
+    """
+    index = random_generator.randrange(len(word))
+    letter = random_generator.choice("abcdefghijklmnopqrstuvwxyz")
+    edit = random_generator.choice(["delete", "insert", "substitute", "transpose"])
+    if edit == "delete":
+        return word[:index] + word[index + 1:]
+    elif edit == "insert":
+        return word[:index] + letter + word[index:]
+    elif edit == "substitute":
+        return word[:index] + letter + word[index + 1:]
+    index = min(index, len(word) - 2)
+    return word[:index] + word[index + 1] + word[index] + word[index + 2:]
+
+
+def benchmark_spelling_correction(number_of_queries=100000, seed=0):
+    """
+    measure build time, correction throughput and accuracy of the symmetric delete index over the vocabulary of the
+    knowledge base (keywords of questions/answers), queries are vocabulary words with one random typo
+    :param number_of_queries: number of corrected words
+    :param seed: seed of random typos
+    """
+    vocabulary = {}
+    for question_answer in mongo_controller.get_questions_answers() or []:
+        for keyword in question_answer["keywords"]:
+            vocabulary[keyword] = vocabulary.get(keyword, 0) + 1
+    words = [word for word in vocabulary if len(word) > 3]
+    if not words:
+        print("Knowledge base has no keywords, please run mongodb_populate.py first")
+        return
+
+    start = time.perf_counter()
+    spelling_index = spelling_controller.SymSpellIndex()
+    spelling_index.build(vocabulary)
+    build_time = time.perf_counter() - start
+
+    random_generator = random.Random(seed)
+    queries = []
+    for _ in range(number_of_queries):
+        word = random_generator.choice(words)
+        queries.append((make_typo(word, random_generator), word))
+
+    corrected = 0
+    start = time.perf_counter()
+    for typo, word in queries:
+        correction = spelling_index.lookup(typo, 1)
+        if correction is not None and correction[0] == word:
+            corrected += 1
+    lookup_time = time.perf_counter() - start
+
+    print("Vocabulary: {} words, index built in {:.1f} ms".format(len(vocabulary), 1000 * build_time))
+    print("Corrections: {} words in {:.3f} s ({:.0f} words/s, {:.2f} us/word)".format(
+        number_of_queries, lookup_time, number_of_queries / lookup_time, 1e6 * lookup_time / number_of_queries))
+    print("Accuracy (corrected to the original word): {:.3f}".format(float(corrected) / number_of_queries))
+
+
+if __name__ == "__main__":
+    benchmark_spelling_correction(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,102 @@
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import nlp_controller
+
+
+def previous_normalize_text(query, lowercase=False):
+    """
+    previous query cleanup, special characters were removed by concatenating regex matches and the NLP request
+    replaced sentence separators in four more passes
+    :param query: a sentence/string
+    :param lowercase: True to lowercase the text and remove question marks (as annotate_expression did)
+    :return: normalized text
+    """
+    matches = re.finditer(r"(\w|\s)*", query, re.DOTALL)
+    newstr = ''
+    for match in matches:
+        newstr = newstr + match.group()
+    if lowercase:
+        newstr = newstr.lower().replace('?', '')
+    return newstr.replace(".", " ").replace("(", "").replace(")", "").replace(",", " ")
+
+
+def generate_messages(random_generator, number_of_messages):
+    """
+    generate WhatsApp-like messages: short questions, long messages and emoji-heavy messages
+    :param random_generator: random number generator
+    :param number_of_messages: number of messages of each kind
+    :return: dictionary of kind -> messages
+    """
+    words = ["covid19", "symptoms", "vaccine", "mask", "is", "the", "what", "how", "can", "I", "travel", "fever",
+             "quarantine", "Ñandú", "café", "día", "test", "positive", "(really)", "doctor's", "U.K.", "1st"]
+    punctuations = ["", "", "", ",", ".", "?", "!", "...", ":)", "-"]
+    emojis = ["😷", "🤒", "💉", "🦠", "😔", "🙏", "👍🏻", "🇬🇧", "❤️", "😂"]
+
+    def sentence(length, emoji_ratio):
+        tokens = []
+        for _ in range(length):
+            if random_generator.random() < emoji_ratio:
+                tokens.append("".join(random_generator.choice(emojis) for _ in range(random_generator.randint(1, 3))))
+            else:
+                tokens.append(random_generator.choice(words) + random_generator.choice(punctuations))
+        return " ".join(tokens)
+
+    return {
+        "short": [sentence(random_generator.randint(3, 10), 0.05) for _ in range(number_of_messages)],
+        "long": [sentence(random_generator.randint(300, 700), 0.05) for _ in range(number_of_messages)],
+        "emoji-heavy": [sentence(random_generator.randint(20, 80), 0.6) for _ in range(number_of_messages)],
+    }
+
+
+def benchmark(function, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            function(message)
+    return (time.perf_counter() - start) / (repeat * len(messages))
+
+
+def benchmark_text_normalizer(number_of_messages=200, repeat=5, seed=0):
+    """
+    compare the previous query cleanup and the single-pass normalizer (latency and output), and stopword lookups in
+    a list and in a frozen set
+    :param number_of_messages: number of messages of each kind
+    :param repeat: number of times messages are normalized
+    :param seed: seed of generated messages
+    """
+    random_generator = random.Random(seed)
+    for kind, messages in generate_messages(random_generator, number_of_messages).items():
+        for lowercase in (False, True):
+            previous_time = benchmark(lambda message: previous_normalize_text(message, lowercase), messages, repeat)
+            current_time = benchmark(lambda message: nlp_controller.normalize_text(message, lowercase), messages,
+                                     repeat)
+            # both sides tokenize the same way, the previous cleanup left separators that were already removed
+            agreement = sum(1 for message in messages
+                            if previous_normalize_text(message, lowercase).split() ==
+                            nlp_controller.normalize_text(message, lowercase).split())
+            print("{} messages ({}): previous={:.1f} us, single-pass={:.1f} us, speedup={:.1f}x, "
+                  "same tokens={:.3f}".format(kind, "annotate" if lowercase else "keywords", 1e6 * previous_time,
+                                              1e6 * current_time, previous_time / current_time,
+                                              float(agreement) / len(messages)))
+
+    stopwords_list = list(nlp_controller.english_stopwords)
+    lemmas = [random_generator.choice(stopwords_list + ["covid19", "vaccine", "symptom", "mask"] * 50)
+              for _ in range(10000)]
+    start = time.perf_counter()
+    list_matches = sum(1 for lemma in lemmas if lemma in stopwords_list)
+    list_time = time.perf_counter() - start
+    start = time.perf_counter()
+    set_matches = sum(1 for lemma in lemmas if lemma in nlp_controller.english_stopwords)
+    set_time = time.perf_counter() - start
+    print("stopword lookups ({} stopwords): list={:.2f} us, frozenset={:.3f} us, speedup={:.0f}x, same matches={}".format(
+        len(stopwords_list), 1e6 * list_time / len(lemmas), 1e6 * set_time / len(lemmas), list_time / set_time,
+        list_matches == set_matches))
+
+
+if __name__ == "__main__":
+    benchmark_text_normalizer()
@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import trigger_controller
+
+
+def generate_trigger(words, random_generator):
+    """
+    generate a trigger with the syntax of generated question/answer rules, e.g. "[*] what [is] [the] covid19 symptom"
+    :param words: vocabulary
+    :param random_generator: random number generator
+    :return: trigger
+    """
+    elements = ["[*] {}".format(random_generator.choice(["what", "how", "when", "where", "who", "why"]))]
+    for _ in range(random_generator.randint(2, 6)):
+        kind = random_generator.random()
+        if kind < 0.15:
+            elements.append("[{}]".format(random_generator.choice(["is", "are", "the", "a", "to", "does"])))
+        elif kind < 0.25:
+            elements.append("[*]")
+        elif kind < 0.3:
+            elements.append("({}|{})".format(random_generator.choice(words), random_generator.choice(words)))
+        else:
+            elements.append(random_generator.choice(words))
+    return " ".join(elements)
+
+
+def trigger_to_regex(trigger):
+    """
+    compile a trigger into a regular expression, roughly as RiveScript does for each of its sorted triggers
+    :param trigger: trigger
+    :return: compiled regular expression
+    """
+    parts = []
+    for token in trigger.split():  # each element consumes the space before it, messages start with a space
+        if token == "[*]":
+            parts.append(r"(?: \S+)*?")
+        elif token.startswith("["):
+            parts.append(r"(?: {})?".format(token[1:-1]))
+        elif token.startswith("("):
+            parts.append(r" (?:{})".format(token[1:-1]))
+        else:
+            parts.append(r" {}".format(token))
+    return re.compile(r"^{}$".format("".join(parts)))
+
+
+def benchmark_trigger_index(rule_counts=(100, 1000, 5000, 10000), number_of_queries=1000, seed=0):
+    """
+    measure matching latency of the trigger trie and of a linear scan of regular expressions against rule count
+    :param rule_counts: numbers of generated rules
+    :param number_of_queries: number of matched messages for each rule count
+    :param seed: seed of generated rules and messages
+    """
+    random_generator = random.Random(seed)
+    words = ["word{}".format(index) for index in range(2000)]
+    for rule_count in rule_counts:
+        triggers = [generate_trigger(words, random_generator) for _ in range(rule_count)]
+        # like RiveScript, more specific (more words) triggers are tested first
+        sorted_triggers = sorted(enumerate(triggers), key=lambda trigger: -len(trigger[1].split()))
+        regexes = [(index, trigger_to_regex(trigger)) for index, trigger in sorted_triggers]
+        trigger_index = trigger_controller.TriggerIndex()
+        start = time.perf_counter()
+        for index, trigger in enumerate(triggers):
+            trigger_index.add_trigger(trigger, str(index))
+        compile_time = time.perf_counter() - start
+
+        queries = []
+        for _ in range(number_of_queries):
+            if random_generator.random() < 0.7:  # message matching a rule
+                trigger = random_generator.choice(triggers)
+                message = []
+                for token in trigger.split():
+                    if token == "[*]":
+                        message.extend(random_generator.choice(words) for _ in range(random_generator.randint(0, 2)))
+                    elif token.startswith("["):
+                        if random_generator.random() < 0.5:
+                            message.append(token[1:-1])
+                    elif token.startswith("("):
+                        message.append(random_generator.choice(token[1:-1].split("|")))
+                    else:
+                        message.append(token)
+                queries.append(" ".join(message))
+            else:  # message not matching any rule
+                queries.append(" ".join(random_generator.choice(words) for _ in range(5)))
+
+        start = time.perf_counter()
+        trie_results = [trigger_index.match(query) for query in queries]
+        trie_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        regex_results = []
+        for query in queries:
+            message = " " + " ".join(query.split())
+            regex_results.append(next((str(index) for index, regex in regexes if regex.match(message)), None))
+        regex_time = time.perf_counter() - start
+
+        agreement = sum(1 for trie_result, regex_result in zip(trie_results, regex_results)
+                        if (trie_result is None) == (regex_result is None))
+        print("{} rules: compile={:.1f} ms, trie={:.3f} ms/message, regex scan={:.3f} ms/message, "
+              "speedup={:.1f}x, match agreement={:.3f}".format(
+                  rule_count, 1000 * compile_time, 1000 * trie_time / number_of_queries,
+                  1000 * regex_time / number_of_queries, regex_time / trie_time,
+                  float(agreement) / number_of_queries))
+
+
+if __name__ == "__main__":
+    benchmark_trigger_index()
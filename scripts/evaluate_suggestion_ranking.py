@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import mongo_controller
+from controllers import nlp_controller
+from controllers import ranking_controller
+from controllers import training_data_controller
+
+
+def score_by_matched_keywords_ratio(questions_answers, query_keywords):
+    """
+    previous ranking of suggestions, ratio of query keywords found in keywords of question/answer
+    :param questions_answers: dictionary of question/answer id -> keywords
+    :param query_keywords: keywords of query
+    :return: dictionary of question/answer id -> score
+    """
+    scores = {}
+    for qa_id, keywords in questions_answers.items():
+        matched_keywords = 0
+        for keyword in query_keywords:
+            if keyword.lower() in keywords:
+                matched_keywords += 1
+        if matched_keywords > 0:
+            scores[qa_id] = round((float(matched_keywords) / len(query_keywords)), 2)
+    return scores
+
+
+def select_top(scores):
+    """
+    select all questions/answers that share the top score (this is how the chatbot selects suggestions)
+    :param scores: dictionary of question/answer id -> score
+    :return: list of selected question/answer ids
+    """
+    if not scores:
+        return []
+    top_score = max(scores.values())
+    return [qa_id for qa_id, score in scores.items() if score == top_score]
+
+
+def evaluate_suggestion_ranking(training_data_file="Completed_Topic_COVID-19-Language-English.xlsx"):
+    """
+    compare the matched keywords ratio and BM25 rankings on the paraphrases of the training data, a paraphrase leads
+    to a "confused" turn if its top suggestions belong to more than one subtopic
+    :param training_data_file: training data file (.xlsx, .csv or .jsonl under Training-Data directory)
+    """
+    questions_answers = {str(qa["_id"]): qa for qa in mongo_controller.get_questions_answers()}
+    qa_ids_by_question = {qa["question"]: qa_id for qa_id, qa in questions_answers.items()}
+    subtopic_by_qa_id = {}
+    for subtopic in mongo_controller.get_subtopics():
+        for qa_id in subtopic["questions_answers"]:
+            subtopic_by_qa_id[str(qa_id)] = str(subtopic["_id"])
+    questions_answers_keywords = {qa_id: qa["keywords"] for qa_id, qa in questions_answers.items()}
+    bm25_index = ranking_controller.BM25Index()
+    bm25_index.build(questions_answers_keywords)
+
+    rankers = [
+        ("matched keywords ratio", lambda keywords: score_by_matched_keywords_ratio(questions_answers_keywords, keywords)),
+        ("BM25", lambda keywords: {qa_id: round(score, 4) for qa_id, score in bm25_index.score(keywords).items()}),
+    ]
+    results = {name: {"confused": 0, "hits": 0, "unique_hits": 0, "latency": 0.0} for name, _ in rankers}
+    number_of_paraphrases = 0
+
+    rows = training_data_controller.read_training_data(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "Training-Data", training_data_file))
+    for row in rows:
+        if not isinstance(row["Paraphrases"], str) or row["Questions"] not in qa_ids_by_question:
+            continue
+        expected_qa_id = qa_ids_by_question[row["Questions"]]
+        for paraphrased_question in row["Paraphrases"].split("\n"):
+            if len(paraphrased_question.strip()) == 0:
+                continue
+            query_keywords = list(set(nlp_controller.extract_keywords(paraphrased_question)))
+            if not query_keywords:
+                continue
+            number_of_paraphrases += 1
+            for name, ranker in rankers:
+                start = time.perf_counter()
+                selected_qa_ids = select_top(ranker(query_keywords))
+                results[name]["latency"] += time.perf_counter() - start
+                if len(set(subtopic_by_qa_id.get(qa_id) for qa_id in selected_qa_ids)) > 1:
+                    results[name]["confused"] += 1
+                if expected_qa_id in selected_qa_ids:
+                    results[name]["hits"] += 1
+                    if len(selected_qa_ids) == 1:
+                        results[name]["unique_hits"] += 1
+
+    print("Paraphrases evaluated: {}".format(number_of_paraphrases))
+    if number_of_paraphrases == 0:
+        return
+    for name, _ in rankers:
+        print("{}: confused turns={:.3f} hit rate={:.3f} unique hit rate={:.3f} mean scoring latency={:.3f} ms".format(
+            name,
+            float(results[name]["confused"]) / number_of_paraphrases,
+            float(results[name]["hits"]) / number_of_paraphrases,
+            float(results[name]["unique_hits"]) / number_of_paraphrases,
+            1000 * results[name]["latency"] / number_of_paraphrases))
+
+
+if __name__ == "__main__":
+    evaluate_suggestion_ranking()
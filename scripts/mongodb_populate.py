@@ -1,90 +1,53 @@
 import logging
-import configparser
 import os
-import re
+import sys
+import argparse
+import itertools
 
-import requests
-from pymongo import MongoClient
 from bson import ObjectId
-import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import client_controller
+from controllers import mongo_controller
+from controllers import nlp_controller
+from controllers import semantic_controller
+from controllers import settings_controller
+from controllers import training_data_controller
 
 logging.basicConfig(filename="mongodb_populate_output.log", filemode="a",
                     format="%(asctime)s,%(msecs)d %(name)s - %(levelname)s - %(message)s",
                     datefmt="%d-%b-%y %H:%M:%S",
                     level=logging.INFO)
 
-# load configs from config.ini file
-config = configparser.ConfigParser(inline_comment_prefixes="#")
-config.read(os.path.join(os.path.dirname(__file__), "..", "config.ini"))
-default_settings = config["DEFAULT"]
-stanford_nlp_settings = config["STANFORD_CORNLP"]
-db_settings = config["MONGODB"]
+settings = settings_controller.settings
 
 try:
-    logging.info("Loading config settings")
-    if "username" not in db_settings or db_settings["username"] == "":
-        db_username = None
-        logging.warning("Mongodb username is not defined.")
-    else:
-        db_username = db_settings["username"]
-    if "password" not in db_settings or db_settings["password"] == "":
-        db_password = None
-        logging.warning("Mongodb password is not defined.")
-    else:
-        db_password = db_settings["password"]
-    if "port" not in db_settings or db_settings["port"] == "":
-        raise Exception("Mongodb port is not defined.")
-    else:
-        db_port = db_settings["port"]
-    if "address" not in db_settings or db_settings["address"] == "":
-        raise Exception("Mongodb address is not defined.")
-    else:
-        db_address = db_settings["address"]
-    if "address" not in stanford_nlp_settings or stanford_nlp_settings["address"] == "":
-        raise Exception("Stanford CoreNLP server address is not defined.")
-    else:
-        nlp_server_address = stanford_nlp_settings["address"]
-    if "port" not in stanford_nlp_settings or stanford_nlp_settings["port"] == "":
-        nlp_server_port = None
-        logging.warning("Stanford CoreNLP server port is not defined.")
-    else:
-        nlp_server_port = stanford_nlp_settings["port"]
-    if "path" not in stanford_nlp_settings or stanford_nlp_settings["path"] == "":
-        raise Exception("Stanford CoreNLP server path is not defined.")
-    else:
-        nlp_server_path = stanford_nlp_settings["path"]
-    logging.info("Config settings loaded successfully")
+    settings.require("MONGODB", "STANFORD_CORNLP")
 
 except Exception as e:
     logging.error(str(e))
     exit()
 
-if db_username and db_password:
-    mongo_client = MongoClient("{}:{}".format(db_address, db_port), username=db_username, password=db_password)
-elif db_username is None and db_password is None:
-    mongo_client = MongoClient("{}:{}".format(db_address, db_port))
-else:
-    logging.error(str(Exception(
-        "There is an problem MONGODB section of config.ini file, either username or password is not defined")))
-    exit()
-
-with open(os.path.join(os.getcwd(), "../utils/english_stopwords.txt"), "r") as myfile:
-    english_stopwords = myfile.read().split(",")
+# questions are normalized and annotated exactly like users' messages, so generated rules match them
+extract_keywords = nlp_controller.extract_keywords
+annotate_expression = nlp_controller.annotate_expression
 
 
-def add_topic(name, subtopics, keywords):
+def add_topic(name, subtopics, keywords, language):
     """
     add new topic into db
     :param name: name of topic
     :param subtopics: subtopics under the topic
     :param keywords: keywords under the topic
+    :param language: language code of the topic (e.g. "en")
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Topics
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     topic_details = {
         "name": name,
         "subtopics": subtopics,
         "keywords": keywords,
+        "language": language,
     }
     collection = db.COVIDChatbot_Topics.insert_one(topic_details)
     if str(collection.inserted_id) != "":  # if the request is successfully added to the database
@@ -100,7 +63,7 @@ def add_subtopic(name, questions_answers, keywords):
     :param keywords
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Subtopics
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
     subtopic_details = {
         "name": name,
         "questions_answers": questions_answers,
@@ -121,7 +84,7 @@ def add_question_answer(question, answer, more_details, keywords):
     :param keywords: keywords of the question
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_QAs
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
     subtopic_details = {
         "question": question,
         "answer": answer,
@@ -140,7 +103,7 @@ def get_topic(id):
     :param id: id of topic
     :return: topic object if the id, None if topic does not exist
     """
-    db = mongo_client.COVIDChatbot_Topics
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     query_result = db.COVIDChatbot_Topics.find_one({"_id": ObjectId(str(id))})
     if query_result is not None:
         return query_result
@@ -153,7 +116,7 @@ def get_subtopic(id):
     :param id: id of subtopic
     :return: subtopic object if the id, None if subtopic does not exist
     """
-    db = mongo_client.COVIDChatbot_Subtopics
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
     query_result = db.COVIDChatbot_Subtopics.find_one({"_id": ObjectId(str(id))})
     if query_result is not None:
         return query_result
@@ -166,7 +129,7 @@ def get_question_answer(id):
     :param id: id of question/answer
     :return: question/answer object if the id, None if topic does not exist
     """
-    db = mongo_client.COVIDChatbot_QAs
+    db = client_controller.get_mongo_client().COVIDChatbot_QAs
     query_result = db.COVIDChatbot_QAs.find_one({"_id": ObjectId(str(id))})
     if query_result is not None:
         return query_result
@@ -181,7 +144,7 @@ def update_topic(id, subtopics=None, keywords=None):
     :param keywords
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Topics
+    db = client_controller.get_mongo_client().COVIDChatbot_Topics
     if subtopics is not None and keywords is not None:
         query_result = db.COVIDChatbot_Topics.update_one({"_id": ObjectId(str(id))},
                                                          {
@@ -221,7 +184,7 @@ def update_subtopic(id, questions_answers=None, keywords=None):
     :param keywords
     :return: True if the operation is successful, False if an error happens
     """
-    db = mongo_client.COVIDChatbot_Subtopics
+    db = client_controller.get_mongo_client().COVIDChatbot_Subtopics
     if questions_answers is not None and keywords is not None:
         query_result = db.COVIDChatbot_Subtopics.update_one({"_id": ObjectId(str(id))},
                                                             {
@@ -253,69 +216,14 @@ def update_subtopic(id, questions_answers=None, keywords=None):
     return False
 
 
-def __post_request_nlpserver(query):
-    """
-    Send HTTP POST request to NLP server with json body
-    :return: json formatted result
-    """
-    # first, concatenate all sentences
-    if isinstance(query, str):
-        query = query.replace(".", " ").replace("(", "").replace(")", "").replace(",", " ")
-    else:
-        query = query.decode("utf-8").replace(".", " ").replace("(", "").replace(")", "").replace(",", " ")
-    if nlp_server_address and nlp_server_port:
-        # second, call the nlp server
-        nlp_server_response = requests.post("{}:{}{}".format(nlp_server_address, nlp_server_port, nlp_server_path),
-                                            data=query)
-    else:
-        # second, call the nlp server
-        nlp_server_response = requests.post("{}{}".format(nlp_server_address, nlp_server_path), data=query)
-    if nlp_server_response.status_code != 200:
-        raise Exception(nlp_server_response.content)
-    return nlp_server_response.json()
-
-
-def extract_special_characters(query):
-    regex = r"(\w|\s)*"
-    matches = re.finditer(regex, query, re.DOTALL)
-    newstr = ''
-    for matchNum, match in enumerate(matches):
-        matchNum = matchNum + 1
-        newstr = newstr + match.group()
-    return newstr
-
-
-def extract_keywords(query):
-    """
-    Extract keywords from given input query
-    :param query: a sentence/string
-    :return: list of keywords
-    """
-    nlp_server_response = __post_request_nlpserver(extract_special_characters(query))
-    keywords = []
-
-    for sentence in nlp_server_response['sentences']:
-        for token in sentence['tokens']:
-            if token['pos'] in {'NN', 'JJ', 'NNP', 'NNS', 'NNPS', 'VB', 'VBN', 'VBZ', 'VBP', 'VBG'}:
-                if not token["lemma"].lower() in english_stopwords:
-                    if not token['lemma'] in {'be', 'have'}:
-                        keywords.append(token['lemma'])
-    return keywords
-
-
-def annotate_expression(expression):
-    nlp_server_response = __post_request_nlpserver(extract_special_characters(expression).lower().replace('?', ''))
-    return nlp_server_response['sentences'][0]['tokens']
-
-
-def add_rule(topic, annotated_question, answer):
+def add_rule(topic, annotated_question, answer, language):
     pattern = generate_pattern(annotated_question)
     # found = check_pattern(topic, pattern)
     found = False
     if found:
         return False
     else:
-        output = add_pattern(topic, pattern, answer)
+        output = add_pattern(topic, pattern, answer, language)
         return output
 
 
@@ -339,9 +247,9 @@ def generate_pattern(annotated_expression):
     return generated_pattern
 
 
-def check_pattern(topic, pattern):
+def check_pattern(topic, pattern, language):
     try:
-        datafile = open("../brain/rules/%s.rive" % topic)
+        datafile = open("../brain/rules/%s/%s.rive" % (language, topic))
         found = False
         for line in datafile:
             if '+ %s' % pattern in line:
@@ -353,57 +261,140 @@ def check_pattern(topic, pattern):
         return False
 
 
-def add_pattern(topic, pattern, answer):
-    with open("../brain/rules/%s.rive" % topic.lower().replace(" ", "_"), "a") as myfile:
+def add_pattern(topic, pattern, answer, language):
+    with open("../brain/rules/%s/%s.rive" % (language, topic.lower().replace(" ", "_")), "a") as myfile:
         myfile.write("+ %s\n" % pattern)
         myfile.write("- %s\n\n" % answer)
     return True
 
 
-def import_rules():
+def split_lines(text, min_length=0):
+    """
+    split a multi-line cell (e.g. links, paraphrases)
+    :param text: text of cell, None if cell is empty
+    :param min_length: minimum length of a kept line
+    :return: list of lines
+    """
+    if not isinstance(text, str):
+        return []
+    return [line for line in text.split("\n") if len(line.strip()) > min_length]
+
+
+def group_rows_by_subtopic(rows):
+    """
+    group consecutive rows of the same subtopic
+    :param rows: rows of training data
+    :return: generator of (subtopic, generator of rows)
+    """
+    return itertools.groupby(rows, key=lambda row: row["Subtopic"])
+
+
+def import_question_answer(row, subtopic, language):
+    """
+    add the question/answer of a row and the rules of its question and paraphrases
+    :param row: row of training data
+    :param subtopic: name of subtopic
+    :param language: language code of the rules
+    :return: (question/answer id, keywords, semantic index entries)
+    """
+    more_details = split_lines(row["Links"], 5)
+    paraphrases = split_lines(row["Paraphrases"])
+
+    question_keywords = set(keyword.lower() for keyword in extract_keywords(row["Questions"]))
+    for paraphrased_question in paraphrases:
+        question_keywords.update(keyword.lower() for keyword in extract_keywords(paraphrased_question))
+
+    qa_id = add_question_answer(question=row["Questions"], answer=row["Answers"], more_details=more_details,
+                                keywords=list(question_keywords))
+    add_rule(subtopic.lower().replace(" ", "_"), annotate_expression(row["Questions"]), qa_id, language)
+    for paraphrased_question in paraphrases:
+        add_rule(subtopic.lower().replace(" ", "_"), annotate_expression(paraphrased_question), qa_id, language)
+
+    semantic_index_entries = [{"text": row["Questions"], "question_text": row["Questions"], "question_id": qa_id}]
+    for paraphrased_question in paraphrases:
+        semantic_index_entries.append({"text": paraphrased_question, "question_text": row["Questions"],
+                                       "question_id": qa_id})
+    return qa_id, question_keywords, semantic_index_entries
+
+
+def import_rules(training_data_file="Completed_Topic_COVID-19-Language-English.xlsx", language="en"):
+    """
+    import topic, subtopics, questions/answers and rules of a training data file, rows are streamed so a large
+    workbook is never loaded at once (ids and keywords of subtopics, and the questions of the semantic index are kept
+    until the end of the import)
+    :param training_data_file: training data file (.xlsx, .csv or .jsonl under Training-Data directory)
+    :param language: language code of the training data, rules are written under brain/rules/<language>
+    """
     topic = "COVID-19"
-    # subtopics = ["General questions", "Questions about mask"]
-    training_data_file = "Completed_Topic_COVID-19-Language-English.xlsx"
-    dfs = pd.read_excel("./Training-Data/{}".format(training_data_file), sheet_name=None)
-    subtopics = dfs.keys()
+    training_data_path = "./Training-Data/{}".format(training_data_file)
+    for row in training_data_controller.read_training_data(training_data_path):
+        pass  # invalid rows (e.g. without subtopic) stop the import before anything is written
+    os.makedirs("../brain/rules/%s" % language, exist_ok=True)
+    rows = training_data_controller.read_training_data(training_data_path)
+    subtopics = {}  # name -> (id, ids of questions/answers, keywords), rows of a repeated subtopic are merged into it
     subtopics_ids = []
-    subtopics_keywords = []
-    for subtopic in subtopics:
+    subtopics_keywords = set()
+    semantic_index_entries = []  # questions and paraphrases for the semantic index
+    number_of_rows = 0
+    for subtopic, subtopic_rows in group_rows_by_subtopic(rows):
         subtopic_qas_ids = []
-        subtopic_keywords = []
-        for index, row in dfs[subtopic].iterrows():
-            if isinstance(row["Links"], str):
-                if '\n' in row["Links"]:
-                    more_details = [link for link in row['Links'].split("\n") if len(link) > 5]
-                else:
-                    if len(row["Links"]) > 5:
-                        more_details = [row["Links"]]
-            else:
-                more_details = []
-
-            question_keywords = list(set(map(lambda keyword: keyword.lower(), extract_keywords(row["Questions"]))))
-            if isinstance(row["Paraphrases"], str):
-                for paraphrased_question in row["Paraphrases"].split("\n"):
-                    question_keywords = question_keywords + list(
-                        set(map(lambda keyword: keyword.lower(), extract_keywords(paraphrased_question))))
-
-            qa_id = add_question_answer(question=row["Questions"], answer=row["Answers"], more_details=more_details,
-                                        keywords=list(set(question_keywords)))
-            add_rule(subtopic.lower().replace(" ", "_"), annotate_expression(row["Questions"]), qa_id)
-            if isinstance(row["Paraphrases"], str):
-                for paraphrased_question in row["Paraphrases"].split("\n"):
-                    # question_keywords = question_keywords + list(set(map(lambda keyword: keyword.lower(), extract_keywords(paraphrased_question))))
-                    # qa_id = add_question_answer(question=paraphrased_question, answer=row["Answers"], more_details=more_details,
-                    #                             keywords=question_keywords)
-                    add_rule(subtopic.lower().replace(" ", "_"), annotate_expression(paraphrased_question), qa_id)
-                    # subtopic_qas_ids.append(qa_id)
+        subtopic_keywords = set()
+        subtopic_semantic_index_entries = []
+        for row in subtopic_rows:
+            if not isinstance(row["Questions"], str):
+                continue
+            qa_id, question_keywords, question_semantic_index_entries = import_question_answer(row, subtopic,
+                                                                                               language)
             subtopic_qas_ids.append(qa_id)
-            subtopic_keywords = list(set(subtopic_keywords + question_keywords))
-        subtopic_id = add_subtopic(subtopic, subtopic_qas_ids, subtopic_keywords)
-        subtopics_ids.append(subtopic_id)
-        subtopics_keywords = list(set(subtopics_keywords + subtopic_keywords))
-    add_topic(topic, subtopics_ids, subtopics_keywords)
+            subtopic_keywords.update(question_keywords)
+            subtopic_semantic_index_entries.extend(question_semantic_index_entries)
+            number_of_rows += 1
+            sys.stdout.write("\rImported {} questions/answers (subtopic: {})".format(number_of_rows, subtopic))
+            sys.stdout.flush()
+        if subtopic in subtopics:  # rows of the subtopic are not consecutive
+            subtopic_id, qas_ids, keywords = subtopics[subtopic]
+            qas_ids.extend(subtopic_qas_ids)
+            keywords.update(subtopic_keywords)
+            update_subtopic(subtopic_id, qas_ids, list(keywords))
+            logging.warning("Rows of subtopic {} are not consecutive, they are merged".format(subtopic))
+        else:
+            subtopic_id = add_subtopic(subtopic, subtopic_qas_ids, list(subtopic_keywords))
+            subtopics[subtopic] = (subtopic_id, subtopic_qas_ids, subtopic_keywords)
+            subtopics_ids.append(subtopic_id)
+        subtopics_keywords.update(subtopic_keywords)
+        for entry in subtopic_semantic_index_entries:
+            entry.update({"subtopic_name": subtopic, "subtopic_id": subtopic_id})
+        semantic_index_entries.extend(subtopic_semantic_index_entries)
+        logging.info("Subtopic {} is imported ({} questions/answers)".format(subtopic, len(subtopic_qas_ids)))
+    sys.stdout.write("\n")
+    topic_id = add_topic(topic, subtopics_ids, list(subtopics_keywords), language)
+    build_semantic_index(topic, topic_id, semantic_index_entries)
+    # the chatbot refreshes its knowledge base (and semantic index) once the whole file is imported
+    version = mongo_controller.bump_knowledge_base_version()
+    logging.info("Knowledge base version is {}".format(version))
+
+
+def build_semantic_index(topic, topic_id, entries):
+    """
+    build the semantic index (sentence vectors) of questions and paraphrases, used when keywords do not match
+    :param topic: name of topic
+    :param topic_id: id of topic
+    :param entries: questions and paraphrases
+    """
+    fasttext_model = semantic_controller.load_model()
+    if fasttext_model is None:
+        logging.warning("fastText model is not available, semantic index is not built.")
+        return
+    for entry in entries:
+        entry.update({"topic_name": topic, "topic_id": topic_id})
+    number_of_questions = semantic_controller.build_semantic_index(fasttext_model, entries)
+    logging.info("Semantic index of {} questions is built".format(number_of_questions))
 
 
 if __name__ == "__main__":
-    import_rules()
+    parser = argparse.ArgumentParser(description="Import training data into mongodb and generate rules")
+    parser.add_argument("training_data_file", nargs="?", default="Completed_Topic_COVID-19-Language-English.xlsx",
+                        help="training data file (.xlsx, .csv or .jsonl) under Training-Data directory")
+    parser.add_argument("--language", default="en", help="language code of the training data")
+    arguments = parser.parse_args()
+    import_rules(arguments.training_data_file, arguments.language)
@@ -0,0 +1,92 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+REPOSITORY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+TIME_TO_FIRST_ANSWER_CODE = """
+import json
+import time
+start = time.perf_counter()
+import rest_api
+imported = time.perf_counter()
+from controllers import brain_controller
+brain_controller.preload_brain(brain_controller.default_language)
+loaded = time.perf_counter()
+from controllers import rule_controller
+answer = rule_controller.answer_question({user_id!r}, {message!r}, {language!r})
+answered = time.perf_counter()
+print(json.dumps({{"import": imported - start, "brain": loaded - imported, "answer": answered - loaded,
+                  "total": answered - start, "reply": answer}}))
+"""
+
+
+def profile_imports(module="rest_api", top=20):
+    """
+    import a module in a new interpreter with -X importtime and report the slowest imports
+    :param module: imported module
+    :param top: number of reported imports
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+                             cwd=REPOSITORY_DIRECTORY, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    imports = []
+    errors = []
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match is not None:
+            imports.append({"self": int(match.group(1)), "cumulative": int(match.group(2)),
+                            "depth": len(match.group(3)) // 2, "package": match.group(4)})
+        elif not line.startswith("import time:"):
+            errors.append(line)
+    if process.returncode != 0 or not imports:
+        print("Importing {} failed:\n{}".format(module, "\n".join(errors[-20:])))
+        return
+
+    total = sum(entry["cumulative"] for entry in imports if entry["depth"] == 0)
+    print("Importing {} took {:.1f} ms ({} modules)".format(module, total / 1000.0, len(imports)))
+    print("\nSlowest imports (cumulative, including the modules they import):")
+    for entry in sorted((entry for entry in imports if entry["depth"] == 0),
+                        key=lambda entry: -entry["cumulative"])[:top]:
+        print("  {:>10.1f} ms  {}".format(entry["cumulative"] / 1000.0, entry["package"]))
+    print("\nSlowest modules (self, excluding the modules they import):")
+    for entry in sorted(imports, key=lambda entry: -entry["self"])[:top]:
+        print("  {:>10.1f} ms  {}".format(entry["self"] / 1000.0, entry["package"]))
+
+
+def measure_time_to_first_answer(message="hi", language="en", user_id="profile_startup"):
+    """
+    measure, in a new interpreter, the time to import the REST API, to load the brain and to answer the first
+    message (mongodb and the Stanford CoreNLP server must be running)
+    :param message: first message
+    :param language: language code of the message
+    :param user_id: id of the user sending the message
+    """
+    code = TIME_TO_FIRST_ANSWER_CODE.format(user_id=user_id, message=message, language=language)
+    process = subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY_DIRECTORY, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        print("Answering the first message failed:\n{}".format(process.stderr[-2000:]))
+        return
+    timings = json.loads(lines[-1])
+    print("\nTime to first answer: {:.1f} ms (import={:.1f} ms, brain={:.1f} ms, answer={:.1f} ms)".format(
+        1000 * timings["total"], 1000 * timings["import"], 1000 * timings["brain"], 1000 * timings["answer"]))
+    print("Reply: {}".format(timings["reply"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile import time and time to first answer of the chatbot")
+    parser.add_argument("--module", default="rest_api", help="profiled module")
+    parser.add_argument("--top", type=int, default=20, help="number of reported imports")
+    parser.add_argument("--message", default="hi", help="first message")
+    parser.add_argument("--language", default="en", help="language code of the first message")
+    parser.add_argument("--skip-first-answer", action="store_true", help="only profile imports")
+    arguments = parser.parse_args()
+    profile_imports(arguments.module, arguments.top)
+    if not arguments.skip_first_answer:
+        measure_time_to_first_answer(arguments.message, arguments.language)
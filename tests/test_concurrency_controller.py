@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import random
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from controllers import concurrency_controller
+
+NUMBER_OF_USERS = 20
+MESSAGES_PER_USER = 25
+ARRIVAL_GAP = 0.002  # seconds between messages of a user, so each message gets its ticket before the next arrives
+
+
+class SharedBot:
+    """
+    stand-in for the RiveScript brain shared by all users: user variables are kept per user, but a reply reads the
+    state of the "current user", like RiveScript does, so unguarded concurrent replies mix users up
+    """
+
+    def __init__(self):
+        self.uservars = {}
+        self.current_user = None
+
+    def get_uservar(self, user_id, name):
+        return self.uservars.get(user_id, {}).get(name)
+
+    def set_uservar(self, user_id, name, value):
+        self.uservars.setdefault(user_id, {})[name] = value
+
+    def reply(self, user_id, message):
+        self.current_user = user_id
+        time.sleep(random.random() / 10000)  # give other threads a chance to interleave
+        return "{}|{}|{}".format(self.current_user, self.get_uservar(self.current_user, "topic"), message)
+
+
+class UserSerialExecutorStressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = concurrency_controller.UserSerialExecutor()
+        self.brain_lock = threading.RLock()  # guards the shared bot, like Brain.lock
+        self.bot = SharedBot()
+        self.state_lock = threading.Lock()
+        self.answered = {user_id: [] for user_id in self.__get_user_ids()}
+        self.running = {user_id: 0 for user_id in self.__get_user_ids()}
+        self.running_users = 0
+        self.max_running_users = 0
+        self.errors = []
+
+    @staticmethod
+    def __get_user_ids():
+        return ["+6140000{:04d}".format(number) for number in range(NUMBER_OF_USERS)]
+
+    def __answer(self, user_id, index):
+        """
+        answer a message of user like rule_controller does: work outside the brain lock, then a reply in a temporary
+        topic which is restored afterwards
+        """
+        with self.state_lock:
+            self.running[user_id] += 1
+            if self.running[user_id] > 1:
+                self.errors.append("messages of user {} overlap".format(user_id))
+            if self.running[user_id] == 1:
+                self.running_users += 1
+                self.max_running_users = max(self.max_running_users, self.running_users)
+        try:
+            time.sleep(random.random() / 1000)  # NLP, mongodb calls... outside the brain lock
+            topic = "topic_{}_{}".format(user_id, index)
+            with self.brain_lock:
+                current_topic = self.bot.get_uservar(user_id, "topic")
+                self.bot.set_uservar(user_id, "topic", topic)
+                reply = self.bot.reply(user_id, str(index))
+                self.bot.set_uservar(user_id, "topic", current_topic)
+            if reply != "{}|{}|{}".format(user_id, topic, index):
+                with self.state_lock:
+                    self.errors.append("reply {} of user {} leaked another user's state".format(reply, user_id))
+            with self.state_lock:
+                self.answered[user_id].append(index)
+        finally:
+            with self.state_lock:
+                self.running[user_id] -= 1
+                if self.running[user_id] == 0:
+                    self.running_users -= 1
+
+    def __send_messages(self, user_id, threads):
+        for index in range(MESSAGES_PER_USER):
+            thread = threading.Thread(target=self.executor.run, args=(user_id, self.__answer, user_id, index))
+            thread.start()
+            threads.append(thread)
+            time.sleep(ARRIVAL_GAP)
+
+    def test_messages_of_users_are_ordered_and_isolated(self):
+        threads = []
+        senders = [threading.Thread(target=self.__send_messages, args=(user_id, threads))
+                   for user_id in self.__get_user_ids()]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        for thread in list(threads):
+            thread.join(timeout=30)
+            self.assertFalse(thread.is_alive(), "a message is never answered")
+
+        self.assertEqual([], self.errors)
+        for user_id, indexes in self.answered.items():
+            self.assertEqual(list(range(MESSAGES_PER_USER)), indexes, "messages of {} are reordered".format(user_id))
+            self.assertIsNone(self.bot.get_uservar(user_id, "topic"), "topic of {} is not restored".format(user_id))
+        self.assertGreater(self.max_running_users, 1, "messages of different users are not answered in parallel")
+        self.assertEqual(0, self.executor.get_active_users(), "mailboxes of idle users are kept")
+
+    def test_failing_message_does_not_block_user(self):
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            self.executor.run("user", fail)
+        self.assertEqual("answered", self.executor.run("user", lambda: "answered"))
+        self.assertEqual(0, self.executor.get_active_users())
+
+
+class MessageCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handled = []
+        self.handled_event = threading.Event()
+
+    def __handle(self, user_id, message, context):
+        self.handled.append((user_id, message, context))
+        self.handled_event.set()
+
+    def test_messages_of_window_are_merged(self):
+        coalescer = concurrency_controller.MessageCoalescer(0.05, self.__handle)
+        self.assertIsNone(coalescer.submit("user", "is it", "first"))
+        self.assertIsNone(coalescer.submit("user", "contagious?", "second"))
+        self.assertTrue(self.handled_event.wait(5))
+        self.assertEqual([("user", "is it contagious?", "first")], self.handled)
+        self.assertEqual(0, coalescer.get_waiting_users())
+
+    def test_option_flushes_window_and_is_answered_alone(self):
+        coalescer = concurrency_controller.MessageCoalescer(0.05, self.__handle)
+        self.assertIsNone(coalescer.submit("user", "hi", "first"))
+        self.assertEqual(" 1", coalescer.submit("user", " 1", "second"))
+        self.assertEqual([("user", "hi", "first")], self.handled, "the window is not handled before the option")
+        self.assertEqual(0, coalescer.get_waiting_users())
+        time.sleep(0.1)  # the timer of the flushed window does nothing
+        self.assertEqual(1, len(self.handled))
+        self.assertEqual("2", coalescer.submit("user", "2"))
+        self.assertEqual(1, len(self.handled))
+
+
+if __name__ == "__main__":
+    unittest.main()
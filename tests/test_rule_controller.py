@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import types
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+try:
+    import rivescript
+except ImportError:
+    rivescript = None
+
+NUMBER_OF_USERS = 20
+MESSAGES_PER_USER = 10
+ARRIVAL_GAP = 0.002  # seconds between messages of a user, so each message gets its ticket before the next arrives
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliett")
+
+RULES = """
++ hello
+- hi <id>
+
++ count *
+- <id> counted <star>
+
++ talk
+- ok <id>{topic=talking}
+
+> topic talking
+
+  + *
+  - <id> said <star>{topic=random}
+
+< topic
+"""
+
+
+class MongoStub(types.ModuleType):
+    """
+    stand-in for mongo_controller: an empty knowledge base, no persisted sessions, and a slow call on each message, so
+    the mongodb calls made outside the brain lock take time like real ones
+    """
+
+    def __init__(self):
+        super().__init__("controllers.mongo_controller")
+        self.state_lock = threading.Lock()
+        self.running_users = set()
+        self.max_running_users = 0
+
+    def check_user_in_blacklist(self, user_id):
+        with self.state_lock:
+            self.running_users.add(user_id)
+            self.max_running_users = max(self.max_running_users, len(self.running_users))
+        time.sleep(random.random() / 200)
+        with self.state_lock:
+            self.running_users.discard(user_id)
+        return None
+
+    @staticmethod
+    def get_knowledge_base_version():
+        return 1
+
+    @staticmethod
+    def is_own_change(previous_version, version):
+        return False
+
+    @staticmethod
+    def get_user_session(user_id, language):
+        return None
+
+    @staticmethod
+    def save_user_session(user_id, topic, language):
+        pass
+
+    @staticmethod
+    def delete_user_session(user_id, language):
+        pass
+
+    @staticmethod
+    def get_topics():
+        return []
+
+    @staticmethod
+    def get_subtopics():
+        return []
+
+    @staticmethod
+    def get_questions_answers():
+        return []
+
+
+class NLPUnavailableError(Exception):
+    pass
+
+
+def install_stubs(mongo_stub):
+    """
+    replace the controllers of mongodb, the NLP server and twilio with stand-ins, before rule_controller imports them
+    """
+    import controllers
+    nlp_stub = types.ModuleType("controllers.nlp_controller")
+    nlp_stub.NLPUnavailableError = NLPUnavailableError
+    nlp_stub.is_available = lambda: False  # messages which match no rule are answered without suggestions
+    nlp_stub.normalize_text = lambda text, lowercase=False: text.lower() if lowercase else text
+    handover_stub = types.ModuleType("controllers.handover_controller")
+    handover_stub.notify_user = lambda message, user_id: None
+    handover_stub.notify_handover_volunteer = lambda message, volunteer_number: None
+    for stub in (mongo_stub, nlp_stub, handover_stub):
+        sys.modules[stub.__name__] = stub
+        setattr(controllers, stub.__name__.split(".")[-1], stub)
+
+
+@unittest.skipIf(rivescript is None, "rivescript is not installed")
+class AnswerQuestionStressTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mongo = MongoStub()
+        install_stubs(cls.mongo)
+        from controllers import brain_controller
+        from controllers import rule_controller
+        from controllers import analytics_controller
+        cls.brain_controller = brain_controller
+        cls.rule_controller = rule_controller
+        cls.analytics_controller = analytics_controller
+
+    def setUp(self):
+        from controllers import concurrency_controller
+        self.rules_directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.rules_directory, "en"))
+        with open(os.path.join(self.rules_directory, "en", "main.rive"), "w") as rules_file:
+            rules_file.write(RULES)
+        self.patches = [mock.patch.object(self.brain_controller, "RULES_DIRECTORY", self.rules_directory),
+                        mock.patch.object(self.analytics_controller, "directory", None)]
+        for patch in self.patches:
+            patch.start()
+        self.brain_controller.brains.clear()
+        self.executor = concurrency_controller.UserSerialExecutor()
+        self.replies = {user_id: [] for user_id in self.__get_user_ids()}
+
+    def tearDown(self):
+        self.brain_controller.brains.clear()
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.rules_directory)
+
+    @staticmethod
+    def __get_user_ids():
+        # letters only, a reply with digits is taken as the id of a question/answer
+        return ["user" + chr(ord("a") + number // 26) + chr(ord("a") + number % 26) for number in range(NUMBER_OF_USERS)]
+
+    @staticmethod
+    def __get_messages():
+        messages = []
+        for index in range(MESSAGES_PER_USER):
+            messages.append(random.choice(["hello", "count " + WORDS[index], "talk", "bye " + WORDS[index]]))
+        return messages
+
+    @staticmethod
+    def __get_expected_replies(user_id, messages):
+        replies = []
+        in_talk = False
+        for message in messages:
+            if in_talk:
+                replies.append("{} said {}".format(user_id, message))
+                in_talk = False
+            elif message == "hello":
+                replies.append("hi {}".format(user_id))
+            elif message.startswith("count "):
+                replies.append("{} counted {}".format(user_id, message.split()[1]))
+            elif message == "talk":
+                replies.append("ok {}".format(user_id))
+                in_talk = True
+            else:
+                replies.append("I don't know the answer of your question 🧐")
+        return replies
+
+    def __answer(self, user_id, message):
+        reply = self.rule_controller.answer_question(user_id, message, "en")
+        self.replies[user_id].append(reply)
+
+    def __send_messages(self, user_id, messages, threads):
+        for message in messages:
+            thread = threading.Thread(target=self.executor.run, args=(user_id, self.__answer, user_id, message))
+            thread.start()
+            threads.append(thread)
+            time.sleep(ARRIVAL_GAP)
+
+    def test_messages_of_users_are_answered_in_parallel_and_isolated(self):
+        self.brain_controller.preload_brain("en")
+        bot = self.brain_controller.brains["en"].bot
+
+        messages = {user_id: self.__get_messages() for user_id in self.__get_user_ids()}
+        threads = []
+        senders = [threading.Thread(target=self.__send_messages, args=(user_id, messages[user_id], threads))
+                   for user_id in self.__get_user_ids()]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        for thread in list(threads):
+            thread.join(timeout=30)
+            self.assertFalse(thread.is_alive(), "a message is never answered")
+
+        for user_id in self.__get_user_ids():
+            self.assertEqual(self.__get_expected_replies(user_id, messages[user_id]), self.replies[user_id],
+                             "replies of {} are reordered or leaked another user's state".format(user_id))
+        self.assertGreater(self.mongo.max_running_users, 1, "messages of different users are not answered in parallel")
+        self.assertIs(bot, self.brain_controller.brains["en"].bot, "the brain is rebuilt while messages are answered")
+        self.assertEqual(0, self.brain_controller.brains["en"].active_requests)
+
+
+if __name__ == "__main__":
+    unittest.main()